@@ -5,7 +5,7 @@ import asyncio
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from lib.process_scenes import fetch_and_process_videos
+from lib.process_scenes import find_and_render_videos
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -14,7 +14,16 @@ if __name__ == "__main__":
                         help="Force regeneration of all scenes.")
     parser.add_argument("--img2video", action="store_true",
                         help="Generate img2video for each scene.")
+    parser.add_argument('--max-count', type=int, default=None,
+                        help='Maximum number of videos to render')
+    parser.add_argument('--batch-size', type=int, default=2,
+                        help='Number of videos to render in parallel')
 
     args = parser.parse_args()
 
-    asyncio.run(fetch_and_process_videos(generate_img2video=args.img2video, force_regenerate=args.regenerate))
+    asyncio.run(find_and_render_videos(
+        max_count=args.max_count,
+        batch_size=args.batch_size,
+        generate_img2video=args.img2video,
+        force_regenerate=args.regenerate
+    ))
@@ -0,0 +1,22 @@
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.reaper import REAPER_INTERVAL_SECONDS, run_reaper
+from lib.supervisor import LEASED_QUEUES
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Requeue jobs whose worker stopped renewing its lease.')
+    parser.add_argument('--interval', type=int, default=REAPER_INTERVAL_SECONDS,
+                        help='Seconds between reaper passes')
+    parser.add_argument('--once', action='store_true',
+                        help='Run a single pass and exit')
+
+    args = parser.parse_args()
+
+    asyncio.run(run_reaper(LEASED_QUEUES, interval=args.interval, once=args.once))
@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.supervisor import STAGES, run_supervisor
+
+
+def parse_concurrency(value):
+    overrides = {}
+    for item in value.split(","):
+        stage, _, limit = item.partition("=")
+        overrides[stage.strip()] = int(limit)
+    return overrides
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Run every pipeline stage in a single process.')
+    parser.add_argument('--stages', type=lambda value: value.split(","), default=None,
+                        help=f'Comma separated stages to run (default: all of {",".join(STAGES.keys())})')
+    parser.add_argument('--concurrency', type=parse_concurrency, default=None,
+                        help='Per-stage concurrency overrides, e.g. describe=4,narrate=8')
+
+    args = parser.parse_args()
+
+    asyncio.run(run_supervisor(
+        stages=args.stages, concurrency_overrides=args.concurrency))
@@ -0,0 +1,50 @@
+from typing import Dict, Iterable, Optional
+from lib.async_database import adb
+from lib.logger import setup_logger
+from lib.repository import ASSET_RENDER_PROJECTION
+from models.asset import Asset
+
+logger = setup_logger(__name__)
+
+
+class AssetResolver:
+    """
+    Resolves a video's asset filenames to Assets of its own request and aspect
+    ratio. Filenames are fetched with one `$in` query and kept in memory, so
+    rendering a video looks each asset up once however many scenes use it.
+    """
+
+    def __init__(self, request_id: str, aspect_ratio: str):
+        self.request_id = request_id
+        self.aspect_ratio = aspect_ratio
+        # None marks a filename that was looked up and not found
+        self._assets: Dict[str, Optional[Asset]] = {}
+
+    async def load(self, asset_filenames: Iterable[str]):
+        missing = sorted(set(asset_filenames) - self._assets.keys())
+        if not missing:
+            return
+        asset_results = await adb.assets.find({
+            "request_id": self.request_id,
+            "metadata.aspect_ratio": self.aspect_ratio,
+            "status": "converted",
+            "filename": {"$in": missing}
+        }, ASSET_RENDER_PROJECTION).to_list(None)
+        for asset_filename in missing:
+            self._assets[asset_filename] = None
+        for asset_result in asset_results:
+            self._assets[asset_result["filename"]] = Asset(**asset_result)
+        logger.info(
+            f"Loaded {len(asset_results)} of {len(missing)} assets for request {self.request_id} ({self.aspect_ratio})")
+
+    async def load_scenes(self, scene_results):
+        await self.load(
+            asset_filename
+            for scene_result in scene_results
+            for asset_filename in scene_result.get("asset_filenames") or []
+        )
+
+    async def get(self, asset_filename: str) -> Optional[Asset]:
+        if asset_filename not in self._assets:
+            await self.load([asset_filename])
+        return self._assets[asset_filename]
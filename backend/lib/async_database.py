@@ -0,0 +1,78 @@
+import os
+import threading
+from motor.motor_asyncio import AsyncIOMotorClient
+from lib import database
+
+
+class AsyncConnectionManager:
+    """
+    Owns the process-wide Motor client, created on first use with the same
+    settings as the synchronous client in lib.database and the async share of
+    its connection budget.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    mongo_tls = os.getenv("MONGO_TLS", "true").lower() == "true"
+                    self._client = AsyncIOMotorClient(
+                        os.getenv("MONGO_URL"),
+                        tls=mongo_tls,
+                        maxPoolSize=database.ASYNC_MAX_POOL_SIZE,
+                        minPoolSize=database.ASYNC_MIN_POOL_SIZE,
+                        maxIdleTimeMS=database.MONGO_MAX_IDLE_TIME_MS,
+                        connectTimeoutMS=database.MONGO_CONNECT_TIMEOUT_MS,
+                        serverSelectionTimeoutMS=database.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                        waitQueueTimeoutMS=database.MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+                        event_listeners=[
+                            database.connection_manager.pool_metrics, database.command_metrics]
+                    )
+        return self._client
+
+    @property
+    def db(self):
+        return self.client.get_database(os.getenv("MONGO_DB_NAME"))
+
+
+async_connection_manager = AsyncConnectionManager()
+
+
+class AsyncLazyCollection:
+    """Stands in for a Motor collection and resolves it on first use."""
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def collection(self):
+        return async_connection_manager.db.get_collection(self._name)
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def __repr__(self):
+        return f"AsyncLazyCollection({self._name!r})"
+
+
+class AsyncLazyDatabase:
+    """The async counterpart of lib.database.db: `adb.uploads` etc. are awaitable collections."""
+
+    def get_collection(self, name):
+        return AsyncLazyCollection(name)
+
+    def __getitem__(self, name):
+        return AsyncLazyCollection(name)
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return AsyncLazyCollection(attribute)
+
+
+adb = AsyncLazyDatabase()
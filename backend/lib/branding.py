@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from pydantic import BaseModel
+from typing import Dict, Optional
+from constants import UPLOAD_DIRECTORY
+from lib.async_database import adb
+from lib.logger import setup_logger
+from lib.media_pool import run_media_task
+from lib.repository import get_logo_path
+from utils.image.create_images_with_pil import create_circular_mask
+
+logger = setup_logger(__name__)
+
+# How long a cached entry is trusted before its branding_version is re-read
+BRANDING_CACHE_SECONDS = float(os.getenv("BRANDING_CACHE_SECONDS", 60))
+# Requests whose branding is kept; the least recently used are dropped first
+BRANDING_CACHE_SIZE = int(os.getenv("BRANDING_CACHE_SIZE", 256))
+
+
+class Branding(BaseModel):
+    """What title scenes need about a request's brand."""
+    version: int
+    brand_link: Optional[str] = None
+    logo_path: Optional[str] = None
+    # The logo cropped to a circle, ready to composite
+    masked_logo_path: Optional[str] = None
+    checked_at: float
+
+
+def masked_logo_path_for(request_id, version):
+    # Versioned so a stale mask is never reused and a fresh one survives restarts
+    return os.path.join(UPLOAD_DIRECTORY, request_id, "branding", f"logo_with_circular_mask_v{version}.png")
+
+
+class BrandingCache:
+    """
+    Read-through cache of each request's branding. Uploads and annotations bump
+    the request's branding_version through `invalidate_branding`; entries are
+    trusted for BRANDING_CACHE_SECONDS and then revalidated against it with one
+    projected read, so title scenes neither repeat the logo and brand link
+    queries nor re-mask the logo. At most `max_entries` requests are kept.
+    """
+
+    def __init__(self, max_entries=BRANDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Branding]" = OrderedDict()
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _lock(self, request_id):
+        if request_id not in self._locks:
+            self._locks[request_id] = asyncio.Lock()
+        return self._locks[request_id]
+
+    def _drop_lock(self, request_id):
+        lock = self._locks.get(request_id)
+        # A held lock still guards a load; it goes once that request is dropped again
+        if lock is not None and not lock.locked():
+            del self._locks[request_id]
+
+    def _store(self, request_id, entry):
+        self._entries[request_id] = entry
+        self._entries.move_to_end(request_id)
+        while len(self._entries) > self.max_entries:
+            evicted_id, _entry = self._entries.popitem(last=False)
+            self._drop_lock(evicted_id)
+        # Loads that failed leave a lock without an entry behind
+        if len(self._locks) > self.max_entries:
+            for locked_id in [locked_id for locked_id in self._locks if locked_id not in self._entries]:
+                self._drop_lock(locked_id)
+
+    def _fresh(self, request_id):
+        entry = self._entries.get(request_id)
+        if entry and time.monotonic() - entry.checked_at < BRANDING_CACHE_SECONDS:
+            self._entries.move_to_end(request_id)
+            return entry
+        return None
+
+    async def get(self, request_id) -> Branding:
+        entry = self._fresh(request_id)
+        if entry:
+            return entry
+
+        # One loader per request, so concurrent title scenes share its work
+        async with self._lock(request_id):
+            entry = self._fresh(request_id)
+            if entry:
+                return entry
+
+            video_request = await adb.video_requests.find_one(
+                {"_id": request_id}, {"branding_version": 1, "brand_link": 1}) or {}
+            version = video_request.get("branding_version", 0)
+            entry = self._entries.get(request_id)
+            if entry and entry.version == version:
+                entry.checked_at = time.monotonic()
+                self._entries.move_to_end(request_id)
+                return entry
+
+            entry = await self._load(request_id, version, video_request.get("brand_link"))
+            self._store(request_id, entry)
+            return entry
+
+    async def _load(self, request_id, version, brand_link):
+        logo_path = await get_logo_path(request_id)
+        masked_logo_path = None
+        if logo_path:
+            masked_logo_path = masked_logo_path_for(request_id, version)
+            if not os.path.exists(masked_logo_path):
+                logger.info(
+                    f"Masking logo of request {request_id} (branding v{version})")
+                os.makedirs(os.path.dirname(masked_logo_path), exist_ok=True)
+                await run_media_task(create_circular_mask, logo_path, masked_logo_path)
+        return Branding(
+            version=version,
+            brand_link=brand_link,
+            logo_path=logo_path,
+            masked_logo_path=masked_logo_path,
+            checked_at=time.monotonic()
+        )
+
+    def forget(self, request_id):
+        self._entries.pop(request_id, None)
+        self._drop_lock(request_id)
+
+
+branding_cache = BrandingCache()
+
+
+async def get_branding(request_id) -> Branding:
+    return await branding_cache.get(request_id)
+
+
+async def invalidate_branding(request_id):
+    """
+    Call whenever a request's uploads, logo or brand link change. Bumping the
+    version reaches the caches of every process; this one forgets at once.
+    """
+    await adb.video_requests.update_one(
+        {"_id": request_id},
+        {"$inc": {"branding_version": 1}}
+    )
+    branding_cache.forget(request_id)
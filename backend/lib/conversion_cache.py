@@ -0,0 +1,214 @@
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from constants import UPLOAD_DIRECTORY
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Converted assets keyed by what went into them, shared by every request. Keep
+# it on the same filesystem as UPLOAD_DIRECTORY so entries can be hardlinked.
+CONVERSION_CACHE_DIRECTORY = os.getenv(
+    "CONVERSION_CACHE_DIRECTORY", os.path.join(UPLOAD_DIRECTORY, ".conversion_cache"))
+# Size the least recently used entries are evicted down to, 0 disables the cache
+CONVERSION_CACHE_MAX_MB = int(os.getenv("CONVERSION_CACHE_MAX_MB", 10240))
+# Eviction frees down to this fraction of the budget so it doesn't run on every store
+EVICTION_LOW_WATER = 0.9
+HASH_CHUNK_SIZE = 1024 * 1024
+# Source hashes remembered per process, least recently used dropped first
+HASH_MEMO_SIZE = 4096
+
+
+class ConversionCache:
+    """
+    Content-addressed store of converted assets. An entry is keyed by the
+    sha256 of the source file, the target aspect ratio, crop type, background
+    and encoder profile, so the same logo, headshot or clip uploaded to many
+    requests is encoded once and later conversions are hardlinked from it.
+
+    Entries are files under `directory`; their mtime is bumped on every hit and
+    the least recently used ones are removed once the cache outgrows
+    `max_bytes`. Several processes can share a directory: writes are atomic
+    renames and an entry evicted under a reader simply counts as a miss.
+    """
+
+    def __init__(self, directory, max_bytes, hash_memo_size=HASH_MEMO_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hash_memo_size = hash_memo_size
+        # Guards the counters, the size estimate and the hash memo
+        self._lock = threading.Lock()
+        # Held by the one thread evicting, so concurrent stores don't all scan
+        self._evict_lock = threading.Lock()
+        self._hashes = OrderedDict()
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.stored_bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def hash_file(self, path):
+        # Memoized by (path, mtime, size), so an upload is hashed once per process
+        stat = os.stat(path)
+        memo_key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if memo_key in self._hashes:
+                self._hashes.move_to_end(memo_key)
+                return self._hashes[memo_key]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        source_hash = digest.hexdigest()
+        with self._lock:
+            self._hashes[memo_key] = source_hash
+            while len(self._hashes) > self.hash_memo_size:
+                self._hashes.popitem(last=False)
+        return source_hash
+
+    def key(self, source_hash, aspect_ratio_width, aspect_ratio_height, crop_type, background_color, encoder_profile):
+        parts = [source_hash, f"{aspect_ratio_width}x{aspect_ratio_height}", crop_type,
+                 "{:02x}{:02x}{:02x}".format(*background_color), encoder_profile]
+        return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+    def entry_path(self, key, output_path):
+        extension = os.path.splitext(output_path)[1].lower()
+        return os.path.join(self.directory, key[:2], f"{key}{extension}")
+
+    def materialize(self, key, output_path):
+        """Links the cached conversion for `key` to output_path. Returns whether there was one."""
+        entry_path = self.entry_path(key, output_path)
+        try:
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            link_or_copy(entry_path, output_path)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, output_path):
+        """Adds the freshly converted output_path to the cache under `key`."""
+        entry_path = self.entry_path(key, output_path)
+        if os.path.exists(entry_path):
+            return
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temporary_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+        link_or_copy(output_path, temporary_path)
+        os.replace(temporary_path, entry_path)
+        entry_size = os.path.getsize(entry_path)
+        with self._lock:
+            self.stores += 1
+            self.stored_bytes += entry_size
+            if self._size is not None:
+                self._size += entry_size
+        if self._current_size() > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _current_size(self):
+        with self._lock:
+            if self._size is not None:
+                return self._size
+            stored_bytes = self.stored_bytes
+        # Scanned outside the lock; stores made meanwhile are added on top
+        size = sum(entry_size for _mtime, entry_size, _path in self._entries())
+        with self._lock:
+            if self._size is None:
+                self._size = size + self.stored_bytes - stored_bytes
+            return self._size
+
+    def evict(self):
+        """Removes least recently used entries until the cache is back under its low-water mark."""
+        if not self._evict_lock.acquire(blocking=False):
+            # Another thread is already evicting
+            return
+        try:
+            self._evict()
+        finally:
+            self._evict_lock.release()
+
+    def _evict(self):
+        with self._lock:
+            stored_bytes = self.stored_bytes
+        entries = sorted(self._entries())
+        size = sum(entry_size for _mtime, entry_size, _path in entries)
+        target = self.max_bytes * EVICTION_LOW_WATER
+        evictions = 0
+        evicted_bytes = 0
+        for _mtime, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                # Assets linked from the entry keep their own link to the data
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            evictions += 1
+            evicted_bytes += entry_size
+        with self._lock:
+            # Entries stored since the scan are not in `size` yet
+            self._size = size + self.stored_bytes - stored_bytes
+            self.evictions += evictions
+            self.evicted_bytes += evicted_bytes
+        if evictions:
+            logger.info(
+                f"Evicted {evictions} conversion cache entries ({evicted_bytes} bytes)")
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "stores": self.stores,
+                "stored_bytes": self.stored_bytes,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "size_bytes": self._size,
+            }
+
+
+def link_or_copy(source_path, destination_path):
+    try:
+        os.link(source_path, destination_path)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # Different filesystem or no hardlink support
+        shutil.copy2(source_path, destination_path)
+
+
+conversion_cache = ConversionCache(
+    CONVERSION_CACHE_DIRECTORY, CONVERSION_CACHE_MAX_MB * 1024 * 1024)
+
+
+def get_conversion_cache_metrics():
+    return conversion_cache.snapshot()
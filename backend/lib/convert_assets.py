@@ -4,141 +4,322 @@
 # convert to format aspect ratio
 # if all uploads have been converted to the aspect ratio within, we will update the status of the video_request_format to "converted"
 
-from constants import UPLOAD_DIRECTORY
+from constants import ASPECT_RATIO_SETTINGS, UPLOAD_DIRECTORY
 import asyncio
 import datetime
 import os
-import pymongo
-from moviepy.editor import VideoFileClip
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.conversion_cache import conversion_cache, get_conversion_cache_metrics
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, current_lease_token, leased
 from lib.logger import setup_logger
+from lib.media_pool import run_media_task
+from lib.repository import get_asset_conversions
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from models.asset import Asset
 from models.app_response import AppResponse
 from models.upload import Upload
 from models.video_request_aspect_ratio import VideoRequestAspectRatio
 from utils.image.image_helpers import detect_image_size_and_aspect_ratio
-from utils.image.resize_images import convert_image_to_aspect_ratio
-from utils.video.resize_videos import convert_video_to_aspect_ratio
-from utils.video.video_helpers import get_video_size
+from utils.image.resize_images import convert_image_to_aspect_ratios
+from utils.image.resize_images import encoder_profile as image_encoder_profile
+from utils.video.resize_videos import convert_video_to_aspect_ratios
+from utils.video.resize_videos import encoder_profile as video_encoder_profile
+from utils.media_probe import probe_media
 from bson.objectid import ObjectId
+from pymongo import UpdateOne
 from utils.exception_helpers import log_exception
 
 logger = setup_logger(__name__)
-_client, db = get_db_connection()
-assets_collection = db.assets
-uploads_collection = db.uploads
 video_request_aspect_ratios_collection = db.video_request_aspect_ratios
 
 
 MAX_CONVERSION_ATTEMPTS = 3
-NO_ASPECT_RATIOS_WAIT_SECONDS = 5
+CONVERSION_QUEUE = LeasedQueue(
+    name="convert",
+    collection_name="video_request_aspect_ratios",
+    in_progress_statuses=["conversion_started"],
+    ready_status="requested",
+    failed_status="conversion_failed",
+    attempts_field="conversion_attempts",
+    max_attempts=MAX_CONVERSION_ATTEMPTS,
+    start_time_field="conversion_start_time"
+)
+CONVERSION_READY_QUERY = {
+    "status": "requested",
+    # Set once every upload of the request is described, see lib.upload_readiness
+    "uploads_ready": True,
+    "conversion_attempts": {"$lt": MAX_CONVERSION_ATTEMPTS}
+}
+# Uploads are letterboxed onto black, as convert_*_to_aspect_ratios default to
+CONVERSION_CROP_TYPE = "contain"
+CONVERSION_BACKGROUND_COLOR = (0, 0, 0)
+# Uploads of one job converted at once; the media pool bounds the processes
+UPLOAD_CONVERSION_CONCURRENCY = int(
+    os.getenv("UPLOAD_CONVERSION_CONCURRENCY", 4))
+# Tries per upload within a job before its assets are left conversion_failed
+# for the next attempt at the aspect ratio
+MAX_UPLOAD_CONVERSION_ATTEMPTS = 2
+# Convert every ready aspect ratio of a request in the same pass over its
+# uploads, so each upload is decoded once however many ratios were requested
+MULTI_RATIO_CONVERSION = os.getenv(
+    "MULTI_RATIO_CONVERSION", "true").lower() == "true"
+# Collections and document states that may make new convert work claimable
+CONVERT_WAKE_TRIGGERS = [
+    ("video_request_aspect_ratios", {"status": "requested", "uploads_ready": True}),
+]
 
 
-async def convert_uploads_to_aspect_ratio(aspect_ratio_id):
+def converted_asset_metadata(upload, converted_asset_file_path, aspect_ratio):
+    if upload.metadata.content_type == "video":
+        probe = probe_media(converted_asset_file_path)
+        video = probe.require_video()
+        video_width, video_height = video.display_size
+        return {
+            "duration": probe.duration,
+            "width": video_width,
+            "height": video_height,
+            "aspect_ratio": aspect_ratio,
+            "fps": video.fps,
+            "has_speech": upload.metadata.has_speech,
+            "content_type": "video"
+        }
+
+    image_width, image_height, _image_aspect_ratio = detect_image_size_and_aspect_ratio(
+        converted_asset_file_path)
+    return {
+        "width": image_width,
+        "height": image_height,
+        "aspect_ratio": aspect_ratio,
+        "is_logo": upload.metadata.is_logo,
+        "is_profile_pic": upload.metadata.is_profile_pic,
+        "content_type": "image"
+    }
+
+
+def asset_dict_for(upload, aspect_ratio, existing_asset=None):
+    """The Asset document `upload` converts to for `aspect_ratio`, before conversion."""
+    aspect_ratio_width, aspect_ratio_height = (
+        int(bit) for bit in aspect_ratio.split("x"))
+    asset_filename_without_extension = f"{upload.filename_without_extension}-{upload.metadata.content_type}-{aspect_ratio}"
+    asset_filename = f"{asset_filename_without_extension}{upload.file_extension}"
+    return {
+        # A retry overwrites the failed attempt's document
+        "_id": existing_asset["_id"] if existing_asset else str(ObjectId()),
+        "request_id": upload.request_id,
+        "upload_id": upload.id,
+        "filename": asset_filename,
+        "file_extension": upload.file_extension,
+        "filename_without_extension": asset_filename_without_extension,
+        "file_path": os.path.join(
+            UPLOAD_DIRECTORY, upload.request_id, aspect_ratio, "assets", asset_filename),
+        "content_type": upload.content_type,
+        "description": upload.description,
+        "transcript": upload.transcript,
+        "processed": upload.processed,
+        "metadata": {"aspect_ratio": aspect_ratio, "content_type": upload.metadata.content_type},
+        "conversion_attempts": existing_asset.get("conversion_attempts", 0) if existing_asset else 0,
+        "aspect_ratio_width": aspect_ratio_width,
+        "aspect_ratio_height": aspect_ratio_height,
+    }
+
+
+async def convert_media(upload, media_targets):
+    """
+    Writes every (output_path, aspect_ratio_width, aspect_ratio_height) in
+    `media_targets` for the upload, linking the ones the conversion cache
+    already holds and converting the rest in one media task.
+    """
+    if upload.metadata.content_type == "video":
+        convert, encoder_profile = convert_video_to_aspect_ratios, video_encoder_profile
+    elif upload.metadata.content_type == "image":
+        convert, encoder_profile = convert_image_to_aspect_ratios, image_encoder_profile
+    else:
+        return
+
+    if not conversion_cache.enabled:
+        await run_media_task(convert, upload.file_path, media_targets,
+                             crop_type=CONVERSION_CROP_TYPE, background_color=CONVERSION_BACKGROUND_COLOR)
+        return
+
+    source_hash = await asyncio.to_thread(conversion_cache.hash_file, upload.file_path)
+    cache_keys = {
+        output_path: conversion_cache.key(
+            source_hash, aspect_ratio_width, aspect_ratio_height,
+            CONVERSION_CROP_TYPE, CONVERSION_BACKGROUND_COLOR, encoder_profile(output_path))
+        for output_path, aspect_ratio_width, aspect_ratio_height in media_targets
+    }
+    missed_targets = []
+    for media_target in media_targets:
+        output_path = media_target[0]
+        if not await asyncio.to_thread(conversion_cache.materialize, cache_keys[output_path], output_path):
+            missed_targets.append(media_target)
+    if not missed_targets:
+        return
+
+    await run_media_task(convert, upload.file_path, missed_targets,
+                         crop_type=CONVERSION_CROP_TYPE, background_color=CONVERSION_BACKGROUND_COLOR)
+    for output_path, _aspect_ratio_width, _aspect_ratio_height in missed_targets:
+        await asyncio.to_thread(conversion_cache.store, cache_keys[output_path], output_path)
+
+
+async def convert_upload(upload, aspect_ratios, existing_assets=None):
+    """
+    Converts one upload to every aspect ratio in `aspect_ratios` with a single
+    decode, trying up to MAX_UPLOAD_CONVERSION_ATTEMPTS times, and records the
+    outcome, attempts and timing on its Asset for each aspect ratio. Returns
+    whether the upload converted.
+    """
+    existing_assets = existing_assets or {}
+    asset_dicts = [
+        asset_dict_for(upload, aspect_ratio,
+                       existing_assets.get((upload.id, aspect_ratio)))
+        for aspect_ratio in aspect_ratios
+    ]
+    media_targets = [
+        (asset_dict["file_path"], asset_dict.pop("aspect_ratio_width"),
+         asset_dict.pop("aspect_ratio_height"))
+        for asset_dict in asset_dicts
+    ]
+
+    conversion_error = None
+    conversion_start_time = datetime.datetime.now()
+    for attempt in range(1, MAX_UPLOAD_CONVERSION_ATTEMPTS + 1):
+        for asset_dict in asset_dicts:
+            asset_dict["conversion_attempts"] += 1
+        try:
+            await convert_media(upload, media_targets)
+            for asset_dict in asset_dicts:
+                asset_dict["metadata"] = await asyncio.to_thread(
+                    converted_asset_metadata, upload, asset_dict["file_path"], asset_dict["metadata"]["aspect_ratio"])
+            conversion_error = None
+            break
+        except Exception as e:
+            conversion_error = f"{type(e).__name__}: {e}"[-2000:]
+            logger.warning(
+                f"Converting upload {upload.filename} of request {upload.request_id} failed (attempt {attempt} of {MAX_UPLOAD_CONVERSION_ATTEMPTS}): {e}")
+
+    # The aspect ratios share one pass, so they share its timing
+    conversion_end_time = datetime.datetime.now()
+    conversion_duration = (
+        conversion_end_time - conversion_start_time).total_seconds()
+    write_requests = []
+    for asset_dict in asset_dicts:
+        asset_dict.update({
+            "status": "conversion_failed" if conversion_error else "converted",
+            "conversion_error": conversion_error,
+            "conversion_start_time": conversion_start_time,
+            "conversion_end_time": conversion_end_time,
+            "conversion_duration": conversion_duration,
+        })
+        asset = Asset(**asset_dict).model_dump(by_alias=True)
+        asset_id = asset.pop("_id")
+        write_requests.append(UpdateOne(
+            {"_id": asset_id}, {"$set": asset}, upsert=True))
+    await adb.assets.bulk_write(write_requests)
+    return conversion_error is None
+
+
+async def convert_uploads(uploads, aspect_ratios, existing_assets):
+    """
+    Converts the uploads that lack a converted asset for any of `aspect_ratios`,
+    UPLOAD_CONVERSION_CONCURRENCY at a time. Returns how many failed.
+    """
+    slots = asyncio.Semaphore(UPLOAD_CONVERSION_CONCURRENCY)
+
+    async def convert_pending(upload):
+        pending_aspect_ratios = [
+            aspect_ratio for aspect_ratio in aspect_ratios
+            if existing_assets.get((upload.id, aspect_ratio), {}).get("status") != "converted"
+        ]
+        if not pending_aspect_ratios:
+            return True
+        async with slots:
+            return await convert_upload(upload, pending_aspect_ratios, existing_assets)
+
+    results = await asyncio.gather(
+        *(convert_pending(upload) for upload in uploads), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            log_exception(logger, result)
+    return sum(1 for result in results if result is not True)
+
+
+async def claim_sibling_aspect_ratios(aspect_ratio_result, heartbeat=None):
+    """
+    Leases the request's other aspect ratios that are ready for conversion, so
+    they are converted in the same pass as `aspect_ratio_result`, and returns
+    their documents. `heartbeat` keeps their leases fresh meanwhile.
+    """
+    # Siblings share the job's lease token, so its leased writes cover them
+    lease_token = current_lease_token.get()
+    sibling_ids = await asyncio.to_thread(
+        fetch_sibling_aspect_ratios_for_asset_conversion,
+        aspect_ratio_result["request_id"],
+        aspect_ratio_result["_id"],
+        lease_token=lease_token
+    )
+    if not sibling_ids:
+        return []
+    if heartbeat:
+        for sibling_id in sibling_ids:
+            heartbeat.add(sibling_id, lease_token)
+    return await adb.video_request_aspect_ratios.find(
+        {"_id": {"$in": sibling_ids}}).to_list(None)
+
+
+async def convert_uploads_to_aspect_ratio(aspect_ratio_id, heartbeat=None):
+    aspect_ratio_results = []
     try:
 
-        aspect_ratio_result = video_request_aspect_ratios_collection.find_one(
+        aspect_ratio_result = await adb.video_request_aspect_ratios.find_one(
             {"_id": aspect_ratio_id})
 
         if aspect_ratio_result:
-            aspect_ratio = VideoRequestAspectRatio(**aspect_ratio_result)
-            aspect_ratio_bits = aspect_ratio.aspect_ratio.split("x")
-            aspect_ratio_width = int(aspect_ratio_bits[0])
-            aspect_ratio_height = int(aspect_ratio_bits[1])
-            request_id = aspect_ratio.request_id
-            aspect_ratio_directory_name = aspect_ratio.aspect_ratio
-            asset_directory_path = os.path.join(
-                UPLOAD_DIRECTORY, request_id, aspect_ratio_directory_name, "assets")
-            os.makedirs(asset_directory_path, exist_ok=True)
-            uploads = uploads_collection.find(
-                {"request_id": aspect_ratio.request_id})
-            # @TODO parallelize asset conversion
-            for upload_dict in uploads:
-                conversion_start_time = datetime.datetime.now()
-                upload = Upload(**upload_dict)
-                asset_filename_without_extension = f"{upload.filename_without_extension}-{upload.metadata.content_type}-{aspect_ratio.aspect_ratio}"
-                asset_filename = f"{asset_filename_without_extension}{upload.file_extension}"
-                converted_asset_file_path = os.path.join(
-                    asset_directory_path, asset_filename)
-
-                if upload.metadata.content_type == "video":
-                    convert_video_to_aspect_ratio(
-                        upload.file_path,
-                        converted_asset_file_path,
-                        aspect_ratio_width,
-                        aspect_ratio_height
-                    )
-                    clip = VideoFileClip(converted_asset_file_path)
-                    video_width, video_height = get_video_size(
-                        converted_asset_file_path)
-
-                    metadata = {
-                        "duration": clip.duration,
-                        "width": video_width,
-                        "height": video_height,
-                        "aspect_ratio": aspect_ratio.aspect_ratio,
-                        "fps": clip.fps,
-                        "has_speech": upload.metadata.has_speech,
-                        "content_type": "video"
-                    }
-                elif upload.metadata.content_type == "image":
-                    convert_image_to_aspect_ratio(
-                        upload.file_path, converted_asset_file_path, aspect_ratio_width, aspect_ratio_height)
-                    image_width, image_height, _image_aspect_ratio = detect_image_size_and_aspect_ratio(
-                        converted_asset_file_path)
-                    metadata = {
-                        "width": image_width,
-                        "height": image_height,
-                        "aspect_ratio": aspect_ratio.aspect_ratio,
-                        "is_logo": upload.metadata.is_logo,
-                        "is_profile_pic": upload.metadata.is_profile_pic,
-                        "content_type": "image"
-                    }
-
-                asset_id = str(ObjectId())
-                conversion_end_time = datetime.datetime.now()
-                conversion_duration = (
-                    conversion_end_time - conversion_start_time).total_seconds()
-                asset_dict = {
-                    "_id": asset_id,
-                    "request_id": aspect_ratio.request_id,
-                    "filename": asset_filename,
-                    "file_extension": upload.file_extension,
-                    "filename_without_extension": asset_filename_without_extension,
-                    "file_path": converted_asset_file_path,
-                    "content_type": upload.content_type,
-                    "description": upload.description,
-                    "transcript": upload.transcript,
-                    "processed": upload.processed,
-                    "status": "converted",
-                    "metadata": metadata,
-                    "conversion_start_time": conversion_start_time,
-                    "conversion_end_time": conversion_end_time,
-                    "conversion_duration": conversion_duration,
-                }
+            aspect_ratio_results = [aspect_ratio_result]
+            if MULTI_RATIO_CONVERSION:
+                aspect_ratio_results += await claim_sibling_aspect_ratios(aspect_ratio_result, heartbeat)
+            aspect_ratios = [VideoRequestAspectRatio(**result)
+                             for result in aspect_ratio_results]
+            request_id = aspect_ratio_result["request_id"]
+            for aspect_ratio in aspect_ratios:
+                os.makedirs(os.path.join(
+                    UPLOAD_DIRECTORY, request_id, aspect_ratio.aspect_ratio, "assets"), exist_ok=True)
+            aspect_ratio_names = [
+                aspect_ratio.aspect_ratio for aspect_ratio in aspect_ratios]
+            uploads = [Upload(**upload_dict) for upload_dict in await adb.uploads.find(
+                {"request_id": request_id}).to_list(None)]
+            # Uploads converted by an earlier attempt are not converted again
+            existing_assets = await get_asset_conversions(
+                request_id, aspect_ratio_names)
+            failed_count = await convert_uploads(
+                uploads, aspect_ratio_names, existing_assets)
+            if failed_count:
+                raise RuntimeError(
+                    f"{failed_count} of {len(uploads)} uploads failed to convert")
 
-                asset = Asset(**asset_dict)
-                assets_collection.insert_one(asset.model_dump(by_alias=True))
-                
-            conversion_start_time = aspect_ratio_result['conversion_start_time']
             conversion_end_time = datetime.datetime.now()
-            conversion_duration = (
-                conversion_end_time - conversion_start_time).total_seconds()
-            video_request_aspect_ratios_collection.update_one(
-                {"_id": aspect_ratio_id},
-                {"$inc": {"conversion_attempts": 1},
-                 "$set": {
-                    "status": "converted",
-                    "conversion_end_time": conversion_end_time,
-                    "conversion_duration": conversion_duration,
-                }}
-            )
+            for result in aspect_ratio_results:
+                conversion_duration = (
+                    conversion_end_time - result['conversion_start_time']).total_seconds()
+                await adb.video_request_aspect_ratios.update_one(
+                    leased(result["_id"]),
+                    {"$inc": {"conversion_attempts": 1},
+                     "$set": {
+                        "status": "converted",
+                        "conversion_end_time": conversion_end_time,
+                        "conversion_duration": conversion_duration,
+                    }}
+                )
 
+            converted_aspect_ratios = ", ".join(aspect_ratio_names)
             return AppResponse(
                 status="success",
                 data={
                     "aspect_ratio_id": aspect_ratio_id,
-                    "message": f"Asset conversion completed for aspect ratio {aspect_ratio.aspect_ratio} for request {aspect_ratio.request_id}"
+                    "aspect_ratio_ids": [result["_id"] for result in aspect_ratio_results],
+                    "message": f"Asset conversion completed for aspect ratios {converted_aspect_ratios} for request {request_id}"
                 }
             )
         else:
@@ -151,27 +332,21 @@ async def convert_uploads_to_aspect_ratio(aspect_ratio_id):
             )
 
     except Exception as e:
-        if aspect_ratio_result:
-            next_status = "requested"
-            if aspect_ratio_result["conversion_attempts"] + 1 >= MAX_CONVERSION_ATTEMPTS:
-                video_request_aspect_ratios_collection.update_one(
-                    {'_id': aspect_ratio_id},
+        failed_for_good = False
+        for result in aspect_ratio_results:
+            if result["conversion_attempts"] + 1 >= MAX_CONVERSION_ATTEMPTS:
+                await adb.video_request_aspect_ratios.update_one(
+                    leased(result["_id"]),
                     {"$set": {
                         "status": "conversion_failed",
                         "conversion_end_time": datetime.datetime.now(),
                     }}
                 )
+                failed_for_good = failed_for_good or result["_id"] == aspect_ratio_id
+                continue
 
-                return AppResponse(
-                    status="error",
-                    error={
-                        "aspect_ratio_id": aspect_ratio_id,
-                        "message": f"Asset conversion failed after {MAX_CONVERSION_ATTEMPTS} attempts"
-                    }
-                )
-
-            video_request_aspect_ratios_collection.update_one(
-                {'_id': aspect_ratio_id},
+            await adb.video_request_aspect_ratios.update_one(
+                leased(result["_id"]),
                 {"$inc": {"conversion_attempts": 1},
                  "$set": {
                     "status": "requested",
@@ -179,41 +354,74 @@ async def convert_uploads_to_aspect_ratio(aspect_ratio_id):
                 }}
             )
 
+        if failed_for_good:
+            return AppResponse(
+                status="error",
+                error={
+                    "aspect_ratio_id": aspect_ratio_id,
+                    "message": f"Asset conversion failed after {MAX_CONVERSION_ATTEMPTS} attempts"
+                }
+            )
+
         return AppResponse(
             status="error",
             error={"aspect_ratio_id": aspect_ratio_id, "message": str(e)}
         )
 
+    finally:
+        if heartbeat:
+            # The loop releases the job it claimed, the siblings are ours
+            for result in aspect_ratio_results[1:]:
+                heartbeat.remove(result["_id"], current_lease_token.get())
 
-def fetch_next_aspect_ratio_for_asset_conversion():
-    # first find request_ids where all uploads are in status description_complete
-    excluded_request_ids = uploads_collection.distinct(
-        "request_id",
-        {
-            "status": {"$nin": ["description_complete"]}
+
+def conversion_started_update():
+    return {
+        "$set": {
+            "conversion_start_time": datetime.datetime.now(),
+            "conversion_end_time": None,
+            "status": "conversion_started"
         }
+    }
+
+
+def fetch_next_aspect_ratios_for_asset_conversion(limit, worker_id=WORKER_ID, lease_token=None):
+    aspect_ratio_ids = claim_jobs(
+        video_request_aspect_ratios_collection,
+        CONVERSION_READY_QUERY,
+        conversion_started_update(),
+        limit,
+        worker_id=worker_id,
+        lease_token=lease_token,
+        queue=CONVERSION_QUEUE
+    )
+
+    return AppResponse(
+        status="success",
+        data={"aspect_ratio_ids": aspect_ratio_ids}
     )
-    aspect_ratio_result = video_request_aspect_ratios_collection.find_one_and_update(
-        {
-            "status": "requested",
-            "conversion_attempts": {"$lt": MAX_CONVERSION_ATTEMPTS},
-            "request_id": {"$nin": excluded_request_ids}
-        },
-        {
-            "$set": {
-                "conversion_start_time": datetime.datetime.now(),
-                "conversion_end_time": None,
-                "status": "conversion_started"
-            }
-        },
-        sort=[("_id", pymongo.ASCENDING)],
-        return_document=pymongo.ReturnDocument.AFTER
+
+
+def fetch_sibling_aspect_ratios_for_asset_conversion(request_id, aspect_ratio_id, worker_id=WORKER_ID, lease_token=None):
+    return claim_jobs(
+        video_request_aspect_ratios_collection,
+        {**CONVERSION_READY_QUERY, "request_id": request_id,
+            "_id": {"$ne": aspect_ratio_id}},
+        conversion_started_update(),
+        len(ASPECT_RATIO_SETTINGS),
+        worker_id=worker_id,
+        lease_token=lease_token
     )
 
-    if aspect_ratio_result:
+
+def fetch_next_aspect_ratio_for_asset_conversion():
+    aspect_ratio_ids = fetch_next_aspect_ratios_for_asset_conversion(
+        1).data["aspect_ratio_ids"]
+
+    if aspect_ratio_ids:
         return AppResponse(
             status="success",
-            data={"aspect_ratio_id": aspect_ratio_result["_id"]}
+            data={"aspect_ratio_id": aspect_ratio_ids[0]}
         )
     else:
         return AppResponse(
@@ -223,38 +431,26 @@ def fetch_next_aspect_ratio_for_asset_conversion():
         )
 
 
-async def find_and_convert_aspect_ratios(max_count=None, batch_size=1):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - processed_count if max_count is not None else batch_size
-            for _ in range(min(batch_size, remaining_count)):
-                fetch_next_aspect_ratio_result = fetch_next_aspect_ratio_for_asset_conversion()
-                aspect_ratio_id = fetch_next_aspect_ratio_result.data["aspect_ratio_id"]
-                if fetch_next_aspect_ratio_result.status == "success" and fetch_next_aspect_ratio_result.data["aspect_ratio_id"]:
-                    batch.append(aspect_ratio_id)
-                else:
-                    break
-
-            if not batch:
-                # Wait for a short time if no aspect ratios are found
-                logger.info(
-                    f"No aspect ratios found. Sleeping for {NO_ASPECT_RATIOS_WAIT_SECONDS} seconds.")
-                await asyncio.sleep(NO_ASPECT_RATIOS_WAIT_SECONDS)
-                continue
-
-            results = await asyncio.gather(*[convert_uploads_to_aspect_ratio(aspect_ratio_id) for aspect_ratio_id in batch])
+def log_conversion_result(result):
+    if result.status == "error":
+        logger.error(
+            f"Failed to convert assets for aspect ratio {result.error['aspect_ratio_id']}: {result.error['message']}")
+    if conversion_cache.enabled:
+        logger.info("Conversion cache", extra={
+                    "data": get_conversion_cache_metrics()})
 
-            for result in results:
-                if result.status == "error":
-                    logger.error(result)
-                    logger.error(
-                        f"Failed to describe upload {result.error['upload_id']}: {result.error['message']}")
 
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
-
-        except Exception as e:
-            log_exception(logger, e)
\ No newline at end of file
+async def find_and_convert_aspect_ratios(max_count=None, batch_size=1):
+    heartbeat = LeaseHeartbeat(video_request_aspect_ratios_collection)
+    await run_stage_loop(
+        "convert",
+        claim_batch=lambda limit, lease_token: fetch_next_aspect_ratios_for_asset_conversion(
+            limit, lease_token=lease_token).data["aspect_ratio_ids"],
+        process=lambda aspect_ratio_id: convert_uploads_to_aspect_ratio(
+            aspect_ratio_id, heartbeat),
+        handle_result=log_conversion_result,
+        heartbeat=heartbeat,
+        waker=StageWaker("convert", db, CONVERT_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
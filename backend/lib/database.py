@@ -1,16 +1,195 @@
 import os
+import threading
 import pymongo
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.monitoring import ConnectionPoolListener
 from dotenv import load_dotenv
+from lib.db_metrics import command_metrics
 
 load_dotenv()
 
+# Pool and timeout settings for the one MongoClient each process shares
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+# How long an operation may wait for a free pooled connection, 0 waits forever
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 0))
+# Share of the pool given to the Motor client in lib.async_database; the two
+# clients split MONGO_MAX_POOL_SIZE so a process never opens more in total
+MONGO_ASYNC_POOL_SHARE = float(os.getenv("MONGO_ASYNC_POOL_SHARE", 0.5))
 
-def get_db_connection():
-    MONGO_URL = os.getenv("MONGO_URL")
-    MONGO_DB_NAME = os.getenv("MONGO_DB_NAME")
 
-    client = pymongo.MongoClient(MONGO_URL, tls=True)
-    client.start_session()
-    db = client.get_database(MONGO_DB_NAME)
+def split_pool_size(total, async_share=MONGO_ASYNC_POOL_SHARE):
+    """
+    Splits a connection budget into (sync, async) pool sizes. Each client keeps
+    at least one connection, since a maxPoolSize of 0 means unbounded.
+    """
+    async_size = min(max(round(total * async_share), 1), max(total - 1, 1))
+    return max(total - async_size, 1), async_size
 
-    return client, db
+
+SYNC_MAX_POOL_SIZE, ASYNC_MAX_POOL_SIZE = split_pool_size(MONGO_MAX_POOL_SIZE)
+SYNC_MIN_POOL_SIZE = min(MONGO_MIN_POOL_SIZE * SYNC_MAX_POOL_SIZE // max(MONGO_MAX_POOL_SIZE, 1),
+                         SYNC_MAX_POOL_SIZE)
+ASYNC_MIN_POOL_SIZE = min(MONGO_MIN_POOL_SIZE - SYNC_MIN_POOL_SIZE, ASYNC_MAX_POOL_SIZE)
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """
+    Counts connection pool events across every server, for both the sync and
+    the Motor client, so the counters cover the process's whole budget.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.connections_created = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.pool_clears = 0
+
+    def _add(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_pool_size": MONGO_MAX_POOL_SIZE,
+                "sync_max_pool_size": SYNC_MAX_POOL_SIZE,
+                "async_max_pool_size": ASYNC_MAX_POOL_SIZE,
+                "open_connections": self.open_connections,
+                "checked_out": self.checked_out,
+                "connections_created": self.connections_created,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "pool_clears": self.pool_clears,
+            }
+
+    def connection_created(self, event):
+        self._add(open_connections=1, connections_created=1)
+
+    def connection_closed(self, event):
+        self._add(open_connections=-1)
+
+    def connection_checked_out(self, event):
+        self._add(checked_out=1, checkouts=1)
+
+    def connection_checked_in(self, event):
+        self._add(checked_out=-1)
+
+    def connection_check_out_failed(self, event):
+        self._add(checkout_failures=1)
+
+    def pool_cleared(self, event):
+        self._add(pool_clears=1)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class ConnectionManager:
+    """
+    Owns the process-wide MongoClient. Nothing connects until the first
+    operation needs the client, so importing a module that talks to MongoDB
+    costs nothing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self.pool_metrics = PoolMetrics()
+
+    @property
+    def client(self) -> pymongo.MongoClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Local replica sets (e.g. for change streams) usually run without TLS
+                    mongo_tls = os.getenv("MONGO_TLS", "true").lower() == "true"
+                    self._client = pymongo.MongoClient(
+                        os.getenv("MONGO_URL"),
+                        tls=mongo_tls,
+                        maxPoolSize=SYNC_MAX_POOL_SIZE,
+                        minPoolSize=SYNC_MIN_POOL_SIZE,
+                        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+                        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS or None,
+                        event_listeners=[self.pool_metrics, command_metrics]
+                    )
+        return self._client
+
+    @property
+    def db(self) -> Database:
+        return self.client.get_database(os.getenv("MONGO_DB_NAME"))
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+connection_manager = ConnectionManager()
+
+
+class LazyCollection:
+    """Stands in for a Collection and resolves it on first use."""
+
+    def __init__(self, name):
+        self._name = name
+
+    @property
+    def collection(self) -> Collection:
+        return connection_manager.db.get_collection(self._name)
+
+    def __getattr__(self, attribute):
+        return getattr(self.collection, attribute)
+
+    def __repr__(self):
+        return f"LazyCollection({self._name!r})"
+
+
+class LazyDatabase:
+    """
+    Stands in for the Database. `db.uploads`, `db["uploads"]` and
+    `db.get_collection("uploads")` return LazyCollections, so modules can bind
+    collections at import time; Database methods such as watch() are forwarded.
+    """
+
+    def get_collection(self, name) -> LazyCollection:
+        return LazyCollection(name)
+
+    def __getitem__(self, name) -> LazyCollection:
+        return LazyCollection(name)
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_") or hasattr(Database, attribute):
+            return getattr(connection_manager.db, attribute)
+        return LazyCollection(attribute)
+
+
+db = LazyDatabase()
+
+
+def get_pool_metrics():
+    return connection_manager.pool_metrics.snapshot()
@@ -0,0 +1,239 @@
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import bson
+from pymongo.monitoring import CommandListener
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Commands slower than this are logged with the shape of their filter
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# The stage and job whose code issued a command. Both pymongo and Motor (3.1+
+# copies the caller's context into its executor threads) call the listener in
+# the caller's context, so the tags follow a job across threads.
+current_stage = contextvars.ContextVar("current_stage", default=None)
+current_job = contextvars.ContextVar("current_job", default=None)
+
+UNATTRIBUTED = "-"
+# Handshakes and heartbeats that say nothing about the pipeline's own queries
+IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart",
+                    "saslContinue", "endSessions", "buildInfo", "killCursors"}
+
+
+@contextlib.contextmanager
+def db_scope(stage=None, job_id=None):
+    """Attributes every command issued inside the block to `stage` and `job_id`."""
+    tokens = []
+    if stage is not None:
+        tokens.append((current_stage, current_stage.set(stage)))
+    if job_id is not None:
+        tokens.append((current_job, current_job.set(job_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def filter_shape(value):
+    """Replaces the values in a filter with their type names, keeping field names and operators."""
+    if isinstance(value, dict):
+        return {key: filter_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = filter_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return type(value).__name__
+
+
+def command_filter(command_name, command):
+    if command_name in ("find", "count", "distinct"):
+        return command.get("filter", command.get("query"))
+    if command_name == "findAndModify":
+        return command.get("query")
+    if command_name in ("update", "delete"):
+        statements = command.get("updates") or command.get("deletes") or []
+        return statements[0].get("q") if statements else None
+    if command_name == "aggregate":
+        for stage in command.get("pipeline", []):
+            if "$match" in stage:
+                return stage["$match"]
+    return None
+
+
+def reply_documents(command_name, reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    return reply.get("n", 0)
+
+
+def encoded_size(document):
+    try:
+        return len(bson.encode(document))
+    except Exception:
+        return 0
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms):
+        self.buckets[bisect.bisect_left(
+            LATENCY_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of observations
+        threshold = fraction * self.count
+        seen = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS + [self.max_ms], self.buckets):
+            seen += bucket_count
+            if seen >= threshold:
+                return bound
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "p50_ms": self.percentile(0.5) if self.count else 0,
+            "p95_ms": self.percentile(0.95) if self.count else 0,
+            "max_ms": round(self.max_ms, 1),
+        }
+
+
+class CommandStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.documents = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.failures = 0
+
+    def add(self, duration_ms, documents, bytes_sent, bytes_received, failed=False):
+        self.latency.observe(duration_ms)
+        self.documents += documents
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.failures += failed
+
+    def snapshot(self):
+        return {
+            **self.latency.snapshot(),
+            "documents": self.documents,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "failures": self.failures,
+        }
+
+
+class CommandMetrics(CommandListener):
+    """
+    Attributes the latency, documents returned or written and bytes moved by
+    every command to the stage and job that issued it. Keeps a histogram per
+    (stage, command) and running totals per in-flight job, and logs commands
+    slower than SLOW_QUERY_MS with their filter shape.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = {}
+        self.by_stage = {}
+        self.by_job = {}
+
+    def started(self, event):
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = event.command
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (
+                command.get("collection") if event.command_name == "getMore" else command.get(
+                    event.command_name),
+                command_filter(event.command_name, command),
+                encoded_size(command)
+            )
+
+    def succeeded(self, event):
+        self._finish(event, event.reply)
+
+    def failed(self, event):
+        self._finish(event, None)
+
+    def _finish(self, event, reply):
+        with self._lock:
+            started = self._started.pop(
+                (event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        collection_name, command_filter_value, bytes_sent = started
+        duration_ms = event.duration_micros / 1000
+        documents = reply_documents(event.command_name, reply) if reply else 0
+        bytes_received = encoded_size(reply) if reply else 0
+        stage = current_stage.get() or UNATTRIBUTED
+        job_id = current_job.get()
+
+        with self._lock:
+            stage_stats = self.by_stage.setdefault(stage, {})
+            stage_stats.setdefault(event.command_name, CommandStats()).add(
+                duration_ms, documents, bytes_sent, bytes_received, reply is None)
+            if job_id is not None:
+                job_stats = self.by_job.setdefault(
+                    job_id, {"commands": 0, "db_ms": 0.0, "documents": 0, "bytes": 0})
+                job_stats["commands"] += 1
+                job_stats["db_ms"] += duration_ms
+                job_stats["documents"] += documents
+                job_stats["bytes"] += bytes_sent + bytes_received
+
+        if duration_ms >= SLOW_QUERY_MS:
+            logger.warning(f"Slow {event.command_name} on {collection_name}", extra={"data": {
+                "stage": stage,
+                "job_id": job_id,
+                "collection": collection_name,
+                "duration_ms": round(duration_ms, 1),
+                "documents": documents,
+                "filter_shape": filter_shape(command_filter_value) if command_filter_value is not None else None,
+            }})
+
+    def pop_job(self, job_id):
+        """Returns and forgets the totals of a finished job."""
+        with self._lock:
+            job_stats = self.by_job.pop(job_id, None)
+        if job_stats:
+            job_stats["db_ms"] = round(job_stats["db_ms"], 1)
+        return job_stats
+
+    def snapshot(self, stage=None):
+        with self._lock:
+            stages = [stage] if stage else list(self.by_stage)
+            return {
+                stage_name: {
+                    command_name: stats.snapshot()
+                    for command_name, stats in self.by_stage.get(stage_name, {}).items()
+                }
+                for stage_name in stages
+            }
+
+
+command_metrics = CommandMetrics()
+
+
+def get_db_time_metrics(stage=None):
+    return command_metrics.snapshot(stage)
@@ -5,7 +5,7 @@ import datetime
 from models.app_response import AppResponse
 from models.upload import Upload
 from utils.video.transcribe import extract_transcript_from_deepgram, is_transcript_usable, tidy_transcript
-from utils.video.video_helpers import extract_and_describe_frames, summarize_description, get_video_size
+from utils.video.video_helpers import extract_and_describe_frames, summarize_description
 from utils.image.image_helpers import (
     detect_aspect_ratio,
     describe_image,
@@ -13,61 +13,91 @@ from utils.image.image_helpers import (
     is_image_logo,
     is_image_profile_pic
 )
-from moviepy.editor import VideoFileClip
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.branding import invalidate_branding
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, leased
 from lib.logger import setup_logger
+from lib.repository import get_job_attempts
+from lib.upload_readiness import count_described_upload
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from utils.exception_helpers import log_exception
+from utils.media_probe import ProbeError, probe_media
 
 logger = setup_logger(__name__)
 
-_client, db = get_db_connection()
 uploads_collection = db.uploads
 
 MAX_DESCRIPTION_ATTEMPTS = 3
-NO_UPLOADS_WAIT_SECONDS = 5
+DESCRIPTION_READY_QUERY = {
+    "status": "uploaded",
+    "description_attempts": {"$lt": MAX_DESCRIPTION_ATTEMPTS},
+}
+DESCRIPTION_QUEUE = LeasedQueue(
+    name="describe",
+    collection_name="uploads",
+    in_progress_statuses=["description_started"],
+    ready_status="uploaded",
+    failed_status="description_failed",
+    attempts_field="description_attempts",
+    max_attempts=MAX_DESCRIPTION_ATTEMPTS,
+    start_time_field="description_start_time"
+)
+# Collections and document states that may make new describe work claimable
+DESCRIBE_WAKE_TRIGGERS = [
+    ("uploads", {"status": "uploaded"}),
+]
 
 
 async def describe_upload(upload_id: str):
     try:
         # Find the upload by its ID
-        uploads_result = uploads_collection.find_one({"_id": upload_id})
+        uploads_result = await adb.uploads.find_one({"_id": upload_id})
         # breakpoint()
-        upload = Upload(**uploads_result)
+        upload = Upload(**uploads_result) if uploads_result else None
 
         if upload:
+            described_result = None
             long_description = ""
             if upload.content_type.startswith("video"):
                 logger.info(
                     f"Describing upload {upload_id} with filename {upload.filename}")
-                clip = VideoFileClip(upload.file_path)
-                duration = clip.duration
+                probe = await asyncio.to_thread(probe_media, upload.file_path)
+                # Fails before any provider call when there is no picture to describe
+                video = probe.require_video()
+                duration = probe.duration
 
-                transcript_task = extract_transcript_from_deepgram(
-                    upload.file_path, upload.content_type)
                 frames_task = extract_and_describe_frames(
                     upload.file_path, interval=4)
+                if probe.has_audio:
+                    transcript_task = extract_transcript_from_deepgram(
+                        upload.file_path, upload.content_type)
+                    raw_transcript, long_description = await asyncio.gather(transcript_task, frames_task)
+                else:
+                    # Nothing to transcribe
+                    raw_transcript, long_description = "", await frames_task
 
-                raw_transcript, long_description = await asyncio.gather(transcript_task, frames_task)
-
-                description = summarize_description(
-                    long_description, raw_transcript, duration)
+                # The provider calls below block while they wait on the rate limit
+                description = await asyncio.to_thread(
+                    summarize_description, long_description, raw_transcript, duration)
                 if not description:  # b/c sometimes summary fails so just overwrite desc with raw_desc
                     description = long_description
 
-                has_speech = len(raw_transcript) > 7 and is_transcript_usable(
-                    raw_transcript)
+                has_speech = len(raw_transcript) > 7 and await asyncio.to_thread(
+                    is_transcript_usable, raw_transcript)
 
                 if has_speech:
-                    transcript = tidy_transcript(
-                        description, raw_transcript, duration)
+                    transcript = await asyncio.to_thread(
+                        tidy_transcript, description, raw_transcript, duration)
                 else:
                     raw_transcript = ""
                     transcript = ""
 
-                video_width, video_height = get_video_size(upload.file_path)
+                video_width, video_height = video.display_size
                 video_aspect_ratio = detect_aspect_ratio(
                     video_width, video_height)
-                video_fps = clip.fps
+                video_fps = video.fps
 
                 # Calculate description duration
                 description_end_time = datetime.datetime.now()
@@ -75,8 +105,8 @@ async def describe_upload(upload_id: str):
                     description_end_time - upload.description_start_time).total_seconds()
 
                 # Update the asset description
-                uploads_collection.update_one(
-                    {"_id": upload_id},
+                described_result = await adb.uploads.update_one(
+                    {**leased(upload_id), "status": {"$ne": "description_complete"}},
                     {"$set": {
                         "description": description,
                         "has_speech": has_speech,
@@ -116,8 +146,8 @@ async def describe_upload(upload_id: str):
                     description_end_time - upload.description_start_time).total_seconds()
 
                 # Update the asset description
-                uploads_collection.update_one(
-                    {"_id": upload_id},
+                described_result = await adb.uploads.update_one(
+                    {**leased(upload_id), "status": {"$ne": "description_complete"}},
                     {"$set": {
                         "description": description,
                         "metadata.width": image_width,
@@ -131,6 +161,23 @@ async def describe_upload(upload_id: str):
                     }}
                 )
 
+            if described_result and lease_lost(described_result, upload_id):
+                return AppResponse(
+                    status="error",
+                    error={
+                        "upload_id": upload_id,
+                        "message": "Lease lost before the description was saved"
+                    }
+                )
+
+            # Only the update that moved the upload to description_complete
+            # counts it off the request, so a retried upload is counted once
+            if described_result and described_result.modified_count == 1:
+                await count_described_upload(upload.request_id)
+                # Describing an image is what marks it as the request's logo
+                if upload.content_type.startswith("image") and is_logo:
+                    await invalidate_branding(upload.request_id)
+
             return AppResponse(
                 status="success",
                 data={
@@ -147,10 +194,28 @@ async def describe_upload(upload_id: str):
                 }
             )
     except Exception as e:
-        upload = uploads_collection.find_one({"_id": upload_id})
-        if upload["description_attempts"] + 1 >= MAX_DESCRIPTION_ATTEMPTS:
-            uploads_collection.update_one(
-                {"_id": upload_id},
+        # The upload may be gone by now; a missing one has made no attempts
+        description_attempts = await get_job_attempts(
+            "uploads", upload_id, "description_attempts") or 0
+        if isinstance(e, ProbeError):
+            # The file itself is unusable, retrying won't change that
+            await adb.uploads.update_one(
+                leased(upload_id),
+                {"$set": {
+                    "status": "description_failed",
+                    "description_end_time": datetime.datetime.now(),
+                }}
+            )
+            return AppResponse(
+                status="error",
+                error={
+                    "upload_id": upload_id,
+                    "message": f"Asset description failed: {e}"
+                }
+            )
+        if description_attempts + 1 >= MAX_DESCRIPTION_ATTEMPTS:
+            await adb.uploads.update_one(
+                leased(upload_id),
                 {"$set": {
                     "status": "description_failed",
                     "description_end_time": datetime.datetime.now(),
@@ -164,26 +229,24 @@ async def describe_upload(upload_id: str):
                 }
             )
         else:
-            uploads_collection.update_one(
-                {"_id": upload_id},
+            await adb.uploads.update_one(
+                leased(upload_id),
                 {"$inc": {"description_attempts": 1},
                  "$set": {"status": "uploaded"}}
             )
             return AppResponse(
                 status="error",
                 error={
-                    "": upload_id,
+                    "upload_id": upload_id,
                     "message": f"An exception occurred: {e}"
                 }
             )
 
 
-def fetch_next_upload_for_description():
-    upload = uploads_collection.find_one_and_update(
-        {
-            "status": "uploaded",
-            "description_attempts": {"$lt": MAX_DESCRIPTION_ATTEMPTS},
-        },
+def fetch_next_uploads_for_description(limit, worker_id=WORKER_ID, lease_token=None):
+    upload_ids = claim_jobs(
+        uploads_collection,
+        DESCRIPTION_READY_QUERY,
         {
             "$set": {
                 "description_start_time": datetime.datetime.now(),
@@ -191,14 +254,25 @@ def fetch_next_upload_for_description():
                 "status": "description_started"
             }
         },
-        sort=[("_id", pymongo.ASCENDING)],
-        return_document=pymongo.ReturnDocument.AFTER
+        limit,
+        worker_id=worker_id,
+        lease_token=lease_token,
+        queue=DESCRIPTION_QUEUE
     )
 
-    if upload:
+    return AppResponse(
+        status="success",
+        data={"upload_ids": upload_ids}
+    )
+
+
+def fetch_next_upload_for_description():
+    upload_ids = fetch_next_uploads_for_description(1).data["upload_ids"]
+
+    if upload_ids:
         return AppResponse(
             status="success",
-            data={"upload_id": upload["_id"]}
+            data={"upload_id": upload_ids[0]}
         )
     else:
         return AppResponse(
@@ -207,37 +281,21 @@ def fetch_next_upload_for_description():
         )
 
 
-async def find_and_describe_uploads(max_count=None, batch_size=1):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - processed_count if max_count is not None else batch_size
-            for _ in range(min(batch_size, remaining_count)):
-                fetch_next_upload_result = fetch_next_upload_for_description()
-                upload_id = fetch_next_upload_result.data['upload_id']
-                if fetch_next_upload_result.status == "success" and upload_id:
-                    batch.append(upload_id)
-                else:
-                    break
-
-            if not batch:
-                # Wait for a short time if no assets are found
-                logger.info(
-                    f"No uploads found. Sleeping for {NO_UPLOADS_WAIT_SECONDS} seconds.")
-                await asyncio.sleep(NO_UPLOADS_WAIT_SECONDS)
-                continue
+def log_description_result(result):
+    if result.status == "error":
+        logger.error(
+            f"Failed to describe upload {result.error['upload_id']}: {result.error['message']}")
 
-            results = await asyncio.gather(*[describe_upload(upload_id) for upload_id in batch])
 
-            for result in results:
-                if result.status == "error":
-                    logger.error(
-                        f"Failed to describe upload {result.error['upload_id']}: {result.error['message']}")
-
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
-
-        except Exception as e:
-            log_exception(logger, e)
+async def find_and_describe_uploads(max_count=None, batch_size=1):
+    await run_stage_loop(
+        "describe",
+        claim_batch=lambda limit, lease_token: fetch_next_uploads_for_description(
+            limit, lease_token=lease_token).data["upload_ids"],
+        process=describe_upload,
+        handle_result=log_description_result,
+        heartbeat=LeaseHeartbeat(uploads_collection),
+        waker=StageWaker("describe", db, DESCRIBE_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
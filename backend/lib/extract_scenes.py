@@ -11,8 +11,15 @@ import asyncio
 import datetime
 import os
 import pymongo
-from lib.database import get_db_connection
+from pymongo import DeleteMany, InsertOne
+from lib.async_database import adb
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, leased, peek_jobs
 from lib.logger import setup_logger
+from lib.providers import get_instructor_openai_client
+from lib.scene_positions import initial_position
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from models.app_response import AppResponse
 from models.scene import Scene as DbScene
 from models.video import Video
@@ -21,25 +28,38 @@ from utils.exception_helpers import log_exception
 
 from pydantic import BaseModel, Field
 from typing import List
-import instructor
-from openai import OpenAI
 
 from dotenv import load_dotenv
 
 load_dotenv()
 logger = setup_logger(__name__)
-_client, db = get_db_connection()
 
 videos_collection = db.videos
-scenes_collection = db.scenes
-assets_collection = db.assets
 
 # This enables response_model keyword
 # from client.chat.completions.create
-client = instructor.patch(OpenAI())
+client = get_instructor_openai_client()
 
 MAX_SCENE_EXTRACTION_ATTEMPTS = 3
-NO_SCRIPTS_WAIT_SECONDS = 5
+SCENE_EXTRACTION_READY_QUERY = {
+    "status": "script_generation_complete",
+    "scene_extraction_attempts": {"$lt": MAX_SCENE_EXTRACTION_ATTEMPTS},
+}
+SCENE_EXTRACTION_QUEUE = LeasedQueue(
+    name="extract",
+    collection_name="videos",
+    in_progress_statuses=["scene_extraction_queued", "scene_extraction_started"],
+    ready_status="script_generation_complete",
+    failed_status="scene_extraction_failed",
+    attempts_field="scene_extraction_attempts",
+    max_attempts=MAX_SCENE_EXTRACTION_ATTEMPTS,
+    attempts_counted_on_claim=True,
+    start_time_field="scene_extraction_start_time"
+)
+# Collections and document states that may make new extract work claimable
+EXTRACT_WAKE_TRIGGERS = [
+    ("videos", {"status": "script_generation_complete"}),
+]
 
 
 class Scene(BaseModel):
@@ -131,8 +151,8 @@ Each scene should have a narration and an optional list of asset_filenames if me
 
 
 async def extract_scenes(video_id, change_status=True):
-    video_result = videos_collection.find_one_and_update(
-        {"_id": video_id},
+    video_result = await adb.videos.find_one_and_update(
+        leased(video_id),
         {"$set": {
             "status": "scene_extraction_started",
             "scene_extraction_start_time": datetime.datetime.now(),
@@ -142,17 +162,26 @@ async def extract_scenes(video_id, change_status=True):
         sort=[("_id", pymongo.ASCENDING)],
         return_document=pymongo.ReturnDocument.AFTER
     )
+    if lease_lost(video_result, video_id):
+        return AppResponse(
+            status="error",
+            error={
+                "message": f"Lease on video {video_id} lost before scene extraction started",
+                "video_id": video_id
+            }
+        )
     video = Video(**video_result)
-    asset_dicts = list(assets_collection.find(
+    asset_dicts = await adb.assets.find(
         {
             "status": "converted",
             "request_id": video.request_id,
             "metadata.aspect_ratio": video.aspect_ratio
-        }))
+        }).to_list(None)
     assets = [Asset(**asset_dict) for asset_dict in asset_dicts]
     try:
-        event_video_obj = generate_scenes_with_llm(video, assets)
-        scenes_collection.delete_many({"video_id": video_id})
+        # Blocks on the provider and its rate limit, so keep it off the loop
+        event_video_obj = await asyncio.to_thread(
+            generate_scenes_with_llm, video, assets)
         scenes = []
         for index, scene in enumerate(event_video_obj.scenes):
             if index == 0:
@@ -169,54 +198,49 @@ async def extract_scenes(video_id, change_status=True):
                 "status": "generated",
                 "video_id": video_id,
                 "request_id": video.request_id,
-                "aspect_ratio": video.aspect_ratio
+                "aspect_ratio": video.aspect_ratio,
+                "position": initial_position(index)
             }
             new_scene = DbScene(**new_scene_dict)
             scenes.append(new_scene.model_dump(by_alias=True))
 
-        # Insert scenes as a doubly linked list in the scenes collection
-        for i in range(len(scenes)):
-            if i < len(scenes) - 1:
-                # Set the next_scene_id to None for now
-                scenes[i]["next_scene_id"] = None
-            else:
-                # Last scene has no next scene
-                scenes[i]["next_scene_id"] = None
-
-            if i > 0:
-                # Set the prev_scene_id to None for now
-                scenes[i]["prev_scene_id"] = None
-            else:
-                # First scene has no previous scene
-                scenes[i]["prev_scene_id"] = None
-
-        # Insert scenes into the scenes collection
-        inserted_scenes = db.scenes.insert_many(scenes)
-
-        # Update the next_scene_id and prev_scene_id for each scene
-        for i in range(len(inserted_scenes.inserted_ids)):
-            if i < len(inserted_scenes.inserted_ids) - 1:
-                db.scenes.update_one(
-                    {"_id": inserted_scenes.inserted_ids[i]},
-                    {"$set": {
-                        "next_scene_id": inserted_scenes.inserted_ids[i + 1]}}
-                )
-
-            if i > 0:
-                db.scenes.update_one(
-                    {"_id": inserted_scenes.inserted_ids[i]},
-                    {"$set": {
-                        "prev_scene_id": inserted_scenes.inserted_ids[i - 1]}}
-                )
+        # Reset the readiness counters before the scenes exist, so narration
+        # can never finish a scene before it has been counted
+        counters_result = await adb.videos.update_one(
+            leased(video_id),
+            {"$set": {
+                "scenes_total": len(scenes),
+                "scenes_pending": len(scenes),
+                "scenes_narrated": 0,
+                "narrated_scene_ids": []
+            }}
+        )
+        if lease_lost(counters_result, video_id):
+            # The new lessee replaces the scenes itself
+            return AppResponse(
+                status="error",
+                error={
+                    "message": f"Lease on video {video_id} lost before its scenes were saved",
+                    "video_id": video_id
+                }
+            )
+
+        # Replace the video's scenes in one ordered round trip
+        await adb.scenes.bulk_write(
+            [DeleteMany({"video_id": video_id})] +
+            [InsertOne(scene) for scene in scenes],
+            ordered=True
+        )
 
         scene_extraction_end_time = datetime.datetime.now()
         scene_extraction_duration = (
             scene_extraction_end_time - video.scene_extraction_start_time).total_seconds()
-        videos_collection.update_one(
-            {"_id": video_id},
+        await adb.videos.update_one(
+            leased(video_id),
             {
                 "$set": {
                     "status": "scene_extraction_complete",
+                    "scenes_checked_at": scene_extraction_end_time,
                     "scene_extraction_end_time": scene_extraction_end_time,
                     "scene_extraction_duration": scene_extraction_duration
                 },
@@ -231,8 +255,8 @@ async def extract_scenes(video_id, change_status=True):
             }
         )
     except Exception as e:
-        videos_collection.update_one(
-            {"_id": video_id},
+        await adb.videos.update_one(
+            leased(video_id),
             {
                 "$set": {
                     "status": "script_generation_complete"
@@ -250,13 +274,13 @@ async def extract_scenes(video_id, change_status=True):
         )
 
 
-def fetch_next_video_for_scene_extraction(change_status=True):
+def fetch_next_videos_for_scene_extraction(limit, change_status=True, worker_id=WORKER_ID, lease_token=None):
+    query = SCENE_EXTRACTION_READY_QUERY
+
     if change_status:
-        video_result = videos_collection.find_one_and_update(
-            {
-                "status": "script_generation_complete",
-                "scene_extraction_attempts": {"$lt": MAX_SCENE_EXTRACTION_ATTEMPTS},
-            },
+        video_ids = claim_jobs(
+            videos_collection,
+            query,
             {
                 "$set": {
                     "scene_extraction_start_time": datetime.datetime.now(),
@@ -265,62 +289,51 @@ def fetch_next_video_for_scene_extraction(change_status=True):
                 },
                 "$inc": {"scene_extraction_attempts": 1}
             },
-            sort=[("_id", pymongo.ASCENDING)],
-            return_document=pymongo.ReturnDocument.AFTER
+            limit,
+            worker_id=worker_id,
+            lease_token=lease_token,
+            queue=SCENE_EXTRACTION_QUEUE
         )
     else:
-        video_result = videos_collection.find_one({
-            "status": "script_generation_complete",
-            "scene_extraction_attempts": {"$lt": MAX_SCENE_EXTRACTION_ATTEMPTS}
-        },
-            sort=[("_id", pymongo.ASCENDING)],
-            return_document=pymongo.ReturnDocument.AFTER)
-
-    if video_result:
+        video_ids = peek_jobs(videos_collection, query, limit)
+
+    return AppResponse(
+        status="success",
+        data={"video_ids": video_ids}
+    )
+
+
+def fetch_next_video_for_scene_extraction(change_status=True):
+    video_ids = fetch_next_videos_for_scene_extraction(
+        1, change_status=change_status).data["video_ids"]
+
+    if video_ids:
         return AppResponse(
             status="success",
-            data={"video_id": video_result["_id"]}
+            data={"video_id": video_ids[0]}
         )
     else:
         return AppResponse(
             status="success",
-            data={"aspect_ratio_id": None,
-                  "message": "No video request format found"}
+            data={"video_id": None,
+                  "message": "No video found for scene extraction"}
         )
 
 
+def log_scene_extraction_result(result):
+    if result.status == "error":
+        logger.error(result.error["message"])
+
+
 async def find_scripted_videos_and_extract_scenes(max_count=None, batch_size=1, change_status=True):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - \
-                processed_count if max_count else float('inf')
-            for _ in range(min(batch_size, remaining_count)):
-                fetch_next_video_result = fetch_next_video_for_scene_extraction(
-                    change_status=change_status)
-                video_id = fetch_next_video_result.data.get("video_id")
-                if video_id:
-                    batch.append(video_id)
-                else:
-                    break
-
-            if not batch:
-                logger.info(
-                    f"No videos found for scene extraction. Sleeping for {NO_SCRIPTS_WAIT_SECONDS} seconds")
-                await asyncio.sleep(NO_SCRIPTS_WAIT_SECONDS)
-                continue
-
-            results = await asyncio.gather(*[extract_scenes(video_id, change_status) for video_id in batch])
-
-            for result in results:
-                if result.status == "error":
-                    logger.error(
-                        f"Error extracting scenes for video {video_id}. Error: {result.message}")
-
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
-
-        except Exception as e:
-            log_exception(logger, e)
+    await run_stage_loop(
+        "extract",
+        claim_batch=lambda limit, lease_token: fetch_next_videos_for_scene_extraction(
+            limit, lease_token=lease_token, change_status=change_status).data["video_ids"],
+        process=lambda video_id: extract_scenes(video_id, change_status),
+        handle_result=log_scene_extraction_result,
+        heartbeat=LeaseHeartbeat(videos_collection),
+        waker=StageWaker("extract", db, EXTRACT_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
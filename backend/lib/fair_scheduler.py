@@ -0,0 +1,102 @@
+import heapq
+import os
+import pymongo
+
+# Set FAIR_SCHEDULING=false to go back to plain _id order across all requests
+FAIR_SCHEDULING = os.getenv("FAIR_SCHEDULING", "true").lower() == "true"
+# How many of the oldest ready jobs each fair claim groups by request. Bounds
+# the aggregate however deep a queue gets; a request with nothing among them
+# waits until the backlog ahead of it drains below this many jobs.
+FAIR_SCAN_LIMIT = int(os.getenv("FAIR_SCAN_LIMIT", 1000))
+
+
+def request_weight(priority):
+    # Priority 0 (the default) gets one share, each step above adds another
+    return 1 + max(priority or 0, 0)
+
+
+def allocate_fair_share(ready_by_request, running_by_request, weights, limit):
+    """
+    Picks up to `limit` job ids, each time from the request with the fewest
+    running jobs per unit of weight. Ties go to the request whose oldest ready
+    job is oldest, so equal requests are served round-robin in arrival order.
+    """
+    running = dict(running_by_request)
+    heap = []
+    for request_id, job_ids in ready_by_request.items():
+        weight = weights.get(request_id, 1)
+        heap.append((running.get(request_id, 0) / weight, job_ids[0], request_id))
+    heapq.heapify(heap)
+
+    picked = []
+    while heap and len(picked) < limit:
+        _share, job_id, request_id = heapq.heappop(heap)
+        picked.append(job_id)
+        running[request_id] = running.get(request_id, 0) + 1
+        remaining = ready_by_request[request_id]
+        remaining.pop(0)
+        if remaining:
+            weight = weights.get(request_id, 1)
+            heapq.heappush(
+                heap, (running[request_id] / weight, remaining[0], request_id))
+
+    return picked
+
+
+def fair_share_candidates(collection, query, in_progress_statuses, limit, sort=[("_id", pymongo.ASCENDING)], scan_limit=FAIR_SCAN_LIMIT):
+    """
+    Returns up to `limit` ids matching `query`, shared fairly across the
+    request_ids of the oldest `scan_limit` ready jobs. `query` and `sort` are a
+    queue's claim filter and order, so the $match, $sort and $limit walk that
+    queue's index and the $group sees at most `scan_limit` documents.
+    Needs MongoDB 5.2 or later for $firstN.
+    """
+    ready_groups = collection.aggregate([
+        {"$match": query},
+        {"$sort": dict(sort)},
+        {"$limit": max(scan_limit, limit)},
+        {"$group": {
+            "_id": "$request_id",
+            "job_ids": {"$firstN": {"input": "$_id", "n": limit}}
+        }}
+    ])
+    ready_by_request = {group["_id"]: group["job_ids"]
+                        for group in ready_groups}
+    if not ready_by_request:
+        return []
+
+    request_ids = list(ready_by_request.keys())
+    running_groups = collection.aggregate([
+        {"$match": {
+            "status": {"$in": in_progress_statuses},
+            "request_id": {"$in": request_ids}
+        }},
+        {"$group": {"_id": "$request_id", "count": {"$sum": 1}}}
+    ])
+    running_by_request = {group["_id"]: group["count"]
+                          for group in running_groups}
+
+    video_requests = collection.database.video_requests.find(
+        {"_id": {"$in": request_ids}, "priority": {"$gt": 0}},
+        {"priority": 1}
+    )
+    weights = {video_request["_id"]: request_weight(video_request["priority"])
+               for video_request in video_requests}
+
+    return allocate_fair_share(ready_by_request, running_by_request, weights, limit)
+
+
+def queue_depth_by_request(collection, queue):
+    """Counts ready and in-progress jobs of a LeasedQueue for every request that has any."""
+    groups = collection.aggregate([
+        {"$match": {"status": {"$in": [queue.ready_status, *queue.in_progress_statuses]}}},
+        {"$group": {
+            "_id": "$request_id",
+            "ready": {"$sum": {"$cond": [{"$eq": ["$status", queue.ready_status]}, 1, 0]}},
+            "in_progress": {"$sum": {"$cond": [{"$eq": ["$status", queue.ready_status]}, 0, 1]}}
+        }}
+    ])
+    return {
+        group["_id"]: {"ready": group["ready"], "in_progress": group["in_progress"]}
+        for group in groups
+    }
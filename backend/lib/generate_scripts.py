@@ -2,13 +2,17 @@ from bson.objectid import ObjectId
 import asyncio
 import datetime
 import math
-import openai
 import os
 import pymongo
 from dotenv import load_dotenv
 from typing import List
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, leased, peek_jobs
 from lib.logger import setup_logger
+from lib.providers import get_openai_client
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from models.asset import Asset
 from models.app_response import AppResponse
 from models.video import Video
@@ -18,23 +22,34 @@ from utils.exception_helpers import log_exception
 load_dotenv()
 logger = setup_logger(__name__)
 
-NO_VIDEO_SCRIPTS_WAIT_SECONDS = 5
 MAX_GENERATION_ATTEMPTS = 3
+SCRIPT_GENERATION_READY_QUERY = {
+    "status": "requested",
+    "script_generation_attempts": {"$lt": MAX_GENERATION_ATTEMPTS},
+}
+SCRIPT_GENERATION_QUEUE = LeasedQueue(
+    name="script",
+    collection_name="videos",
+    in_progress_statuses=["script_generation_started"],
+    ready_status="requested",
+    failed_status="script_generation_failed",
+    attempts_field="script_generation_attempts",
+    max_attempts=MAX_GENERATION_ATTEMPTS,
+    start_time_field="script_generation_processing_start_time"
+)
+# Collections and document states that may make new script work claimable
+SCRIPT_WAKE_TRIGGERS = [
+    ("videos", {"status": "requested"}),
+]
 
-_client, db = get_db_connection()
 videos_collection = db.videos
-assets_collection = db.assets
 
 
 def generate_title_and_script(video: Video, assets: List[Asset]):
     video_json = video.model_dump_json(indent=2)
     assets_json = [asset.model_dump_json(indent=2) for asset in assets]
 
-    # api_token = os.getenv("MISTRAL_API_KEY")
-    client = openai.OpenAI(
-        # base_url="https://api.mistral.ai/v1",
-        # api_key=api_token
-    )
+    client = get_openai_client()
 
     number_of_words = math.ceil(2.5 * video.length)
 
@@ -122,25 +137,27 @@ def generate_title_and_script(video: Video, assets: List[Asset]):
 
 
 async def generate_script(video_id, change_status=True):
-    video = Video(**videos_collection.find_one({"_id": video_id}))
-    asset_dicts = list(assets_collection.find(
+    video = Video(**await adb.videos.find_one({"_id": video_id}))
+    asset_dicts = await adb.assets.find(
         {
             "status": "converted",
             "request_id": video.request_id,
             "metadata.aspect_ratio": video.aspect_ratio
-        }))
+        }).to_list(None)
     assets = [Asset(**asset_dict) for asset_dict in asset_dicts]
     print(assets)
     print(video)
     if video and len(assets) > 0:
         try:
-            title, script = generate_title_and_script(video, assets)
+            # Blocks on the provider and its rate limit, so keep it off the loop
+            title, script = await asyncio.to_thread(
+                generate_title_and_script, video, assets)
             script_generation_processing_end_time = datetime.datetime.now()
             script_generation_processing_duration = (
                 script_generation_processing_end_time - video.script_generation_processing_start_time).total_seconds()
             if change_status:
-                videos_collection.update_one(
-                    {"_id": video.id},
+                script_result = await adb.videos.update_one(
+                    leased(video.id),
                     {
                         "$set": {
                             "title": title,
@@ -153,6 +170,17 @@ async def generate_script(video_id, change_status=True):
                         }
                     }
                 )
+                if lease_lost(script_result, video_id):
+                    return AppResponse(
+                        status="error",
+                        data={"video_id": video_id,
+                              "message": f"Lease on video {video_id} lost before its script was saved"}
+                    )
+            return AppResponse(
+                status="success",
+                data={"video_id": video_id,
+                      "message": f"Generated script for video {video_id}"}
+            )
         except Exception as e:
             log_exception(logger, e)
             return AppResponse(
@@ -160,32 +188,49 @@ async def generate_script(video_id, change_status=True):
                 data={"video_id": video_id,
                       "message": f"Error generating script for video {video_id}: {e}"}
             )
+    return AppResponse(
+        status="error",
+        data={"video_id": video_id,
+              "message": f"No converted assets found for video {video_id}"}
+    )
 
 
-def fetch_next_video_for_script_generation(change_status=True):
-    video_result = videos_collection.find_one(
-        {
-            "status": "requested",
-        },
-        sort=[("_id", pymongo.ASCENDING)]
-    )
+def fetch_next_videos_for_script_generation(limit, change_status=True, worker_id=WORKER_ID, lease_token=None):
+    query = SCRIPT_GENERATION_READY_QUERY
 
-    if video_result:
-        video = Video(**video_result)
-        if change_status:
-            videos_collection.update_one(
-                {"_id": video.id},
-                {
-                    "$set": {
-                        "script_generation_processing_start_time": datetime.datetime.now(),
-                        "script_generation_processing_end_time": None,
-                        "status": "script_generation_started"
-                    }
+    if change_status:
+        video_ids = claim_jobs(
+            videos_collection,
+            query,
+            {
+                "$set": {
+                    "script_generation_processing_start_time": datetime.datetime.now(),
+                    "script_generation_processing_end_time": None,
+                    "status": "script_generation_started"
                 }
-            )
+            },
+            limit,
+            worker_id=worker_id,
+            lease_token=lease_token,
+            queue=SCRIPT_GENERATION_QUEUE
+        )
+    else:
+        video_ids = peek_jobs(videos_collection, query, limit)
+
+    return AppResponse(
+        status="success",
+        data={"video_ids": video_ids}
+    )
+
+
+def fetch_next_video_for_script_generation(change_status=True):
+    video_ids = fetch_next_videos_for_script_generation(
+        1, change_status=change_status).data["video_ids"]
+
+    if video_ids:
         return AppResponse(
             status="success",
-            data={"video_id": video.id}
+            data={"video_id": video_ids[0]}
         )
     else:
         return AppResponse(
@@ -195,38 +240,21 @@ def fetch_next_video_for_script_generation(change_status=True):
         )
 
 
-async def find_videos_and_generate_scripts(max_count=None, batch_size=1, change_status=True):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - processed_count if max_count else None
-            for _ in range(batch_size):
-                fetch_next_video_result = fetch_next_video_for_script_generation(
-                    change_status=change_status)
-                video_id = fetch_next_video_result.data.get("video_id")
-                if video_id:
-                    batch.append(video_id)
-                else:
-                    break
-
-            if not batch:
-                # Wait for a short time if no videos are found
-                logger.info(
-                    f"No videos for script generation found. Sleeping for {NO_VIDEO_SCRIPTS_WAIT_SECONDS} seconds.")
-                await asyncio.sleep(NO_VIDEO_SCRIPTS_WAIT_SECONDS)
-                continue
-
-            results = await asyncio.gather(*[generate_script(video_id, change_status=change_status) for video_id in batch])
-
-            for result in results:
-                if result.status == "error":
-                    logger.error(
-                        f"Error generating script for video {video_id}: {result.message}")
-
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
+def log_script_generation_result(result):
+    if result.status == "error":
+        logger.error(result.data["message"])
 
-        except Exception as e:
-            log_exception(logger, e)
+
+async def find_videos_and_generate_scripts(max_count=None, batch_size=1, change_status=True):
+    await run_stage_loop(
+        "script",
+        claim_batch=lambda limit, lease_token: fetch_next_videos_for_script_generation(
+            limit, lease_token=lease_token, change_status=change_status).data["video_ids"],
+        process=lambda video_id: generate_script(
+            video_id, change_status=change_status),
+        handle_result=log_script_generation_result,
+        heartbeat=LeaseHeartbeat(videos_collection),
+        waker=StageWaker("script", db, SCRIPT_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
@@ -0,0 +1,250 @@
+import datetime
+import pymongo
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, Tuple
+from lib.database import db
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ASC = pymongo.ASCENDING
+
+# Bump whenever INDEXES changes so running deployments pick the change up on
+# their next start. Indexes dropped from INDEXES are dropped from the database.
+INDEX_VERSION = 1
+MIGRATIONS_COLLECTION = "schema_migrations"
+INDEX_MIGRATION_ID = "indexes"
+
+
+class IndexSpec(BaseModel):
+    name: str
+    keys: List[Tuple[str, int]]
+
+
+def queue_index(attempts_field):
+    # Equality on status, then _id so claims walk the index in claim order
+    # without an in-memory sort, then the attempts range filter
+    return [("status", ASC), ("_id", ASC), (attempts_field, ASC)]
+
+
+def lease_index():
+    # Reaper: in-progress statuses whose lease has expired
+    return IndexSpec(name="status_lease_expires_at", keys=[("status", ASC), ("lease_expires_at", ASC)])
+
+
+INDEXES: Dict[str, List[IndexSpec]] = {
+    "uploads": [
+        IndexSpec(name="description_queue",
+                  keys=queue_index("description_attempts")),
+        lease_index(),
+        IndexSpec(name="request_id_filename",
+                  keys=[("request_id", ASC), ("filename", ASC)]),
+        IndexSpec(name="request_id_is_logo",
+                  keys=[("request_id", ASC), ("metadata.is_logo", ASC)]),
+    ],
+    "video_request_aspect_ratios": [
+        IndexSpec(name="conversion_queue_uploads_ready",
+                  keys=[("status", ASC), ("uploads_ready", ASC), ("_id", ASC), ("conversion_attempts", ASC)]),
+        lease_index(),
+        IndexSpec(name="request_id_aspect_ratio",
+                  keys=[("request_id", ASC), ("aspect_ratio", ASC)]),
+        # Spawn claim: aspect ratios that have been converted
+        IndexSpec(name="status_aspect_ratio",
+                  keys=[("status", ASC), ("aspect_ratio", ASC)]),
+    ],
+    "video_request_formats": [
+        IndexSpec(name="spawning_queue",
+                  keys=[("status", ASC), ("aspect_ratio", ASC), ("_id", ASC)]),
+        lease_index(),
+        IndexSpec(name="request_id_status",
+                  keys=[("request_id", ASC), ("status", ASC)]),
+    ],
+    "videos": [
+        IndexSpec(name="script_generation_queue",
+                  keys=queue_index("script_generation_attempts")),
+        IndexSpec(name="scene_extraction_queue",
+                  keys=queue_index("scene_extraction_attempts")),
+        # Render claim: extracted videos with every scene narrated, walked in
+        # _id order like the other queues
+        IndexSpec(name="render_queue",
+                  keys=[("status", ASC), ("scenes_pending", ASC), ("_id", ASC), ("processing_attempts", ASC)]),
+        # Stalled-video recount: extracted videos whose scenes have gone quiet
+        IndexSpec(name="status_scenes_checked_at",
+                  keys=[("status", ASC), ("scenes_checked_at", ASC)]),
+        lease_index(),
+        IndexSpec(name="request_id", keys=[("request_id", ASC)]),
+    ],
+    "scenes": [
+        IndexSpec(name="narration_queue",
+                  keys=queue_index("scene_narration_attempts")),
+        lease_index(),
+        IndexSpec(name="video_id_position", keys=[("video_id", ASC), ("position", ASC)]),
+    ],
+    "assets": [
+        # Render: AssetResolver's per-request $in lookup by filename
+        IndexSpec(name="request_id_aspect_ratio_filename", keys=[
+            ("request_id", ASC), ("metadata.aspect_ratio", ASC), ("filename", ASC)]),
+        IndexSpec(name="request_id_status_aspect_ratio", keys=[
+            ("request_id", ASC), ("status", ASC), ("metadata.aspect_ratio", ASC)]),
+    ],
+}
+
+
+class CanonicalQuery(BaseModel):
+    collection_name: str
+    filter: Dict[str, Any]
+    sort: Optional[List[Tuple[str, int]]] = None
+
+
+def canonical_queries():
+    """
+    The hot queries each index above exists for, checked by `check_indexes`.
+    Claims use the stages' own filters and claim_jobs' sort, so the check
+    explains exactly what the workers run. A fair claim's aggregate opens with
+    the same $match and $sort before its $limit, so the claim covers it too.
+    """
+    # Imported here because the stage modules import this one via lib.worker_pool
+    from lib.convert_assets import CONVERSION_READY_QUERY
+    from lib.describe_uploads import DESCRIPTION_READY_QUERY
+    from lib.extract_scenes import SCENE_EXTRACTION_READY_QUERY
+    from lib.generate_scripts import SCRIPT_GENERATION_READY_QUERY
+    from lib.job_queue import DEFAULT_SORT
+    from lib.narrate_scenes import NARRATION_READY_QUERY
+    from lib.process_scenes import RENDER_READY_QUERY
+    from lib.reaper import expired_lease_query
+    from lib.scene_counters import STALLED_VIDEO_SORT, stalled_video_query
+    from lib.spawn_videos import spawning_ready_query
+    from lib.supervisor import LEASED_QUEUES
+
+    claims = [
+        ("uploads", DESCRIPTION_READY_QUERY),
+        ("video_request_aspect_ratios", CONVERSION_READY_QUERY),
+        ("video_request_aspect_ratios", {
+         **CONVERSION_READY_QUERY, "request_id": "", "_id": {"$ne": ""}}),
+        ("video_request_formats", spawning_ready_query(["9x16"])),
+        ("videos", SCRIPT_GENERATION_READY_QUERY),
+        ("videos", SCENE_EXTRACTION_READY_QUERY),
+        ("scenes", NARRATION_READY_QUERY),
+        ("videos", RENDER_READY_QUERY),
+    ]
+    queries = [
+        CanonicalQuery(collection_name=collection_name,
+                       filter=query, sort=DEFAULT_SORT)
+        for collection_name, query in claims
+    ]
+    now = datetime.datetime.now()
+    for queue in LEASED_QUEUES:
+        queries += [
+            # Reaper sweep
+            CanonicalQuery(collection_name=queue.collection_name,
+                           filter=expired_lease_query(queue, now)),
+            # Fair claims count the running jobs of the candidates' requests
+            CanonicalQuery(collection_name=queue.collection_name, filter={
+                           "status": {"$in": queue.in_progress_statuses}, "request_id": {"$in": [""]}}),
+        ]
+    return queries + [
+        CanonicalQuery(collection_name="uploads", filter={
+                       "request_id": "", "filename": ""}),
+        CanonicalQuery(collection_name="uploads", filter={
+                       "request_id": "", "metadata.is_logo": True}),
+        CanonicalQuery(collection_name="video_request_aspect_ratios",
+                       filter={"status": "converted"}),
+        CanonicalQuery(collection_name="videos", filter=stalled_video_query(now),
+                       sort=STALLED_VIDEO_SORT),
+        CanonicalQuery(collection_name="scenes",
+                       filter={"video_id": ""}, sort=[("position", ASC)]),
+        CanonicalQuery(collection_name="scenes", filter={
+                       "video_id": "", "status": {"$ne": "narration_complete"}}),
+        CanonicalQuery(collection_name="assets", filter={
+                       "request_id": "", "metadata.aspect_ratio": "9x16", "filename": {"$in": [""]}}),
+        CanonicalQuery(collection_name="assets", filter={
+                       "status": "converted", "request_id": "", "metadata.aspect_ratio": "9x16"}),
+    ]
+
+
+def apply_indexes(db):
+    """Creates every index in INDEXES and drops the ones a previous version managed but no longer declares."""
+    migration = db.get_collection(MIGRATIONS_COLLECTION).find_one(
+        {"_id": INDEX_MIGRATION_ID}) or {}
+    previous_names = migration.get("index_names", {})
+
+    for collection_name, specs in INDEXES.items():
+        collection = db.get_collection(collection_name)
+        collection.create_indexes([
+            pymongo.IndexModel(spec.keys, name=spec.name) for spec in specs
+        ])
+        current_names = {spec.name for spec in specs}
+        for stale_name in set(previous_names.get(collection_name, [])) - current_names:
+            logger.info(f"Dropping index {collection_name}.{stale_name}")
+            collection.drop_index(stale_name)
+
+    db.get_collection(MIGRATIONS_COLLECTION).update_one(
+        {"_id": INDEX_MIGRATION_ID},
+        {"$set": {
+            "version": INDEX_VERSION,
+            "index_names": {
+                collection_name: [spec.name for spec in specs]
+                for collection_name, specs in INDEXES.items()
+            },
+            "applied_at": datetime.datetime.now()
+        }},
+        upsert=True
+    )
+
+
+_indexes_ensured = False
+
+
+def ensure_indexes(force=False):
+    """
+    Brings the database's indexes up to INDEX_VERSION. Cheap after the first
+    call in a process, and after the first process, so every worker and the API
+    call it on startup.
+    """
+    global _indexes_ensured
+    if _indexes_ensured and not force:
+        return
+
+    migration = db.get_collection(MIGRATIONS_COLLECTION).find_one(
+        {"_id": INDEX_MIGRATION_ID}, {"version": 1})
+    applied_version = migration["version"] if migration else 0
+
+    if force or applied_version < INDEX_VERSION:
+        logger.info(
+            f"Migrating indexes from version {applied_version} to {INDEX_VERSION}")
+        apply_indexes(db)
+
+    _indexes_ensured = True
+
+
+def plan_stages(plan):
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from plan_stages(plan["inputStage"])
+    for input_stage in plan.get("inputStages", []):
+        yield from plan_stages(input_stage)
+
+
+def check_indexes():
+    """
+    Explains every canonical query and returns the ones whose winning plan
+    scans the whole collection or sorts in memory.
+    """
+    problems = []
+    for query in canonical_queries():
+        cursor = db.get_collection(query.collection_name).find(query.filter)
+        if query.sort:
+            cursor = cursor.sort(query.sort)
+        winning_plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        # Servers using the slot-based engine nest the classic plan under queryPlan
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        stages = set(plan_stages(winning_plan))
+        for stage in ("COLLSCAN", "SORT"):
+            if stage in stages:
+                problems.append({
+                    "collection": query.collection_name,
+                    "filter": query.filter,
+                    "sort": query.sort,
+                    "stage": stage
+                })
+    return problems
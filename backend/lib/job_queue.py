@@ -0,0 +1,244 @@
+import contextlib
+import contextvars
+import copy
+import datetime
+import os
+import socket
+import threading
+import pymongo
+from bson.objectid import ObjectId
+from pydantic import BaseModel
+from typing import List
+from lib.fair_scheduler import FAIR_SCHEDULING, fair_share_candidates
+from lib.logger import setup_logger
+from utils.exception_helpers import log_exception
+
+logger = setup_logger(__name__)
+
+# Identifies the process holding a lease, e.g. "render-box-1:4242"
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+DEFAULT_SORT = [("_id", pymongo.ASCENDING)]
+
+# A claimed job must be heartbeated within this many seconds or the reaper
+# hands it back to the queue
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", 300))
+HEARTBEATS_PER_LEASE = 3
+
+# The lease token of the job being processed. run_stage_loop sets it around
+# each job so the job's completion and requeue writes can check it still holds
+# the lease, see `leased`.
+current_lease_token = contextvars.ContextVar(
+    "current_lease_token", default=None)
+
+
+class LeasedQueue(BaseModel):
+    """Describes where a stage keeps its jobs and how to requeue stranded ones."""
+    name: str
+    collection_name: str
+    in_progress_statuses: List[str]
+    ready_status: str
+    failed_status: str
+    attempts_field: str
+    max_attempts: int
+    # Stages that $inc attempts when claiming must not count the attempt again on requeue
+    attempts_counted_on_claim: bool = False
+    start_time_field: str
+
+
+def new_lease_token():
+    return str(ObjectId())
+
+
+@contextlib.contextmanager
+def lease_scope(lease_token):
+    """Makes `leased` filters inside the block check `lease_token`."""
+    token = current_lease_token.set(lease_token)
+    try:
+        yield
+    finally:
+        current_lease_token.reset(token)
+
+
+def leased(job_id, lease_token=None):
+    """
+    Filter for a write that must only land while the job is still leased by
+    us. A job whose lease was reaped and reclaimed carries another token, so
+    the write matches nothing; see `lease_lost`. Outside a lease (one-off runs
+    that didn't claim the job) it filters on the id alone.
+    """
+    lease_token = lease_token or current_lease_token.get()
+    if lease_token is None:
+        return {"_id": job_id}
+    return {"_id": job_id, "lease_token": lease_token}
+
+
+def lease_lost(result, job_id):
+    """
+    True when a `leased` write matched nothing because another worker holds
+    the job now; the caller must then leave the job alone. Takes an
+    UpdateResult or a find_one_and_update document.
+    """
+    matched = result.matched_count if hasattr(
+        result, "matched_count") else result is not None
+    if not matched:
+        logger.warning(
+            f"Lease on job {job_id} was lost to another worker, dropping this run's result")
+        return True
+    return False
+
+
+def lease_expiry(lease_seconds=LEASE_SECONDS):
+    return datetime.datetime.now() + datetime.timedelta(seconds=lease_seconds)
+
+
+def with_lease(update, worker_id, lease_token, lease_seconds=LEASE_SECONDS):
+    lease_update = copy.deepcopy(update)
+    lease_update.setdefault("$set", {}).update({
+        "worker_id": worker_id,
+        "lease_token": lease_token,
+        "lease_expires_at": lease_expiry(lease_seconds)
+    })
+    return lease_update
+
+
+def claim_jobs(collection, query, update, limit, worker_id=WORKER_ID, sort=DEFAULT_SORT, lease_seconds=LEASE_SECONDS, queue=None, lease_token=None):
+    """
+    Leases up to `limit` documents matching `query` by applying `update` to them,
+    tagging each with `worker_id`, a lease token (`lease_token`, or a fresh
+    one) and a lease expiry that the worker keeps pushing forward with a
+    LeaseHeartbeat.
+
+    When `queue` (a LeasedQueue) is given and FAIR_SCHEDULING is on, candidates
+    are shared across request_ids so one large request cannot starve the rest.
+    Otherwise a single job is claimed with one find_one_and_update and larger
+    claims take the first `limit` candidates in `sort` order.
+
+    Candidates are updated with `query` re-applied so documents taken by a
+    concurrent worker are skipped, and the ones carrying our lease token are
+    read back only when some were lost to another worker.
+
+    Returns the claimed ids in candidate order.
+    """
+    if limit <= 0:
+        return []
+
+    lease_token = lease_token or new_lease_token()
+    lease_update = with_lease(update, worker_id, lease_token, lease_seconds)
+
+    if queue is not None and FAIR_SCHEDULING:
+        candidate_ids = fair_share_candidates(
+            collection, query, queue.in_progress_statuses, limit, sort)
+        return lease_candidates(collection, query, lease_update, lease_token, candidate_ids)
+
+    if limit == 1:
+        claimed = collection.find_one_and_update(
+            query,
+            lease_update,
+            projection={"_id": 1},
+            sort=sort,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        return [claimed["_id"]] if claimed else []
+
+    candidate_ids = [
+        candidate["_id"] for candidate in
+        collection.find(query, {"_id": 1}, sort=sort, limit=limit)
+    ]
+    return lease_candidates(collection, query, lease_update, lease_token, candidate_ids)
+
+
+def lease_candidates(collection, query, lease_update, lease_token, candidate_ids):
+    if not candidate_ids:
+        return []
+
+    update_result = collection.update_many(
+        {**query, "_id": {"$in": candidate_ids}},
+        lease_update
+    )
+    if update_result.modified_count == len(candidate_ids):
+        return candidate_ids
+
+    claimed_ids = {
+        claimed["_id"] for claimed in
+        collection.find({"_id": {"$in": candidate_ids}, "lease_token": lease_token}, {"_id": 1})
+    }
+    return [candidate_id for candidate_id in candidate_ids if candidate_id in claimed_ids]
+
+
+def peek_jobs(collection, query, limit, sort=DEFAULT_SORT):
+    """Returns the ids `claim_jobs` would lease, without changing anything."""
+    if limit <= 0:
+        return []
+    return [
+        candidate["_id"] for candidate in
+        collection.find(query, {"_id": 1}, sort=sort, limit=limit)
+    ]
+
+
+def renew_leases(collection, leases, worker_id=WORKER_ID, lease_seconds=LEASE_SECONDS):
+    """
+    Extends the leases in `leases`, (job_id, lease_token) pairs, in one
+    update_many. A job that was reaped and claimed again carries a new token,
+    so a stale heartbeat for it renews nothing.
+    """
+    job_ids_by_token = {}
+    for job_id, lease_token in leases:
+        job_ids_by_token.setdefault(lease_token, []).append(job_id)
+    if not job_ids_by_token:
+        return 0
+    result = collection.update_many(
+        {"worker_id": worker_id, "$or": [
+            {"lease_token": lease_token, "_id": {"$in": job_ids}}
+            for lease_token, job_ids in job_ids_by_token.items()
+        ]},
+        {"$set": {"lease_expires_at": lease_expiry(lease_seconds)}}
+    )
+    return result.modified_count
+
+
+class LeaseHeartbeat:
+    """
+    Renews the leases of every job a stage loop has in flight.
+
+    Runs on its own thread so leases stay fresh even while a job blocks the
+    event loop with synchronous work. One update_many per interval covers all
+    in-flight jobs of the queue.
+    """
+
+    def __init__(self, collection, worker_id=WORKER_ID, lease_seconds=LEASE_SECONDS):
+        self.collection = collection
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        # job_id -> the lease token it was claimed under
+        self.leases = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def add(self, job_id, lease_token):
+        with self._lock:
+            self.leases[job_id] = lease_token
+
+    def remove(self, job_id, lease_token):
+        with self._lock:
+            # The job may have been reaped and claimed again under a new token
+            if self.leases.get(job_id) == lease_token:
+                del self.leases[job_id]
+
+    def _run(self):
+        while not self._stopped.wait(self.lease_seconds / HEARTBEATS_PER_LEASE):
+            with self._lock:
+                leases = list(self.leases.items())
+            try:
+                renew_leases(self.collection, leases,
+                             self.worker_id, self.lease_seconds)
+            except Exception as e:
+                log_exception(logger, e)
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import os
+import resource
+import traceback
+import weakref
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# How many CPU-heavy media tasks (MoviePy renders, Pillow/ffmpeg conversions) run at
+# once across every stage in this process. Each task gets its own process.
+MEDIA_WORKERS = int(os.getenv("MEDIA_WORKERS", os.cpu_count() or 1))
+# Address space cap per task in MB, 0 disables it. Applies to the ffmpeg processes
+# MoviePy starts from the task as well.
+MEDIA_TASK_MEMORY_LIMIT_MB = int(os.getenv("MEDIA_TASK_MEMORY_LIMIT_MB", 0))
+
+# forkserver forks tasks from a clean, preloaded server process, so they neither
+# inherit the parent's MongoClient threads nor pay the MoviePy import every time
+if "forkserver" in multiprocessing.get_all_start_methods():
+    _context = multiprocessing.get_context("forkserver")
+    _context.set_forkserver_preload(["moviepy.editor", "PIL.Image"])
+else:
+    _context = multiprocessing.get_context("spawn")
+
+# A semaphore belongs to the event loop that first waits on it, so each loop gets
+# its own. Processes run a single loop, so MEDIA_WORKERS still caps the process.
+_slots_by_loop = weakref.WeakKeyDictionary()
+
+
+def _slots():
+    loop = asyncio.get_running_loop()
+    slots = _slots_by_loop.get(loop)
+    if slots is None:
+        slots = _slots_by_loop[loop] = asyncio.Semaphore(MEDIA_WORKERS)
+    return slots
+
+
+class MediaTaskError(Exception):
+    pass
+
+
+def _run_media_task(connection, fn, args, kwargs, memory_limit_mb):
+    try:
+        if memory_limit_mb:
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        connection.send((True, fn(*args, **kwargs)))
+    except BaseException as e:
+        connection.send((False, f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+    finally:
+        connection.close()
+
+
+def _wait_for_result(connection, process):
+    try:
+        return connection.recv()
+    except EOFError:
+        process.join()
+        return (False, f"Media task process exited with code {process.exitcode} without a result")
+    finally:
+        connection.close()
+        process.join()
+
+
+async def run_media_task(fn, *args, timeout=None, memory_limit_mb=MEDIA_TASK_MEMORY_LIMIT_MB, **kwargs):
+    """
+    Runs the synchronous `fn(*args, **kwargs)` in a separate process and awaits
+    its result without blocking the event loop.
+
+    At most MEDIA_WORKERS tasks run at once. `fn`, its arguments and its result
+    must be picklable, so pass paths and plain values rather than clips or images.
+    Cancelling the awaiting task, or exceeding `timeout` seconds, kills the process.
+    Raises MediaTaskError when `fn` raises or the process dies.
+    """
+    async with _slots():
+        receiver, sender = _context.Pipe(duplex=False)
+        process = _context.Process(
+            target=_run_media_task,
+            args=(sender, fn, args, kwargs, memory_limit_mb),
+            daemon=True
+        )
+        process.start()
+        sender.close()
+
+        try:
+            succeeded, payload = await asyncio.wait_for(
+                asyncio.to_thread(_wait_for_result, receiver, process), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            logger.warning(
+                f"Killing media task {fn.__name__} in process {process.pid}")
+            process.kill()
+            raise
+
+    if not succeeded:
+        raise MediaTaskError(f"Media task {fn.__name__} failed: {payload}")
+    return payload
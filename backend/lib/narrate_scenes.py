@@ -3,8 +3,14 @@ import subprocess
 import asyncio
 import datetime
 import pymongo
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, leased, peek_jobs
 from lib.logger import setup_logger
+from lib.rate_limiter import get_rate_limiter
+from lib.scene_counters import count_narrated_scene
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from models.app_response import AppResponse
 from models.scene import Scene as DbScene
 from utils.exception_helpers import log_exception
@@ -13,17 +19,34 @@ from dotenv import load_dotenv
 
 load_dotenv()
 logger = setup_logger(__name__)
-_client, db = get_db_connection()
 
 scenes_collection = db.scenes
 
 MAX_SCENE_NARRATION_ATTEMPTS = 3
-NO_SCENES_WAIT_SECONDS = 5
+NARRATION_READY_QUERY = {
+    "status": "generated",
+    "scene_narration_attempts": {"$lt": MAX_SCENE_NARRATION_ATTEMPTS},
+}
+NARRATION_QUEUE = LeasedQueue(
+    name="narrate",
+    collection_name="scenes",
+    in_progress_statuses=["narration_queued", "narration_started"],
+    ready_status="generated",
+    failed_status="narration_failed",
+    attempts_field="scene_narration_attempts",
+    max_attempts=MAX_SCENE_NARRATION_ATTEMPTS,
+    attempts_counted_on_claim=True,
+    start_time_field="scene_narration_start_time"
+)
+# Collections and document states that may make new narrate work claimable
+NARRATE_WAKE_TRIGGERS = [
+    ("scenes", {"status": "generated"}),
+]
 
 
 async def narrate_scene(scene_id, change_status=True):
-    scene_result = scenes_collection.find_one_and_update(
-        {"_id": scene_id},
+    scene_result = await adb.scenes.find_one_and_update(
+        leased(scene_id),
         {"$set": {
             "status": "narration_started",
             "scene_narration_start_time": datetime.datetime.now(),
@@ -33,6 +56,14 @@ async def narrate_scene(scene_id, change_status=True):
         sort=[("_id", pymongo.ASCENDING)],
         return_document=pymongo.ReturnDocument.AFTER
     )
+    if lease_lost(scene_result, scene_id):
+        return AppResponse(
+            status="error",
+            error={
+                "message": f"Lease on scene {scene_id} lost before narration started",
+                "scene_id": scene_id
+            }
+        )
     scene = DbScene(**scene_result)
     try:
         # import pdb
@@ -74,7 +105,8 @@ async def narrate_scene(scene_id, change_status=True):
                        f'}} '\
                        f'}}\' -o "{raw_output_path}"'
 
-        subprocess.run(curl_command, shell=True)
+        await get_rate_limiter("elevenlabs").acquire_async()
+        await asyncio.to_thread(subprocess.run, curl_command, shell=True)
         
 
         # Create silent audio of 0.35 seconds
@@ -98,8 +130,11 @@ async def narrate_scene(scene_id, change_status=True):
         scene_narration_duration = (
             scene_narration_end_time - scene.scene_narration_start_time).total_seconds()
 
-        scenes_collection.update_one(
-            {"_id": scene_id},
+        # Only the update that actually moves the scene to narration_complete
+        # counts it off the video, so retries and reaped duplicates can't
+        # double-decrement scenes_pending
+        narration_result = await adb.scenes.update_one(
+            {**leased(scene_id), "status": {"$ne": "narration_complete"}},
             {
                 "$set": {
                     "status": "narration_complete",
@@ -111,6 +146,8 @@ async def narrate_scene(scene_id, change_status=True):
                 "$inc": {"scene_narration_attempts": 1}
             }
         )
+        if narration_result.modified_count == 1:
+            await count_narrated_scene(scene.video_id, scene_id)
         return AppResponse(
             status="success",
             data={
@@ -121,11 +158,11 @@ async def narrate_scene(scene_id, change_status=True):
             }
         )
     except Exception as e:
-        scenes_collection.update_one(
-            {"_id": scene_id},
+        await adb.scenes.update_one(
+            leased(scene_id),
             {
                 "$set": {
-                    "status": "scene_narration_failed"
+                    "status": "narration_failed"
                 },
                 "$inc": {"scene_narration_attempts": 1}
             }
@@ -140,13 +177,13 @@ async def narrate_scene(scene_id, change_status=True):
         )
 
 
-def fetch_next_scene_for_narration(change_status=True):
+def fetch_next_scenes_for_narration(limit, change_status=True, worker_id=WORKER_ID, lease_token=None):
+    query = NARRATION_READY_QUERY
+
     if change_status:
-        scene_result = scenes_collection.find_one_and_update(
-            {
-                "status": "generated",
-                "scene_narration_attempts": {"$lt": MAX_SCENE_NARRATION_ATTEMPTS},
-            },
+        scene_ids = claim_jobs(
+            scenes_collection,
+            query,
             {
                 "$set": {
                     "scene_narration_start_time": datetime.datetime.now(),
@@ -155,21 +192,28 @@ def fetch_next_scene_for_narration(change_status=True):
                 },
                 "$inc": {"scene_narration_attempts": 1}
             },
-            sort=[("_id", pymongo.ASCENDING)],
-            return_document=pymongo.ReturnDocument.AFTER
+            limit,
+            worker_id=worker_id,
+            lease_token=lease_token,
+            queue=NARRATION_QUEUE
         )
     else:
-        scene_result = scenes_collection.find_one({
-            "status": "generated",
-            "scene_narration_attempts": {"$lt": MAX_SCENE_NARRATION_ATTEMPTS}
-        },
-            sort=[("_id", pymongo.ASCENDING)],
-            return_document=pymongo.ReturnDocument.AFTER)
-
-    if scene_result:
+        scene_ids = peek_jobs(scenes_collection, query, limit)
+
+    return AppResponse(
+        status="success",
+        data={"scene_ids": scene_ids}
+    )
+
+
+def fetch_next_scene_for_narration(change_status=True):
+    scene_ids = fetch_next_scenes_for_narration(
+        1, change_status=change_status).data["scene_ids"]
+
+    if scene_ids:
         return AppResponse(
             status="success",
-            data={"scene_id": scene_result["_id"]}
+            data={"scene_id": scene_ids[0]}
         )
     else:
         return AppResponse(
@@ -179,38 +223,20 @@ def fetch_next_scene_for_narration(change_status=True):
         )
 
 
+def log_narration_result(result):
+    if result.status == "error":
+        logger.error(result.error["message"])
+
+
 async def find_scenes_and_narrate(max_count=None, batch_size=1, change_status=True):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - \
-                processed_count if max_count else float('inf')
-            for _ in range(min(batch_size, remaining_count)):
-                fetch_next_scene_result = fetch_next_scene_for_narration(
-                    change_status=change_status)
-                scene_id = fetch_next_scene_result.data.get("scene_id")
-                if scene_id:
-                    batch.append(scene_id)
-                else:
-                    break
-
-            if not batch:
-                logger.info(
-                    f"No scenes found for narration. Sleeping for {NO_SCENES_WAIT_SECONDS} seconds")
-                await asyncio.sleep(NO_SCENES_WAIT_SECONDS)
-                continue
-
-            results = await asyncio.gather(*[narrate_scene(scene_id, change_status) for scene_id in batch])
-
-            for result in results:
-                if result.status == "error":
-                    logger.error(
-                        f"Error narrating scene {scene_id}. Error: {result.message}")
-
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
-
-        except Exception as e:
-            log_exception(logger, e)
+    await run_stage_loop(
+        "narrate",
+        claim_batch=lambda limit, lease_token: fetch_next_scenes_for_narration(
+            limit, lease_token=lease_token, change_status=change_status).data["scene_ids"],
+        process=lambda scene_id: narrate_scene(scene_id, change_status),
+        handle_result=log_narration_result,
+        heartbeat=LeaseHeartbeat(scenes_collection),
+        waker=StageWaker("narrate", db, NARRATE_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
@@ -1,105 +1,133 @@
+import asyncio
 import psutil
 from datetime import datetime
 from constants import UPLOAD_DIRECTORY
 import os
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+import pymongo
+from pymongo import UpdateOne
+from utils.video.render_scene_video import render_final_cut
 from utils.video.generate_scene_video import generate_scene_body_video
 from lib.scene_operations.process_title_scene import process_title_scene
 from models.video import Video
-from bson.objectid import ObjectId
-from lib.database import get_db_connection
+from lib.asset_resolver import AssetResolver
+from lib.async_database import adb
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, lease_scope, leased, new_lease_token, peek_jobs
 from lib.logger import setup_logger
+from lib.media_pool import run_media_task
+from lib.repository import VIDEO_RENDER_FIELDS
+from lib.scene_positions import backfill_positions, position_between
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
+from models.app_response import AppResponse
+from utils.exception_helpers import log_exception
 
-from models.asset import Asset
 from models.scene import Scene
 
-_client, db = get_db_connection()
 
 logger = setup_logger(__name__)
 
 
-def load_asset(asset_filename):
-    """
-    Load an asset from the database given its filename.
+def has_speech_scene_id(scene_id, asset_filename):
+    # Deterministic, so a retried expansion upserts the scenes it already wrote
+    return f"{scene_id}-has-speech-{asset_filename}"
 
-    :param asset_filename: The filename of the asset to load.
-    :return: An instance of the Asset class if found, None otherwise.
-    """
-    asset_result = db.assets.find_one({"filename": asset_filename})
-    if asset_result:
-        # Assuming Asset is a class that can be initialized with the database record
-        return Asset(**asset_result)
-    else:
-        return None
 
-
-def preprocess_and_expand_scenes(video_id):
+async def preprocess_and_expand_scenes(video_id, asset_resolver: AssetResolver):
     logger.info(f"Preprocessing and expanding scenes for video {video_id}")
-    scene_results = list(db.scenes.find({'video_id': video_id}).sort('_id', 1))
-    for scene_result in scene_results:
+    scene_results = await load_ordered_scenes(video_id)
+    await asset_resolver.load_scenes(scene_results)
+    for index, scene_result in enumerate(scene_results):
         scene = Scene(**scene_result)
         if scene.scene_type == "body" and scene.asset_filenames:
+            # New scenes go between this scene and the next one, in asset order.
+            # Scenes an interrupted run already split off are not the next one.
+            split_ids = {has_speech_scene_id(scene_result['_id'], asset_filename)
+                         for asset_filename in scene.asset_filenames}
+            next_position = next((later['position'] for later in scene_results[index + 1:]
+                                  if later['_id'] not in split_ids), None)
+            previous_position = scene.position
+            writes = []
             for asset_filename in scene.asset_filenames:
-                asset = load_asset(asset_filename)
+                asset = await asset_resolver.get(asset_filename)
                 if asset and asset.metadata.content_type.startswith("video") and len(asset.transcript) > 0:
                     logger.info(
                         f"Preprocessing and expanding scene {scene_result['_id']} with asset {asset_filename}")
                     # Create a new scene for the "has_speech" part
                     has_speech_scene = scene_result.copy()
                     has_speech_scene.update({
-                        '_id': str(ObjectId()),
+                        '_id': has_speech_scene_id(scene_result['_id'], asset_filename),
                         'scene_type': 'has_speech',
                         'status': 'narration_complete',
                         'narration': asset.transcript,
                         'duration': asset.metadata.duration,
                         # Include only the relevant asset
                         'asset_filenames': [asset_filename],
-                        'prev_scene_id': scene_result['_id'],
-                        'next_scene_id': scene_result.get('next_scene_id', None)
+                        'position': position_between(previous_position, next_position)
                     })
+                    previous_position = has_speech_scene['position']
                     logger.info(
                         f"Inserting new scene {has_speech_scene['_id']}")
 
-                    # Insert the new "has_speech" scene into the database
-                    db.scenes.insert_one(has_speech_scene)
-
-                    # Update the 'next_scene_id' of the original scene to point to the new "has_speech" scene
-                    db.scenes.update_one({'_id': scene_result['_id']}, {
-                                         '$set': {
-                                             'scene_type': 'title',
-                                             'asset_filenames': [],
-                                             'next_scene_id': has_speech_scene['_id']
-                                         }})
+                    # Its position alone places it after the original scene
+                    writes.append(UpdateOne(
+                        {'_id': has_speech_scene['_id']},
+                        {'$setOnInsert': has_speech_scene},
+                        upsert=True
+                    ))
+
+            if writes:
+                # The original scene keeps only its narration, as a title. One
+                # ordered round trip, and the guard keeps a retry from
+                # re-splitting a scene that was already turned into a title.
+                writes.append(UpdateOne(
+                    {'_id': scene_result['_id'], 'scene_type': 'body'},
+                    {'$set': {
+                        'scene_type': 'title',
+                        'asset_filenames': []
+                    }}
+                ))
+                await adb.scenes.bulk_write(writes, ordered=True)
 
     return True
 
 
-def fetch_ready_video():
-    # Fetches first videos that is ready for production
-    videos = db.videos.find({'status': 'scene_extraction_complete'})
-
-    for video in videos:
-        # Check if all scenes of this video are in 'narration_complete' state
-        scenes = list(db.scenes.find({'video_id': video['_id']}))
-        if all(scene['status'] == 'narration_complete' for scene in scenes):
-            return video['_id']
-
+READY_VIDEO_QUERY = {"status": "scene_extraction_complete", "scenes_pending": 0}
+
+
+MAX_RENDER_ATTEMPTS = 3
+RENDER_READY_QUERY = {
+    **READY_VIDEO_QUERY,
+    # Videos extracted before rendering was leased have no attempts field yet
+    "processing_attempts": {"$not": {"$gte": MAX_RENDER_ATTEMPTS}},
+}
+RENDER_QUEUE = LeasedQueue(
+    name="render",
+    collection_name="videos",
+    in_progress_statuses=["processing_started"],
+    ready_status="scene_extraction_complete",
+    failed_status="processing_failed",
+    attempts_field="processing_attempts",
+    max_attempts=MAX_RENDER_ATTEMPTS,
+    attempts_counted_on_claim=True,
+    start_time_field="processing_start_time"
+)
+# Narration counting the last scene off a video is what makes it renderable
+RENDER_WAKE_TRIGGERS = [
+    ("videos", READY_VIDEO_QUERY),
+]
 
-def concatenate_videos(video: Video, scene_video_paths):
-    # Load video clips
-    video_clips = [VideoFileClip(path) for path in scene_video_paths]
 
-    # Apply fade-in and fade-out effects
-    for i, clip in enumerate(video_clips):
-        if i != 0:  # Skip fade-in for the first clip
-            clip = clip.fadein(0.5)
-        if i != len(video_clips) - 1:  # Skip fade-out for the last clip
-            clip = clip.fadeout(0.5)
-        video_clips[i] = clip
+def fetch_ready_video():
+    # Fetches the first video whose scenes have all been narrated. scenes_pending
+    # is counted down by narrate_scenes, so this is a single indexed lookup.
+    video = db.videos.find_one(
+        READY_VIDEO_QUERY, {"_id": 1}, sort=[("_id", pymongo.ASCENDING)])
+    if video:
+        return video['_id']
 
-    # Concatenate video clips
-    final_clip = concatenate_videoclips(video_clips)
 
+async def concatenate_videos(video: Video, scene_video_paths):
     output_directory = os.path.join(
         UPLOAD_DIRECTORY, video.request_id, video.aspect_ratio, "final_cut")
     os.makedirs(output_directory, exist_ok=True)
@@ -108,14 +136,8 @@ def concatenate_videos(video: Video, scene_video_paths):
     final_cut_path = os.path.join(
         output_directory, f"final_cut_{timestamp}.mp4")
 
-    # Write the final cut to the output path
-    final_clip.write_videofile(final_cut_path)
-
-    # Close the video clips
-    for clip in video_clips:
-        clip.close()
-
-    return final_cut_path
+    # Fades, concatenation and the encode run in the media pool
+    return await run_media_task(render_final_cut, scene_video_paths, final_cut_path)
 
 
 def monitor_memory_usage():
@@ -125,9 +147,9 @@ def monitor_memory_usage():
     print(f"Memory usage: {memory_usage_mb:.2f} MB")
 
 
-async def process_video(video_id, generate_img2video=False, force_regenerate=False, update_db=False):
+async def process_video(video_id, generate_img2video=False, force_regenerate=False, update_db=False, asset_resolver: AssetResolver = None):
     # Load the video
-    video_result = db.videos.find_one({'_id': video_id})
+    video_result = await adb.videos.find_one({'_id': video_id})
     if not video_result:
         logger.error(f"Video {video_id} not found.")
         return
@@ -135,59 +157,195 @@ async def process_video(video_id, generate_img2video=False, force_regenerate=Fal
     video = Video(**video_result)
 
     # Load and order the scenes
-    scene_results = list(db.scenes.find({'video_id': video_id}))
-    ordered_scene_results = order_scene_results(scene_results)
+    ordered_scene_results = await load_ordered_scenes(video_id)
+
+    # Resolve every scene's assets with one query up front
+    if asset_resolver is None:
+        asset_resolver = AssetResolver(video.request_id, video.aspect_ratio)
+    await asset_resolver.load_scenes(ordered_scene_results)
 
     # Process each scene and generate scene videos
     scene_video_paths = []
     for scene_result in ordered_scene_results:
         scene = Scene(**scene_result)
         monitor_memory_usage()
-        scene_video_path = await generate_scene_video(video, scene, generate_img2video=generate_img2video, force_regenerate=force_regenerate)
+        scene_video_path = await generate_scene_video(video, scene, generate_img2video=generate_img2video, force_regenerate=force_regenerate, asset_resolver=asset_resolver)
         if scene_video_path:
             logger.info(f"Generated scene video path: {scene_video_path}")
             scene_video_paths.append(scene_video_path)
 
     # Concatenate scene videos into the final cut
-    final_cut_path = concatenate_videos(video, scene_video_paths)
+    final_cut_path = await concatenate_videos(video, scene_video_paths)
 
     logger.info(f"Final cut path: {final_cut_path}")
 
     if update_db:
         # Update video status
-        db.videos.update_one({'_id': video_id}, {
+        await adb.videos.update_one({'_id': video_id}, {
             '$set': {
                 'status': 'processing_complete',
                 'final_cut_path': final_cut_path
             }})
 
+    return final_cut_path
 
-def order_scene_results(scene_results):
-    # Order scenes based on the linked list structure
-    ordered_scenes = []
-    scene_map = {scene['_id']: scene for scene in scene_results}
-    current_scene_id = next(
-        (scene['_id'] for scene in scene_results if not scene.get('prev_scene_id')), None)
 
-    while current_scene_id:
-        current_scene = scene_map[current_scene_id]
-        ordered_scenes.append(current_scene)
-        current_scene_id = current_scene.get('next_scene_id')
+async def load_ordered_scenes(video_id):
+    scene_results = await adb.scenes.find({'video_id': video_id}).sort('position', 1).to_list(None)
+    if any(scene_result.get('position') is None for scene_result in scene_results):
+        # Extracted before positions existed: position them from the linked list once
+        await asyncio.to_thread(backfill_positions, video_id)
+        scene_results = await adb.scenes.find({'video_id': video_id}).sort('position', 1).to_list(None)
+    return scene_results
+
+
+async def render_video(video_id, generate_img2video=False, force_regenerate=False):
+    # The claim already marked the video started and stamped its start time
+    video_result = await adb.videos.find_one(
+        leased(video_id), VIDEO_RENDER_FIELDS)
+    if lease_lost(video_result, video_id):
+        return AppResponse(
+            status="error",
+            error={
+                "message": f"Lease on video {video_id} lost before rendering started",
+                "video_id": video_id
+            }
+        )
+    try:
+        logger.info(f"Processing video {video_id}")
+        # One resolver per render, so expansion and rendering share the lookups
+        asset_resolver = AssetResolver(
+            video_result["request_id"], video_result["aspect_ratio"])
+        await preprocess_and_expand_scenes(video_id, asset_resolver)
+        final_cut_path = await process_video(video_id, generate_img2video=generate_img2video, force_regenerate=force_regenerate, asset_resolver=asset_resolver)
+
+        processing_end_time = datetime.now()
+        processing_duration = (
+            processing_end_time - video_result["processing_start_time"]).total_seconds()
+        await adb.videos.update_one(
+            leased(video_id),
+            {"$set": {
+                "status": "processing_complete",
+                "final_cut_path": final_cut_path,
+                "processing_end_time": processing_end_time,
+                "processing_duration": processing_duration
+            }}
+        )
+        return AppResponse(
+            status="success",
+            data={
+                "message": f"Success rendering video {video_id}",
+                "video_id": video_id,
+                "final_cut_path": final_cut_path
+            }
+        )
+    except Exception as e:
+        # Attempts were counted on claim; hand the video back until they run out
+        await adb.videos.update_one(
+            leased(video_id),
+            {"$set": {
+                "status": "scene_extraction_complete"
+                if video_result.get("processing_attempts", 0) < MAX_RENDER_ATTEMPTS else "processing_failed"
+            }}
+        )
+        log_exception(logger, e)
+        return AppResponse(
+            status="error",
+            error={
+                "message": f"Error rendering video {video_id}",
+                "video_id": video_id
+            }
+        )
+
+
+def fetch_next_videos_for_render(limit, change_status=True, worker_id=WORKER_ID, lease_token=None):
+    query = RENDER_READY_QUERY
+
+    if change_status:
+        video_ids = claim_jobs(
+            db.videos,
+            query,
+            {
+                "$set": {
+                    "status": "processing_started",
+                    "processing_start_time": datetime.now(),
+                    "processing_end_time": None,
+                    "processing_duration": None
+                },
+                "$inc": {"processing_attempts": 1}
+            },
+            limit,
+            worker_id=worker_id,
+            lease_token=lease_token,
+            queue=RENDER_QUEUE
+        )
+    else:
+        video_ids = peek_jobs(db.videos, query, limit)
 
-    return ordered_scenes
+    return AppResponse(
+        status="success",
+        data={"video_ids": video_ids}
+    )
 
 
-async def fetch_and_process_videos(generate_img2video=False, force_regenerate=False):
-    video_id = fetch_ready_video()
-    if video_id:
-        logger.info(f"Processing video {video_id}")
-        preprocess_and_expand_scenes(video_id)
-        await process_video(video_id, generate_img2video=generate_img2video, force_regenerate=force_regenerate)
+def log_render_result(result):
+    if result.status == "error":
+        logger.error(result.error["message"])
     else:
+        logger.info(f"Final cut path: {result.data['final_cut_path']}")
+
+
+async def fetch_and_process_videos(generate_img2video=False, force_regenerate=False, update_db=False):
+    """
+    Renders a single ready video, for one-off runs outside the render worker.
+    With `update_db` the video is claimed and its result recorded like the
+    worker does; without it the next ready video is rendered as a preview and
+    its status is left alone.
+    """
+    if not update_db:
+        video_ids = fetch_next_videos_for_render(
+            1, change_status=False).data["video_ids"]
+        if not video_ids:
+            logger.info("No videos ready for processing.")
+            return None
+        video_id = video_ids[0]
+        logger.info(f"Processing video {video_id}")
+        video_result = await adb.videos.find_one({"_id": video_id}, VIDEO_RENDER_FIELDS)
+        asset_resolver = AssetResolver(
+            video_result["request_id"], video_result["aspect_ratio"])
+        await preprocess_and_expand_scenes(video_id, asset_resolver)
+        final_cut_path = await process_video(video_id, generate_img2video=generate_img2video, force_regenerate=force_regenerate, asset_resolver=asset_resolver)
+        logger.info(f"Final cut path: {final_cut_path}")
+        return video_id
+
+    lease_token = new_lease_token()
+    video_ids = fetch_next_videos_for_render(
+        1, lease_token=lease_token).data["video_ids"]
+    if not video_ids:
         logger.info("No videos ready for processing.")
+        return None
+
+    with lease_scope(lease_token):
+        log_render_result(await render_video(video_ids[0], generate_img2video=generate_img2video, force_regenerate=force_regenerate))
+    return video_ids[0]
+
+
+async def find_and_render_videos(max_count=None, batch_size=1, generate_img2video=False, force_regenerate=False):
+    await run_stage_loop(
+        "render",
+        claim_batch=lambda limit, lease_token: fetch_next_videos_for_render(
+            limit, lease_token=lease_token).data["video_ids"],
+        process=lambda video_id: render_video(
+            video_id, generate_img2video=generate_img2video, force_regenerate=force_regenerate),
+        handle_result=log_render_result,
+        heartbeat=LeaseHeartbeat(db.videos),
+        waker=StageWaker("render", db, RENDER_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
 
 
-async def generate_scene_video(video: Video, scene: Scene, force_regenerate=False, generate_img2video=False):
+async def generate_scene_video(video: Video, scene: Scene, force_regenerate=False, generate_img2video=False, asset_resolver: AssetResolver = None):
     logger.info(
         f"Generating scene video for scene {scene.scene_type} {scene.id}")
 
@@ -197,9 +355,9 @@ async def generate_scene_video(video: Video, scene: Scene, force_regenerate=Fals
         return scene.generated_scene_video
 
     if scene.scene_type == "body":
-        scene_video_path = await generate_scene_body_video(video, scene, add_subtitles=True, add_narration=True, generate_img2video=generate_img2video)
+        scene_video_path = await generate_scene_body_video(video, scene, add_subtitles=True, add_narration=True, generate_img2video=generate_img2video, asset_resolver=asset_resolver)
     elif scene.scene_type == "has_speech":
-        scene_video_path = await generate_scene_body_video(video, scene, add_subtitles=True, add_narration=False, generate_img2video=generate_img2video)
+        scene_video_path = await generate_scene_body_video(video, scene, add_subtitles=True, add_narration=False, generate_img2video=generate_img2video, asset_resolver=asset_resolver)
     elif scene.scene_type in ["title", "middle_title", "outro"]:
         if scene.scene_type == "title":
             gradient_color = (173, 216, 230)
@@ -215,7 +373,7 @@ async def generate_scene_video(video: Video, scene: Scene, force_regenerate=Fals
 
     if scene_video_path:
         # Update the scene with the generated video path
-        db.scenes.update_one({'_id': scene.id}, {
-                             '$set': {'generated_scene_video': scene_video_path}})
+        await adb.scenes.update_one({'_id': scene.id}, {
+            '$set': {'generated_scene_video': scene_video_path}})
 
     return scene_video_path
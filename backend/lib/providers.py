@@ -0,0 +1,52 @@
+import os
+from functools import lru_cache
+import anthropic
+import instructor
+import openai
+from dotenv import load_dotenv
+from lib.rate_limiter import RateLimitedEndpoint, get_rate_limiter
+
+load_dotenv()
+
+MISTRAL_BASE_URL = "https://api.mistral.ai/v1"
+
+
+# Provider clients hold their own HTTP connection pools, so build each one once
+# per process and share it between every stage running in that process. Their
+# create() endpoints are wrapped to respect the provider's shared rate limit.
+
+@lru_cache(maxsize=None)
+def get_anthropic_client():
+    client = anthropic.Anthropic()
+    client.messages = RateLimitedEndpoint(
+        client.messages, get_rate_limiter("anthropic"))
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    client = openai.OpenAI()
+    client.chat.completions = RateLimitedEndpoint(
+        client.chat.completions, get_rate_limiter("openai"))
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_mistral_client():
+    client = openai.OpenAI(
+        base_url=MISTRAL_BASE_URL,
+        api_key=os.getenv("MISTRAL_API_KEY")
+    )
+    client.chat.completions = RateLimitedEndpoint(
+        client.chat.completions, get_rate_limiter("mistral"))
+    return client
+
+
+@lru_cache(maxsize=None)
+def get_instructor_openai_client():
+    # instructor patches the client in place, so keep it apart from the plain one.
+    # Rate limit beneath the patch so instructor's validation retries count too.
+    client = openai.OpenAI()
+    client.chat.completions = RateLimitedEndpoint(
+        client.chat.completions, get_rate_limiter("openai"))
+    return instructor.patch(client)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import threading
+import time
+from functools import lru_cache
+from pymongo import ReturnDocument
+from lib.database import db
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Requests and tokens per minute each provider allows this deployment. Override
+# with RATE_LIMIT_<PROVIDER>_RPM / RATE_LIMIT_<PROVIDER>_TPM, 0 means unlimited.
+DEFAULT_PROVIDER_LIMITS = {
+    "anthropic": {"rpm": 50, "tpm": 40000},
+    "openai": {"rpm": 500, "tpm": 60000},
+    "mistral": {"rpm": 300, "tpm": 500000},
+    "deepgram": {"rpm": 100, "tpm": 0},
+    "elevenlabs": {"rpm": 100, "tpm": 0},
+    "octoai": {"rpm": 60, "tpm": 0},
+}
+
+# "mongo" shares one bucket per provider across every worker process through the
+# rate_limits collection, "local" keeps the buckets in this process only
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "mongo")
+RATE_LIMITS_COLLECTION = "rate_limits"
+
+# Rough prompt size heuristics used to reserve tokens before a call
+CHARS_PER_TOKEN = 4
+TOKENS_PER_IMAGE = 1600
+MAX_WAIT_SECONDS = 60
+
+
+def provider_limits(provider):
+    defaults = DEFAULT_PROVIDER_LIMITS.get(provider, {"rpm": 0, "tpm": 0})
+    return {
+        limit: int(os.getenv(f"RATE_LIMIT_{provider.upper()}_{limit.upper()}", default))
+        for limit, default in defaults.items()
+    }
+
+
+class LocalTokenBucket:
+    """In-process requests/tokens bucket, refilled continuously at rpm/tpm per minute."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, provider, rpm, tpm, tokens):
+        with self._lock:
+            now = time.monotonic()
+            requests, available_tokens, updated_at = self._buckets.get(
+                provider, (rpm, tpm, now))
+            elapsed_minutes = (now - updated_at) / 60
+            requests = min(rpm, requests + elapsed_minutes * rpm)
+            available_tokens = min(tpm, available_tokens + elapsed_minutes * tpm)
+
+            granted = requests >= 1 and available_tokens >= tokens
+            if granted:
+                requests -= 1
+                available_tokens -= tokens
+            self._buckets[provider] = (requests, available_tokens, now)
+
+        if granted:
+            return 0
+        return seconds_until_available(requests, available_tokens, rpm, tpm, tokens)
+
+    def refund(self, provider, tpm, tokens):
+        with self._lock:
+            if provider in self._buckets:
+                requests, available_tokens, updated_at = self._buckets[provider]
+                self._buckets[provider] = (
+                    requests, min(tpm, available_tokens + tokens), updated_at)
+
+
+class MongoTokenBucket:
+    """
+    Same bucket as LocalTokenBucket, kept in one document per provider and
+    updated with a single pipeline update, so every process draws from it
+    atomically. Refills use the server clock ($$NOW), not the workers'.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def take(self, provider, rpm, tpm, tokens):
+        elapsed_minutes = {"$divide": [
+            {"$subtract": ["$$NOW", {"$ifNull": ["$updated_at", "$$NOW"]}]},
+            60000
+        ]}
+
+        def refill(field, capacity):
+            return {"$min": [capacity, {"$add": [
+                {"$ifNull": [f"${field}", capacity]},
+                {"$multiply": [elapsed_minutes, capacity]}
+            ]}]}
+
+        bucket = self.collection.find_one_and_update(
+            {"_id": provider},
+            [
+                {"$set": {
+                    "requests": refill("requests", rpm),
+                    "tokens": refill("tokens", tpm),
+                    "updated_at": "$$NOW"
+                }},
+                {"$set": {"granted": {"$and": [
+                    {"$gte": ["$requests", 1]},
+                    {"$gte": ["$tokens", tokens]}
+                ]}}},
+                {"$set": {
+                    "requests": {"$cond": ["$granted", {"$subtract": ["$requests", 1]}, "$requests"]},
+                    "tokens": {"$cond": ["$granted", {"$subtract": ["$tokens", tokens]}, "$tokens"]}
+                }}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+        if bucket["granted"]:
+            return 0
+        return seconds_until_available(bucket["requests"], bucket["tokens"], rpm, tpm, tokens)
+
+    def refund(self, provider, tpm, tokens):
+        self.collection.update_one(
+            {"_id": provider},
+            [{"$set": {"tokens": {"$min": [tpm, {"$add": ["$tokens", tokens]}]}}}]
+        )
+
+
+def seconds_until_available(requests, available_tokens, rpm, tpm, tokens):
+    wait_minutes = max(
+        (1 - requests) / rpm,
+        (tokens - available_tokens) / tpm if tpm else 0
+    )
+    return min(max(wait_minutes * 60, 0.05), MAX_WAIT_SECONDS)
+
+
+class ProviderRateLimiter:
+    """
+    Keeps calls to one provider within its RPM/TPM budget.
+
+    `acquire(tokens)` blocks until a request slot and `tokens` tokens are
+    available (use `acquire_async` on the event loop); since token usage is only known after the call, callers reserve
+    an estimate and `settle` it against the real usage afterwards.
+    """
+
+    def __init__(self, provider, rpm, tpm, bucket):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.bucket = bucket
+
+    def _try_take(self, tokens):
+        # 0 requests per minute means the provider is not limited
+        if not self.rpm:
+            return 0
+        # A single call larger than the whole minute budget could never be granted
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        return self.bucket.take(self.provider, self.rpm, self.tpm, tokens)
+
+    def acquire(self, tokens=0):
+        while True:
+            wait_seconds = self._try_take(tokens)
+            if not wait_seconds:
+                return
+            logger.info(
+                f"{self.provider} rate limit reached, waiting {wait_seconds:.2f} seconds")
+            time.sleep(wait_seconds)
+
+    async def acquire_async(self, tokens=0):
+        while True:
+            wait_seconds = await asyncio.to_thread(self._try_take, tokens)
+            if not wait_seconds:
+                return
+            logger.info(
+                f"{self.provider} rate limit reached, waiting {wait_seconds:.2f} seconds")
+            await asyncio.sleep(wait_seconds)
+
+    def settle(self, reserved_tokens, used_tokens):
+        if not (self.rpm and self.tpm) or used_tokens is None:
+            return
+        reserved_tokens = min(reserved_tokens, self.tpm)
+        if used_tokens != reserved_tokens:
+            self.bucket.refund(self.provider, self.tpm,
+                               reserved_tokens - used_tokens)
+
+
+@lru_cache(maxsize=None)
+def get_token_bucket():
+    if RATE_LIMIT_BACKEND == "local":
+        return LocalTokenBucket()
+
+    return MongoTokenBucket(db.get_collection(RATE_LIMITS_COLLECTION))
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter(provider):
+    limits = provider_limits(provider)
+    return ProviderRateLimiter(provider, limits["rpm"], limits["tpm"], get_token_bucket())
+
+
+def estimate_request_tokens(request):
+    """Estimates the tokens a chat/messages request will use from its kwargs."""
+    characters = len(request.get("system") or "")
+    images = 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            characters += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                characters += len(part.get("text", ""))
+            elif part.get("type") in ("image", "image_url"):
+                images += 1
+    return characters // CHARS_PER_TOKEN + images * TOKENS_PER_IMAGE + request.get("max_tokens", 0)
+
+
+def response_tokens(response):
+    # instructor returns the parsed model and keeps the completion on _raw_response
+    usage = getattr(response, "usage", None) or getattr(
+        getattr(response, "_raw_response", None), "usage", None)
+    if usage is None:
+        return None
+    if getattr(usage, "total_tokens", None) is not None:
+        return usage.total_tokens
+    return usage.input_tokens + usage.output_tokens
+
+
+class RateLimitedEndpoint:
+    """
+    Wraps an SDK resource with a create() method (client.messages,
+    client.chat.completions) so every call waits for its provider's budget and
+    settles the reserved tokens against the usage the provider reports.
+
+    create() blocks, both on the wait and on the SDK call; async code runs it
+    with asyncio.to_thread so the event loop keeps serving the other jobs.
+    """
+
+    def __init__(self, endpoint, limiter):
+        self._endpoint = endpoint
+        self._limiter = limiter
+
+    def create(self, **kwargs):
+        reserved_tokens = estimate_request_tokens(kwargs)
+        self._limiter.acquire(reserved_tokens)
+        response = self._endpoint.create(**kwargs)
+        self._limiter.settle(reserved_tokens, response_tokens(response))
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._endpoint, name)
@@ -0,0 +1,89 @@
+import asyncio
+import datetime
+import time
+from typing import List
+from lib.database import db
+from lib.job_queue import LEASE_SECONDS, LeasedQueue
+from lib.logger import setup_logger
+from lib.scene_counters import recount_stalled_videos
+from utils.exception_helpers import log_exception
+
+logger = setup_logger(__name__)
+
+
+REAPER_INTERVAL_SECONDS = 60
+# Stalled scene counters are rare, so they are repaired on a slower cadence
+RECOUNT_INTERVAL_SECONDS = 600
+RELEASED_LEASE_FIELDS = {"worker_id": "", "lease_token": "", "lease_expires_at": ""}
+
+
+def expired_lease_query(queue: LeasedQueue, now: datetime.datetime):
+    return {
+        "status": {"$in": queue.in_progress_statuses},
+        "$or": [
+            {"lease_expires_at": {"$lt": now}},
+            # Jobs claimed before leases existed only have their start time
+            {
+                "lease_expires_at": {"$exists": False},
+                queue.start_time_field: {"$lt": now - datetime.timedelta(seconds=LEASE_SECONDS)}
+            }
+        ]
+    }
+
+
+def reap_expired_leases(queue: LeasedQueue):
+    """
+    Returns jobs whose worker stopped heartbeating to the queue, counting the
+    lost run as an attempt. Jobs that have used up their attempts are failed.
+    """
+    collection = db.get_collection(queue.collection_name)
+    expired = expired_lease_query(queue, datetime.datetime.now())
+    attempts_increment = 0 if queue.attempts_counted_on_claim else 1
+
+    def release(status):
+        update = {
+            "$set": {"status": status},
+            "$unset": RELEASED_LEASE_FIELDS
+        }
+        if attempts_increment:
+            update["$inc"] = {queue.attempts_field: attempts_increment}
+        return update
+
+    failed_result = collection.update_many(
+        {**expired, queue.attempts_field: {
+            "$gte": queue.max_attempts - attempts_increment}},
+        release(queue.failed_status)
+    )
+    requeued_result = collection.update_many(
+        expired,
+        release(queue.ready_status)
+    )
+
+    if failed_result.modified_count or requeued_result.modified_count:
+        logger.warning(f"Reaped expired {queue.name} leases", extra={"data": {
+            "queue": queue.name,
+            "requeued": requeued_result.modified_count,
+            "failed": failed_result.modified_count
+        }})
+
+    return requeued_result.modified_count, failed_result.modified_count
+
+
+async def run_reaper(queues: List[LeasedQueue], interval=REAPER_INTERVAL_SECONDS, once=False):
+    last_recount = None
+    while True:
+        for queue in queues:
+            try:
+                # Synchronous pymongo, so keep it off the loop the stages share
+                await asyncio.to_thread(reap_expired_leases, queue)
+            except Exception as e:
+                log_exception(logger, e)
+        if last_recount is None or time.monotonic() - last_recount >= RECOUNT_INTERVAL_SECONDS:
+            last_recount = time.monotonic()
+            try:
+                await asyncio.to_thread(recount_stalled_videos)
+            except Exception as e:
+                log_exception(logger, e)
+        if once:
+            break
+        await asyncio.sleep(interval)
@@ -0,0 +1,64 @@
+from typing import Dict, Optional, Tuple
+from lib.async_database import adb
+
+# Reads that only need a field or two. Each projects exactly what its callers
+# use and returns plain values, so the long script, description and transcript
+# fields never leave the server and nothing is parsed into a model.
+
+ID_ONLY = {"_id": 1}
+
+# Stage bookkeeping fields a job body needs about its own document
+VIDEO_RENDER_FIELDS = {
+    "request_id": 1,
+    "aspect_ratio": 1,
+    "processing_start_time": 1,
+    "processing_attempts": 1,
+}
+
+# Rendering reads content_type, duration and transcript but never the description
+ASSET_RENDER_PROJECTION = {"description": 0}
+
+# What conversion needs to skip or retry an upload's asset
+ASSET_CONVERSION_FIELDS = {
+    "upload_id": 1,
+    "metadata": 1,
+    "status": 1,
+    "conversion_attempts": 1,
+}
+
+
+async def find_upload_id(request_id, filename) -> Optional[str]:
+    upload = await adb.uploads.find_one(
+        {"request_id": request_id, "filename": filename}, ID_ONLY)
+    return upload["_id"] if upload else None
+
+
+async def get_job_attempts(collection_name, job_id, attempts_field) -> Optional[int]:
+    job = await adb.get_collection(collection_name).find_one(
+        {"_id": job_id}, {attempts_field: 1})
+    return job.get(attempts_field, 0) if job else None
+
+
+async def get_video_request_status(request_id) -> Optional[str]:
+    video_request = await adb.video_requests.find_one(
+        {"_id": request_id}, {"status": 1})
+    return video_request["status"] if video_request else None
+
+
+async def get_logo_path(request_id) -> Optional[str]:
+    upload = await adb.uploads.find_one(
+        {"request_id": request_id, "metadata.is_logo": True}, {"file_path": 1})
+    return upload["file_path"] if upload else None
+
+
+async def get_asset_conversions(request_id, aspect_ratios) -> Dict[Tuple[str, str], dict]:
+    """A request's assets for `aspect_ratios`, keyed by (upload_id, aspect_ratio)."""
+    assets = await adb.assets.find({
+        "request_id": request_id,
+        "metadata.aspect_ratio": {"$in": aspect_ratios}
+    }, ASSET_CONVERSION_FIELDS).to_list(None)
+    # Assets converted before they recorded their upload are never retried
+    return {
+        (asset["upload_id"], asset["metadata"]["aspect_ratio"]): asset
+        for asset in assets if asset.get("upload_id")
+    }
@@ -0,0 +1,103 @@
+import datetime
+import os
+from lib.async_database import adb
+from lib.database import db
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+# Scene extraction stores each video's scene counts, and narration counts every
+# scene off as it finishes, so the render claim is one indexed lookup on
+# (status, scenes_pending). The video also lists the scenes already counted
+# off, which makes counting a scene a single conditional write that is safe to
+# repeat. A worker that dies between finishing a scene and counting it leaves
+# the video short; the reaper recounts such videos from their scenes.
+#
+# Extraction and every count stamp scenes_checked_at, so the recount only
+# looks at videos whose scenes have been quiet for SCENE_STALL_SECONDS, a
+# batch at a time, instead of every video still being narrated.
+
+SCENE_STALL_SECONDS = int(os.getenv("SCENE_STALL_SECONDS", 900))
+SCENE_RECOUNT_BATCH_SIZE = int(os.getenv("SCENE_RECOUNT_BATCH_SIZE", 100))
+STALLED_VIDEO_SORT = [("scenes_checked_at", 1)]
+
+
+def stalled_video_query(now):
+    return {
+        "status": "scene_extraction_complete",
+        "scenes_checked_at": {"$lt": now - datetime.timedelta(seconds=SCENE_STALL_SECONDS)},
+        "scenes_pending": {"$gt": 0}
+    }
+
+
+def narrated_scene_update(video_id, scene_id):
+    return (
+        {"_id": video_id, "narrated_scene_ids": {"$ne": scene_id}},
+        {
+            "$inc": {"scenes_pending": -1, "scenes_narrated": 1},
+            "$push": {"narrated_scene_ids": scene_id},
+            "$set": {"scenes_checked_at": datetime.datetime.now()}
+        }
+    )
+
+
+async def count_narrated_scene(video_id, scene_id):
+    """Counts a scene that reached narration_complete off its video, at most once."""
+    await adb.videos.update_one(*narrated_scene_update(video_id, scene_id))
+
+
+def recount_scenes(video_id):
+    """
+    Recomputes a video's readiness counters from its scenes. Used to backfill
+    videos extracted before the counters existed and to repair drift.
+    """
+    counts = {
+        result["_id"]: result for result in db.scenes.aggregate([
+            {"$match": {"video_id": video_id}},
+            {"$group": {
+                "_id": {"$eq": ["$status", "narration_complete"]},
+                "count": {"$sum": 1},
+                "scene_ids": {"$push": "$_id"}
+            }}
+        ])
+    }
+    narrated = counts.get(True, {}).get("count", 0)
+    pending = counts.get(False, {}).get("count", 0)
+    db.videos.update_one({"_id": video_id}, {"$set": {
+        "scenes_total": narrated + pending,
+        "scenes_pending": pending,
+        "scenes_narrated": narrated,
+        "narrated_scene_ids": counts.get(True, {}).get("scene_ids", []),
+        "scenes_checked_at": datetime.datetime.now()
+    }})
+    return pending
+
+
+def recount_stalled_videos(now=None):
+    """
+    Recounts videos still waiting on scenes that have in fact all been
+    narrated, i.e. whose last scene finished but was never counted off.
+    Checks at most SCENE_RECOUNT_BATCH_SIZE quiet videos, oldest first, and
+    restamps them so they are not checked again until they have been quiet
+    for another SCENE_STALL_SECONDS. Returns the ids of the videos it repaired.
+    """
+    now = now or datetime.datetime.now()
+    candidates = [video["_id"] for video in db.videos.find(
+        stalled_video_query(now), {"_id": 1}
+    ).sort(STALLED_VIDEO_SORT).limit(SCENE_RECOUNT_BATCH_SIZE)]
+    if not candidates:
+        return []
+
+    repaired = []
+    for video_id in candidates:
+        unfinished = db.scenes.find_one(
+            {"video_id": video_id, "status": {"$ne": "narration_complete"}}, {"_id": 1})
+        if unfinished is None and recount_scenes(video_id) == 0:
+            repaired.append(video_id)
+    db.videos.update_many({"_id": {"$in": candidates}},
+                          {"$set": {"scenes_checked_at": now}})
+    if repaired:
+        logger.warning("Recounted videos whose narrated scenes were never counted off",
+                       extra={"data": {"video_ids": repaired}})
+    return repaired
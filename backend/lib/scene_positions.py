@@ -0,0 +1,54 @@
+from pymongo import UpdateOne
+from lib.database import db
+
+# Scenes of a video are ordered by a fractional `position`. Extraction spaces
+# them POSITION_STEP apart and a scene inserted later takes the midpoint of its
+# neighbours, so an insert is a single write and reading a video's scenes in
+# order is one sorted query on the (video_id, position) index.
+POSITION_STEP = 1.0
+
+
+def initial_position(index):
+    return (index + 1) * POSITION_STEP
+
+
+def position_between(before, after=None):
+    """Position for a scene between `before` and `after` (None when inserting at the end)."""
+    if after is None:
+        return before + POSITION_STEP
+    return (before + after) / 2
+
+
+def order_by_links(scene_results):
+    # Order scenes based on the prev/next linked list that predates positions
+    ordered_scenes = []
+    scene_map = {scene['_id']: scene for scene in scene_results}
+    current_scene_id = next(
+        (scene['_id'] for scene in scene_results if not scene.get('prev_scene_id')), None)
+
+    while current_scene_id:
+        current_scene = scene_map[current_scene_id]
+        ordered_scenes.append(current_scene)
+        current_scene_id = current_scene.get('next_scene_id')
+
+    return ordered_scenes
+
+
+def backfill_positions(video_id):
+    """
+    Gives the scenes of a video extracted before positions existed a position
+    from their linked list order. Returns the number of scenes positioned.
+    """
+    scene_results = list(db.scenes.find(
+        {"video_id": video_id},
+        {"prev_scene_id": 1, "next_scene_id": 1, "position": 1}))
+    if all(scene.get("position") is not None for scene in scene_results):
+        return 0
+    ordered_scenes = order_by_links(scene_results)
+    if ordered_scenes:
+        db.scenes.bulk_write([
+            UpdateOne({"_id": scene["_id"]}, {
+                      "$set": {"position": initial_position(index)}})
+            for index, scene in enumerate(ordered_scenes)
+        ])
+    return len(ordered_scenes)
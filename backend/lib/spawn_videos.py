@@ -2,8 +2,13 @@ from bson.objectid import ObjectId
 import asyncio
 import datetime
 import pymongo
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.database import db
+from lib.job_queue import WORKER_ID, LeaseHeartbeat, LeasedQueue, claim_jobs, lease_lost, leased, peek_jobs
 from lib.logger import setup_logger
+from lib.repository import get_job_attempts
+from lib.wakeup import StageWaker
+from lib.worker_pool import run_stage_loop
 from models.app_response import AppResponse
 from models.video_request import VideoRequest
 from models.video_request_format import VideoRequestFormat
@@ -12,26 +17,48 @@ from utils.exception_helpers import log_exception
 
 logger = setup_logger(__name__)
 
-NO_VIDEO_REQUEST_FORMATS_WAIT_SECONDS = 5
 MAX_SPAWNING_ATTEMPTS = 3
+SPAWNING_QUEUE = LeasedQueue(
+    name="spawn",
+    collection_name="video_request_formats",
+    in_progress_statuses=["spawning_started"],
+    ready_status="requested",
+    failed_status="spawning_failed",
+    attempts_field="spawning_attempts",
+    max_attempts=MAX_SPAWNING_ATTEMPTS,
+    start_time_field="spawning_start_time"
+)
+
+
+def spawning_ready_query(aspect_ratios_converted):
+    return {
+        "status": "requested",
+        "aspect_ratio": {
+            "$in": aspect_ratios_converted
+        }
+    }
+
+
+# Collections and document states that may make new spawn work claimable
+SPAWN_WAKE_TRIGGERS = [
+    ("video_request_formats", {"status": "requested"}),
+    ("video_request_aspect_ratios", {"status": "converted"}),
+]
 
-_client, db = get_db_connection()
-video_requests_collection = db.video_requests
-videos_collection = db.videos
-uploads_collection = db.uploads
 video_request_aspect_ratios_collection = db.video_request_aspect_ratios
 video_request_formats_collection = db.video_request_formats
 
 
 async def spawn_video_from_video_request_format(format_id: str, change_status=True, insert_videos=True):
     try:
-        video_request_format_result = video_request_formats_collection.find_one({
-                                                                         "_id": format_id})
+        video_request_format_result = await adb.video_request_formats.find_one(
+            {"_id": format_id})
         video_request_format = VideoRequestFormat(**video_request_format_result)
 
-        video_requests_result = video_requests_collection.find_one(
+        video_requests_result = await adb.video_requests.find_one(
             {"_id": video_request_format.request_id})
-        video_request = VideoRequest(**video_requests_result)
+        video_request = VideoRequest(
+            **video_requests_result) if video_requests_result else None
 
         if video_request:
             video_id = str(ObjectId())
@@ -47,24 +74,34 @@ async def spawn_video_from_video_request_format(format_id: str, change_status=Tr
             }
             video = Video(**video_dict)
 
-            inserted = False
-            if insert_videos:
-                inserted = True
-                videos_collection.insert_one(video.model_dump(by_alias=True))
-
             if change_status:
 
                 spawning_end_time = datetime.datetime.now()
                 spawning_duration = (
                     spawning_end_time - video_request_format.spawning_start_time).total_seconds()
-                video_request_formats_collection.update_one(
-                    {"_id": format_id},
+                # Completed before the insert, so a worker that lost its lease
+                # never adds a second video; a failed insert requeues the format
+                spawned_result = await adb.video_request_formats.update_one(
+                    leased(format_id),
                     {"$set": {
                         "status": "spawning_complete",
                         "spawning_end_time": spawning_end_time,
                         "spawning_duration": spawning_duration
                     }}
                 )
+                if lease_lost(spawned_result, format_id):
+                    return AppResponse(
+                        status="error",
+                        error={
+                            "format_id": format_id,
+                            "message": "Lease lost before the video was spawned"
+                        }
+                    )
+
+            inserted = False
+            if insert_videos:
+                inserted = True
+                await adb.videos.insert_one(video.model_dump(by_alias=True))
 
             return AppResponse(
                 status="success",
@@ -87,13 +124,12 @@ async def spawn_video_from_video_request_format(format_id: str, change_status=Tr
                 }
             )
     except Exception as e:
-        video_request_format = video_request_formats_collection.find_one({
-                                                                         "_id": format_id})
-        video_request_format = VideoRequestFormat(**video_request_format)
+        spawning_attempts = await get_job_attempts(
+            "video_request_formats", format_id, "spawning_attempts") or 0
 
-        if video_request_format.spawning_attempts + 1 >= MAX_SPAWNING_ATTEMPTS and change_status:
-            video_request_format.update_one(
-                {"_id": format_id},
+        if spawning_attempts + 1 >= MAX_SPAWNING_ATTEMPTS and change_status:
+            await adb.video_request_formats.update_one(
+                leased(format_id),
                 {"$set": {"status": "spawning_failed"}}
             )
             return AppResponse(
@@ -105,8 +141,8 @@ async def spawn_video_from_video_request_format(format_id: str, change_status=Tr
             )
         else:
             if change_status:
-                video_request_formats_collection.update_one(
-                    {"_id": format_id},
+                await adb.video_request_formats.update_one(
+                    leased(format_id),
                     {"$inc": {"spawning_attempts": 1},
                         "$set": {"status": "requested"}}
                 )
@@ -119,39 +155,48 @@ async def spawn_video_from_video_request_format(format_id: str, change_status=Tr
             )
 
 
-def fetch_next_video_request_format_for_video_spawning(change_status=True):
+def fetch_next_video_request_formats_for_video_spawning(limit, change_status=True, worker_id=WORKER_ID, lease_token=None):
     aspect_ratios_converted = video_request_aspect_ratios_collection.distinct(
         "aspect_ratio",
         {
             "status": "converted"
         }
     )
+    query = spawning_ready_query(aspect_ratios_converted)
+
+    if change_status:
+        format_ids = claim_jobs(
+            video_request_formats_collection,
+            query,
+            {
+                "$set": {
+                    "spawning_start_time": datetime.datetime.now(),
+                    "spawning_end_time": None,
+                    "status": "spawning_started"
+                }
+            },
+            limit,
+            worker_id=worker_id,
+            lease_token=lease_token,
+            queue=SPAWNING_QUEUE
+        )
+    else:
+        format_ids = peek_jobs(video_request_formats_collection, query, limit)
 
-    video_request_format = video_request_formats_collection.find_one(
-        {
-            "status": "requested",
-            "aspect_ratio": {
-                "$in": aspect_ratios_converted
-            }
-        },
-        sort=[("_id", pymongo.ASCENDING)]
+    return AppResponse(
+        status="success",
+        data={"format_ids": format_ids}
     )
 
-    if video_request_format:
-        if change_status:
-            video_request_formats_collection.update_one(
-                {"_id": video_request_format["_id"]},
-                {
-                    "$set": {
-                        "spawning_start_time": datetime.datetime.now(),
-                        "spawning_end_time": None,
-                        "status": "spawning_started"
-                    }
-                }
-            )
+
+def fetch_next_video_request_format_for_video_spawning(change_status=True):
+    format_ids = fetch_next_video_request_formats_for_video_spawning(
+        1, change_status=change_status).data["format_ids"]
+
+    if format_ids:
         return AppResponse(
             status="success",
-            data={"format_id": video_request_format["_id"]}
+            data={"format_id": format_ids[0]}
         )
     else:
         return AppResponse(
@@ -161,46 +206,28 @@ def fetch_next_video_request_format_for_video_spawning(change_status=True):
         )
 
 
+def log_spawning_result(result):
+    if result.status == "error":
+        logger.info(
+            f"Failed to spawn videos for request format {result.error['format_id']}: {result.error['message']}")
+    elif result.status == "success":
+        logger.info(
+            f"Successfully spawned videos for request {result.data['format_id']}", extra={"data": result.data})
+
+
 async def find_video_request_formats_and_spawn_videos(max_count=None, batch_size=1, change_status=True, insert_videos=True):
-    processed_count = 0
-    while True:
-        try:
-            batch = []
-            remaining_count = max_count - processed_count if max_count is not None else batch_size
-            for _ in range(min(batch_size, remaining_count)):
-                fetch_next_video_request_format_result = fetch_next_video_request_format_for_video_spawning(
-                    change_status=change_status)
-                format_id = fetch_next_video_request_format_result.data.get(
-                    'format_id', None)
-                if format_id:
-                    batch.append(format_id)
-                else:
-                    break
-
-            if not batch:
-                # Wait for a short time if no video_requests are found
-                logger.info(
-                    f"No video request formats found. Sleeping for {NO_VIDEO_REQUEST_FORMATS_WAIT_SECONDS} seconds.")
-                await asyncio.sleep(NO_VIDEO_REQUEST_FORMATS_WAIT_SECONDS)
-                continue
-
-            results = await asyncio.gather(*[spawn_video_from_video_request_format(
-                format_id,
-                change_status=change_status,
-                insert_videos=insert_videos
-            ) for format_id in batch])
-
-            for result in results:
-                if result.status == "error":
-                    logger.info(
-                        f"Failed to spawn videos for request format {result.error['format_id']}: {result.error['message']}")
-                elif result.status == "success":
-                    logger.info(
-                        f"Successfully spawned videos for request {result.data['format_id']}", extra={"data": result.data})
-
-            processed_count += len(batch)
-            if max_count is not None and processed_count >= max_count:
-                break
-
-        except Exception as e:
-            log_exception(logger, e)
+    await run_stage_loop(
+        "spawn",
+        claim_batch=lambda limit, lease_token: fetch_next_video_request_formats_for_video_spawning(
+            limit, lease_token=lease_token, change_status=change_status).data["format_ids"],
+        process=lambda format_id: spawn_video_from_video_request_format(
+            format_id,
+            change_status=change_status,
+            insert_videos=insert_videos
+        ),
+        handle_result=log_spawning_result,
+        heartbeat=LeaseHeartbeat(video_request_formats_collection),
+        waker=StageWaker("spawn", db, SPAWN_WAKE_TRIGGERS),
+        concurrency=batch_size,
+        max_count=max_count
+    )
@@ -0,0 +1,73 @@
+import asyncio
+import os
+from lib.logger import setup_logger
+from lib.reaper import run_reaper
+from lib.describe_uploads import DESCRIPTION_QUEUE, find_and_describe_uploads
+from lib.spawn_videos import SPAWNING_QUEUE, find_video_request_formats_and_spawn_videos
+from lib.convert_assets import CONVERSION_QUEUE, find_and_convert_aspect_ratios
+from lib.generate_scripts import SCRIPT_GENERATION_QUEUE, find_videos_and_generate_scripts
+from lib.extract_scenes import SCENE_EXTRACTION_QUEUE, find_scripted_videos_and_extract_scenes
+from lib.narrate_scenes import NARRATION_QUEUE, find_scenes_and_narrate
+from lib.process_scenes import RENDER_QUEUE, find_and_render_videos
+
+logger = setup_logger(__name__)
+
+# Default number of items each stage works on at once. Override per stage with
+# STAGE_CONCURRENCY_<STAGE> (e.g. STAGE_CONCURRENCY_NARRATE=8) or --concurrency.
+DEFAULT_STAGE_CONCURRENCY = {
+    "describe": 3,
+    "spawn": 3,
+    "convert": 2,
+    "script": 3,
+    "extract": 3,
+    "narrate": 5,
+    "render": 2,
+}
+
+STAGES = {
+    "describe": find_and_describe_uploads,
+    "spawn": find_video_request_formats_and_spawn_videos,
+    "convert": find_and_convert_aspect_ratios,
+    "script": find_videos_and_generate_scripts,
+    "extract": find_scripted_videos_and_extract_scenes,
+    "narrate": find_scenes_and_narrate,
+    "render": find_and_render_videos,
+}
+
+
+LEASED_QUEUES = [
+    DESCRIPTION_QUEUE,
+    SPAWNING_QUEUE,
+    CONVERSION_QUEUE,
+    SCRIPT_GENERATION_QUEUE,
+    SCENE_EXTRACTION_QUEUE,
+    NARRATION_QUEUE,
+    RENDER_QUEUE,
+]
+
+
+def resolve_stage_concurrency(overrides=None):
+    concurrency = {}
+    for stage, default in DEFAULT_STAGE_CONCURRENCY.items():
+        env_value = os.getenv(f"STAGE_CONCURRENCY_{stage.upper()}")
+        concurrency[stage] = int(env_value) if env_value else default
+    concurrency.update(overrides or {})
+    return concurrency
+
+
+async def run_supervisor(stages=None, concurrency_overrides=None):
+    stages = stages or list(STAGES.keys())
+    unknown_stages = [stage for stage in stages if stage not in STAGES]
+    if unknown_stages:
+        raise ValueError(f"Unknown stages: {', '.join(unknown_stages)}")
+
+    concurrency = resolve_stage_concurrency(concurrency_overrides)
+    logger.info("Starting supervisor", extra={
+        "stages": stages,
+        "concurrency": {stage: concurrency[stage] for stage in stages}
+    })
+
+    await asyncio.gather(
+        run_reaper(LEASED_QUEUES),
+        *[STAGES[stage](batch_size=concurrency[stage]) for stage in stages]
+    )
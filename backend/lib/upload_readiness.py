@@ -0,0 +1,104 @@
+import pymongo
+from lib.async_database import adb
+from lib.database import db
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+# Every upload of a request must be described before its aspect ratios can be
+# converted. Each video request counts its undescribed uploads in
+# uploads_pending, and its aspect ratios carry uploads_ready so the conversion
+# claim stays a single indexed predicate.
+
+
+def aspect_ratios_ready_update(request_id, uploads_ready):
+    return (
+        {"request_id": request_id, "uploads_ready": {"$ne": uploads_ready}},
+        {"$set": {"uploads_ready": uploads_ready}}
+    )
+
+
+async def set_aspect_ratios_ready(request_id, uploads_ready):
+    await adb.video_request_aspect_ratios.update_many(
+        *aspect_ratios_ready_update(request_id, uploads_ready))
+
+
+async def get_uploads_pending(request_id):
+    video_request = await adb.video_requests.find_one(
+        {"_id": request_id}, {"uploads_pending": 1})
+    return video_request.get("uploads_pending", 0) if video_request else None
+
+
+async def sync_aspect_ratios_ready(request_id, uploads_pending):
+    """
+    Writes the readiness that `uploads_pending` implies, then re-reads the
+    counter and writes again until the two agree. The counter and the flag are
+    separate documents, so a writer that read the counter before a concurrent
+    $inc could otherwise leave a stale flag behind; re-reading after every
+    write makes the last writer's value the one that matches the counter.
+    """
+    while uploads_pending is not None:
+        uploads_ready = uploads_pending <= 0
+        await set_aspect_ratios_ready(request_id, uploads_ready)
+        uploads_pending = await get_uploads_pending(request_id)
+        if uploads_pending is None or (uploads_pending <= 0) == uploads_ready:
+            return uploads_ready
+
+
+async def count_new_upload(request_id):
+    """Call before the upload is inserted, so describing it can never count it off first."""
+    # Not ready from here on, so conversion stops claiming before the counter moves
+    await set_aspect_ratios_ready(request_id, False)
+    video_request = await adb.video_requests.find_one_and_update(
+        {"_id": request_id},
+        {"$inc": {"uploads_total": 1, "uploads_pending": 1}},
+        projection={"uploads_pending": 1},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if video_request:
+        await sync_aspect_ratios_ready(
+            request_id, video_request.get("uploads_pending", 0))
+
+
+async def count_discarded_upload(request_id):
+    """Takes back count_new_upload for an upload that was never inserted."""
+    video_request = await adb.video_requests.find_one_and_update(
+        {"_id": request_id},
+        {"$inc": {"uploads_total": -1, "uploads_pending": -1}},
+        projection={"uploads_pending": 1},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if video_request:
+        await sync_aspect_ratios_ready(
+            request_id, video_request.get("uploads_pending", 0))
+
+
+async def count_described_upload(request_id):
+    """Call once per upload, after it has moved to description_complete."""
+    video_request = await adb.video_requests.find_one_and_update(
+        {"_id": request_id},
+        {"$inc": {"uploads_pending": -1}},
+        projection={"uploads_pending": 1},
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    if video_request and video_request.get("uploads_pending", 0) <= 0:
+        if await sync_aspect_ratios_ready(request_id, video_request.get("uploads_pending", 0)):
+            logger.info(f"All uploads of request {request_id} are described")
+
+
+def recount_uploads(request_id):
+    """
+    Recomputes a request's upload counters and its aspect ratios' readiness from
+    the uploads themselves. Used to backfill older requests and repair drift.
+    """
+    uploads_total = db.uploads.count_documents({"request_id": request_id})
+    uploads_pending = db.uploads.count_documents(
+        {"request_id": request_id, "status": {"$ne": "description_complete"}})
+    db.video_requests.update_one(
+        {"_id": request_id},
+        {"$set": {"uploads_total": uploads_total, "uploads_pending": uploads_pending}}
+    )
+    db.video_request_aspect_ratios.update_many(
+        *aspect_ratios_ready_update(request_id, uploads_pending == 0))
+    return uploads_pending
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from pymongo.errors import OperationFailure, PyMongoError
+from lib.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MIN_POLL_WAIT_SECONDS = 1
+MAX_POLL_WAIT_SECONDS = 30
+MAX_CHANGE_STREAM_WAIT_SECONDS = 60
+CHANGE_STREAM_AWAIT_MS = 1000
+
+# Server errors meaning change streams will never work on this deployment:
+# 40573 = not a replica set / sharded cluster, 13 = unauthorized, 8000 = Atlas tier limitation
+CHANGE_STREAMS_UNSUPPORTED_CODES = {40573, 13, 8000}
+
+
+class StageWaker:
+    """
+    Puts an idle stage loop to sleep until its queue may have work again.
+
+    `triggers` is a list of (collection_name, match) pairs. The waker opens one
+    database-level change stream and wakes as soon as a document in one of the
+    collections is inserted or updated into a state matching its `match` filter.
+    When change streams are unavailable (standalone mongod, missing privileges)
+    it falls back to polling with exponential backoff.
+    """
+
+    def __init__(self, stage, db, triggers, min_poll_wait=MIN_POLL_WAIT_SECONDS, max_poll_wait=MAX_POLL_WAIT_SECONDS, max_stream_wait=MAX_CHANGE_STREAM_WAIT_SECONDS):
+        self.stage = stage
+        self.db = db
+        self.triggers = triggers
+        self.min_poll_wait = min_poll_wait
+        self.max_poll_wait = max_poll_wait
+        self.max_stream_wait = max_stream_wait
+        self.poll_wait = min_poll_wait
+        self.change_streams_available = True
+        self._stream = None
+
+    def pipeline(self):
+        trigger_matches = []
+        for collection_name, match in self.triggers:
+            trigger_match = {"ns.coll": collection_name}
+            for field, value in match.items():
+                trigger_match[f"fullDocument.{field}"] = value
+            trigger_matches.append(trigger_match)
+
+        return [{
+            "$match": {
+                "operationType": {"$in": ["insert", "update", "replace"]},
+                "$or": trigger_matches
+            }
+        }]
+
+    def _open_stream(self):
+        self._stream = self.db.watch(
+            self.pipeline(),
+            full_document="updateLookup",
+            max_await_time_ms=CHANGE_STREAM_AWAIT_MS
+        )
+
+    def _wait_for_change(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._stream.try_next() is not None:
+                return True
+        return False
+
+    async def wait(self):
+        if self.change_streams_available:
+            try:
+                if self._stream is None:
+                    await asyncio.to_thread(self._open_stream)
+                    # Work may have landed between the empty claim and the stream
+                    # opening, so return and let the caller poll once more.
+                    return
+                woke = await asyncio.to_thread(self._wait_for_change, self.max_stream_wait)
+                if not woke:
+                    logger.info(
+                        f"No {self.stage} work seen for {self.max_stream_wait} seconds. Re-polling.")
+                return
+            except OperationFailure as e:
+                self.close()
+                if e.code in CHANGE_STREAMS_UNSUPPORTED_CODES:
+                    logger.warning(
+                        f"Change streams unavailable for {self.stage}, falling back to polling: {e}")
+                    self.change_streams_available = False
+                else:
+                    logger.warning(
+                        f"Change stream for {self.stage} failed, reopening on next wait: {e}")
+            except PyMongoError as e:
+                self.close()
+                logger.warning(
+                    f"Change stream for {self.stage} failed, reopening on next wait: {e}")
+
+        logger.info(
+            f"No {self.stage} work found. Sleeping for {self.poll_wait} seconds.")
+        await asyncio.sleep(self.poll_wait)
+        self.poll_wait = min(self.poll_wait * 2, self.max_poll_wait)
+
+    def reset(self):
+        """Call after a successful claim so the next idle period polls quickly again."""
+        self.poll_wait = self.min_poll_wait
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except PyMongoError:
+                pass
+            self._stream = None
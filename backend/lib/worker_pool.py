@@ -0,0 +1,161 @@
+import asyncio
+import time
+from lib.database import get_pool_metrics
+from lib.db_metrics import command_metrics, current_stage, db_scope, get_db_time_metrics
+from lib.indexes import ensure_indexes
+from lib.job_queue import lease_scope, new_lease_token
+from lib.logger import setup_logger
+from utils.exception_helpers import log_exception
+
+logger = setup_logger(__name__)
+
+UTILIZATION_REPORT_INTERVAL_SECONDS = 60
+
+
+class SlotUtilization:
+    """Tracks how busy a stage's worker slots are over time."""
+
+    def __init__(self, stage, slots):
+        self.stage = stage
+        self.slots = slots
+        self.started_at = time.monotonic()
+        self.busy_slots = 0
+        self.busy_seconds = 0.0
+        self.completed = 0
+        self._last_change = self.started_at
+        self._last_report = self.started_at
+
+    def _accumulate(self):
+        now = time.monotonic()
+        self.busy_seconds += self.busy_slots * (now - self._last_change)
+        self._last_change = now
+        return now
+
+    def slot_taken(self):
+        self._accumulate()
+        self.busy_slots += 1
+
+    def slot_freed(self):
+        self._accumulate()
+        self.busy_slots -= 1
+        self.completed += 1
+
+    def snapshot(self):
+        now = self._accumulate()
+        elapsed = max(now - self.started_at, 1e-9)
+        return {
+            "stage": self.stage,
+            "slots": self.slots,
+            "busy_slots": self.busy_slots,
+            "completed": self.completed,
+            "elapsed_seconds": round(elapsed, 1),
+            "utilization": round(self.busy_seconds / (self.slots * elapsed), 3),
+            "completed_per_minute": round(self.completed * 60 / elapsed, 2),
+        }
+
+    def report(self):
+        self._last_report = time.monotonic()
+        logger.info(f"{self.stage} slot utilization",
+                    extra={"data": {
+                        **self.snapshot(),
+                        "mongo_pool": get_pool_metrics(),
+                        "db_time": get_db_time_metrics(self.stage)
+                    }})
+
+    def maybe_report(self):
+        if time.monotonic() - self._last_report >= UTILIZATION_REPORT_INTERVAL_SECONDS:
+            self.report()
+
+
+async def run_stage_loop(stage, claim_batch, process, waker, heartbeat=None, handle_result=None, concurrency=1, max_count=None):
+    """
+    Runs a stage as a sliding window of at most `concurrency` jobs.
+
+    Whenever slots are free, `claim_batch(limit, lease_token)` leases up to that
+    many jobs in one go under `lease_token` and returns their ids (empty when
+    the queue is empty), so a new job starts as soon as any slot frees up
+    instead of waiting for a whole batch. `process(job_id)` does the work inside
+    a `lease_scope`, so its writes can check the lease is still ours, and its
+    result is passed to `handle_result`.
+    While a job runs, `heartbeat` keeps its lease from expiring. Stops after
+    `max_count` claims if given. Makes sure the queue indexes exist first.
+
+    Claims go through synchronous pymongo, so they run on a thread to keep the
+    event loop free for the jobs already in flight.
+    """
+    # Tasks and claim threads started from here inherit the stage tag
+    current_stage.set(stage)
+    await asyncio.to_thread(ensure_indexes)
+
+    utilization = SlotUtilization(stage, concurrency)
+    slot_freed = asyncio.Event()
+    in_flight = set()
+    claimed_count = 0
+
+    async def run_job(job_id, lease_token):
+        started_at = time.monotonic()
+        try:
+            with db_scope(job_id=job_id), lease_scope(lease_token):
+                result = await process(job_id)
+            if handle_result:
+                handle_result(result)
+        except Exception as e:
+            log_exception(logger, e)
+        finally:
+            job_db_time = command_metrics.pop_job(job_id)
+            if job_db_time:
+                logger.info(f"{stage} job database time", extra={"data": {
+                    "stage": stage,
+                    "job_id": job_id,
+                    "job_ms": round((time.monotonic() - started_at) * 1000, 1),
+                    **job_db_time
+                }})
+            if heartbeat:
+                heartbeat.remove(job_id, lease_token)
+            utilization.slot_freed()
+            slot_freed.set()
+
+    if heartbeat:
+        heartbeat.start()
+
+    try:
+        while max_count is None or claimed_count < max_count:
+            free_slots = concurrency - utilization.busy_slots
+            if free_slots <= 0:
+                slot_freed.clear()
+                await slot_freed.wait()
+                continue
+
+            if max_count is not None:
+                free_slots = min(free_slots, max_count - claimed_count)
+
+            lease_token = new_lease_token()
+            try:
+                job_ids = await asyncio.to_thread(claim_batch, free_slots, lease_token)
+            except Exception as e:
+                log_exception(logger, e)
+                job_ids = []
+
+            if not job_ids:
+                utilization.maybe_report()
+                await waker.wait()
+                continue
+
+            waker.reset()
+            claimed_count += len(job_ids)
+            for job_id in job_ids:
+                if heartbeat:
+                    heartbeat.add(job_id, lease_token)
+                utilization.slot_taken()
+                task = asyncio.create_task(run_job(job_id, lease_token))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            utilization.maybe_report()
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    finally:
+        if heartbeat:
+            heartbeat.stop()
+        waker.close()
+        utilization.report()
@@ -5,6 +5,7 @@ from models.video_request import VideoRequest
 from models.input_video_request import InputVideoRequest
 from models.video_request_aspect_ratio import VideoRequestAspectRatio
 from models.video_request_format import VideoRequestFormat
+import asyncio
 import os
 
 from fastapi import FastAPI, File, UploadFile, Path, Response, HTTPException
@@ -16,15 +17,19 @@ from bson.objectid import ObjectId
 from fastapi.middleware.cors import CORSMiddleware
 import magic
 
-from lib.database import get_db_connection
+from lib.async_database import adb
+from lib.branding import invalidate_branding
+from lib.database import connection_manager
+from lib.indexes import ensure_indexes
 from lib.logger import setup_logger
+from lib.repository import find_upload_id, get_video_request_status
+from lib.upload_readiness import count_discarded_upload, count_new_upload
 
-client, db = get_db_connection()
-video_requests_collection = db.get_collection("video_requests")
-video_request_formats_collection = db.get_collection("video_request_formats")
-video_request_aspect_ratios_collection = db.get_collection(
+video_requests_collection = adb.get_collection("video_requests")
+video_request_formats_collection = adb.get_collection("video_request_formats")
+video_request_aspect_ratios_collection = adb.get_collection(
     "video_request_aspect_ratios")
-uploads_collection = db.get_collection("uploads")
+uploads_collection = adb.get_collection("uploads")
 
 load_dotenv()
 
@@ -45,6 +50,12 @@ app.add_middleware(
 logger = setup_logger("uvicorn")
 
 
+@app.on_event("startup")
+async def create_indexes():
+    # Index builds are synchronous pymongo, so keep them off the event loop
+    await asyncio.to_thread(ensure_indexes)
+
+
 origins = [
     "*"
 ]
@@ -59,48 +70,49 @@ app.add_middleware(
 
 
 @app.post("/video-request/")
-def create_video_request(video_request: InputVideoRequest):
+async def create_video_request(video_request: InputVideoRequest):
     request_id = str(ObjectId())
     video_request_dict = video_request.model_dump(exclude={"formats"})
     video_request_dict["_id"] = request_id
     video_request_obj = VideoRequest(**video_request_dict)
-    # Insert the video request into the video_requests collection
-    video_requests_collection.insert_one(
-        video_request_obj.model_dump(by_alias=True))
 
-    # Now, handle the formats
+    # Build every document up front so intake costs one write per collection,
+    # however many formats the request has
+    aspect_ratio_dicts = {}
+    format_dicts = []
     for format in video_request.formats:
-        format_dict = format.model_dump()
-        format_dict["request_id"] = request_id  # Link format to the request
-        format_id = str(ObjectId())
-        print(format_id)
-        video_request_aspect_ratio_result = video_request_aspect_ratios_collection.find_one(
-            {
-                "request_id": request_id,
-                "aspect_ratio": format.aspect_ratio.replace(":", "x")}
-        )
-
-        if not video_request_aspect_ratio_result:
-            aspect_ratio_id = str(ObjectId())
+        if format.aspect_ratio not in aspect_ratio_dicts:
             video_request_aspect_ratio = VideoRequestAspectRatio(
-                id=aspect_ratio_id,
+                id=str(ObjectId()),
                 request_id=request_id,
                 aspect_ratio=format.aspect_ratio,
                 status="pending"
             )
-            aspect_ratio_dict = video_request_aspect_ratio.model_dump(
+            aspect_ratio_dicts[format.aspect_ratio] = video_request_aspect_ratio.model_dump(
                 by_alias=True)
-            video_request_aspect_ratios_collection.insert_one(
-                aspect_ratio_dict)
 
         video_request_format = VideoRequestFormat(
-            id=format_id,
+            id=str(ObjectId()),
             request_id=request_id,
             aspect_ratio=format.aspect_ratio,
             length=format.length
         )
-        format_dict = video_request_format.model_dump(by_alias=True)
-        video_request_formats_collection.insert_one(format_dict)
+        format_dicts.append(video_request_format.model_dump(by_alias=True))
+
+    # Children first and the video request last, so a request that exists is
+    # complete; a failed intake removes whatever it had written
+    try:
+        if aspect_ratio_dicts:
+            await video_request_aspect_ratios_collection.insert_many(
+                list(aspect_ratio_dicts.values()))
+        if format_dicts:
+            await video_request_formats_collection.insert_many(format_dicts)
+        await video_requests_collection.insert_one(
+            video_request_obj.model_dump(by_alias=True))
+    except Exception:
+        await video_request_formats_collection.delete_many({"request_id": request_id})
+        await video_request_aspect_ratios_collection.delete_many({"request_id": request_id})
+        raise
 
     return {"request_id": request_id}
 
@@ -108,9 +120,7 @@ def create_video_request(video_request: InputVideoRequest):
 @app.post("/video-request/{request_id}/media")
 async def upload_media(request_id: str = Path(...), file: UploadFile = File(...)):
     # Check if an upload with the same filename already exists for the video request
-    existing_upload = uploads_collection.find_one(
-        {"request_id": request_id, "filename": file.filename})
-    if existing_upload:
+    if await find_upload_id(request_id, file.filename):
         return Response(status_code=204)
 
     # Generate a new asset ID
@@ -141,8 +151,15 @@ async def upload_media(request_id: str = Path(...), file: UploadFile = File(...)
         filename_without_extension=filename_without_extension
     )
 
+    # Count it first: once inserted it can be described and counted off
+    await count_new_upload(request_id)
     # Save the asset in MongoDB
-    uploads_collection.insert_one(upload.model_dump(by_alias=True))
+    try:
+        await uploads_collection.insert_one(upload.model_dump(by_alias=True))
+    except Exception:
+        await count_discarded_upload(request_id)
+        raise
+    await invalidate_branding(request_id)
 
     return {"upload_id": upload_id}
 
@@ -161,16 +178,14 @@ async def handle_annotations(request_id: str, annotation_data: AnnotationData):
     # Access additional data
     additional_data = annotation_data.dict(exclude={"asset_filename"})
 
-    existing_upload = uploads_collection.find_one(
-        {"request_id": request_id, "filename": asset_filename})
-    if not existing_upload:
-        return Response(status_code=404)
-
     # Update the existing upload with the additional data as annotations
-    uploads_collection.update_one(
-        {"_id": existing_upload["_id"]},
+    update_result = await uploads_collection.update_one(
+        {"request_id": request_id, "filename": asset_filename},
         {"$set": {"annotations": additional_data}}
     )
+    if update_result.matched_count == 0:
+        return Response(status_code=404)
+    await invalidate_branding(request_id)
 
     return {"status": "success", "message": "Annotation added to the upload"}
 
@@ -178,23 +193,23 @@ async def handle_annotations(request_id: str, annotation_data: AnnotationData):
 @app.post("/video-request/{request_id}/finalize")
 async def finalize_video_request(request_id: str = Path(...)):
     # Find the video request by its ID
-    video_request = video_requests_collection.find_one({"_id": request_id})
+    status = await get_video_request_status(request_id)
 
-    if video_request:
+    if status:
         # Check if the video request status is "pending"
-        if video_request["status"] == "pending":
+        if status == "pending":
             # Update the video request status to "requested"
-            video_requests_collection.update_one(
+            await video_requests_collection.update_one(
                 {"_id": request_id},
                 {"$set": {"status": "requested"}}
             )
             # Update all related video_request_formats' status from "pending" to "requested"
-            video_request_formats_collection.update_many(
+            await video_request_formats_collection.update_many(
                 {"request_id": request_id, "status": "pending"},
                 {"$set": {"status": "requested"}}
             )
             # Update all related video_request_aspect_ratios' status from "pending" to "requested"
-            video_request_aspect_ratios_collection.update_many(
+            await video_request_aspect_ratios_collection.update_many(
                 {"request_id": request_id, "status": "pending"},
                 {"$set": {"status": "requested"}}
             )
@@ -215,4 +230,4 @@ def read_root():
 
 @app.get("/ping")
 def ping():
-    return client.admin.command('ping')
+    return connection_manager.client.admin.command('ping')
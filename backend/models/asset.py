@@ -9,12 +9,14 @@ from models.upload import ImageMetadata, VideoMetadata
 
 class AssetStatus(str, Enum):
     CONVERTED = "converted"
+    CONVERSION_FAILED = "conversion_failed"
     DECOMMISSIONED = "decommissioned"
 
 
 class Asset(BaseModel):
     id: str = Field(alias="_id", default_factory=lambda: str(ObjectId()))
     request_id: str
+    upload_id: Optional[str] = None
     filename: str
     content_type: str
     file_path: str
@@ -29,6 +31,7 @@ class Asset(BaseModel):
     conversion_start_time: Optional[datetime.datetime] = None
     conversion_end_time: Optional[datetime.datetime] = None
     conversion_duration: Optional[float] = None
+    conversion_error: Optional[str] = None
 
     @validator("metadata", pre=True, always=True)
     def set_metadata_content_type(cls, value, values):
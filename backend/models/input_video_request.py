@@ -17,3 +17,4 @@ class InputVideoRequest(BaseModel):
     formats: List[InputVideoFormat]
     spawning_attempts: int = 0
     brand_link: Optional[str] = None
+    priority: int = 0
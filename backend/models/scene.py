@@ -25,6 +25,9 @@ class Scene(BaseModel):
     narration_language: Optional[str] = None
     duration: Optional[float] = None
     asset_filenames: Optional[List[str]] = None
+    # Sort key within the video, see lib.scene_positions
+    position: Optional[float] = None
+    # Linked list order of scenes extracted before positions, kept for backfill
     prev_scene_id: Optional[str] = None
     next_scene_id: Optional[str] = None
     scene_narration_attempts: int = 0
@@ -32,3 +35,6 @@ class Scene(BaseModel):
     scene_narration_end_time: Optional[datetime.datetime] = None
     scene_narration_duration: Optional[float] = None
     generated_scene_video: Optional[str] = None
+    worker_id: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime.datetime] = None
@@ -53,6 +53,9 @@ class Upload(BaseModel):
     description_start_time: Optional[datetime.datetime] = None
     description_end_time: Optional[datetime.datetime] = None
     description_duration: Optional[float] = None
+    worker_id: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime.datetime] = None
 
     @validator("metadata", pre=True, always=True)
     def set_metadata_content_type(cls, value, values):
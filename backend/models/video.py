@@ -2,7 +2,7 @@ import math
 from pydantic import BaseModel, Field
 from enum import Enum
 from bson.objectid import ObjectId
-from typing import Optional
+from typing import List, Optional
 import datetime
 
 
@@ -10,13 +10,16 @@ class VideoStatus(str, Enum):
     REQUESTED = "requested"
     SCRIPT_GENERATION_STARTED = "script_generation_started"
     SCRIPT_GENERATION_COMPLETE = "script_generation_complete"
+    SCRIPT_GENERATION_FAILED = "script_generation_failed"
     SCENE_EXTRACTION_QUEUED = "scene_extraction_queued"
     SCENE_EXTRACTION_STARTED = "scene_extraction_started"
     SCENE_EXTRACTION_COMPLETE = "scene_extraction_complete"
+    SCENE_EXTRACTION_FAILED = "scene_extraction_failed"
     SCENE_NARRATION_STARTED = "scene_narration_started"
     SCENE_NARRATION_COMPLETE = "scene_narration_complete"
-    # PROCESSING = "processing"
-    # COMPLETED = "completed"
+    PROCESSING_STARTED = "processing_started"
+    PROCESSING_COMPLETE = "processing_complete"
+    PROCESSING_FAILED = "processing_failed"
 
 
 class Video(BaseModel):
@@ -50,6 +53,25 @@ class Video(BaseModel):
     scene_narration_end_time: Optional[datetime.datetime] = None
     scene_narration_duration: Optional[float] = None
     scene_narration_attempts: int = 0
+    # Maintained by scene extraction and narration so ready videos can be found
+    # with one indexed query on (status, scenes_pending)
+    scenes_total: int = 0
+    scenes_pending: Optional[int] = None
+    scenes_narrated: int = 0
+    narrated_scene_ids: List[str] = []
+    scenes_checked_at: Optional[datetime.datetime] = None
+
+    # Rendering
+    processing_start_time: Optional[datetime.datetime] = None
+    processing_end_time: Optional[datetime.datetime] = None
+    processing_duration: Optional[float] = None
+    processing_attempts: int = 0
+    final_cut_path: Optional[str] = None
+
+    # Queue lease
+    worker_id: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime.datetime] = None
 
     @property
     def number_of_words(self) -> int:
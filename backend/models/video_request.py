@@ -20,3 +20,10 @@ class VideoRequest(BaseModel):
     status: VideoRequestStatus = VideoRequestStatus.PENDING
     spawning_attempts: int = 0
     brand_link: Optional[str] = None
+    # Higher priority requests get a larger share of every stage's workers
+    priority: int = 0
+    # Uploads not yet described, see lib.upload_readiness
+    uploads_total: int = 0
+    uploads_pending: int = 0
+    # Bumped when uploads or annotations change, see lib.branding
+    branding_version: int = 0
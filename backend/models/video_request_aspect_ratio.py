@@ -10,6 +10,7 @@ class VideoRequestAspectRatioStatus(str, Enum):
     REQUESTED = "requested"
     CONVERSION_STARTED = "conversion_started"
     CONVERSION_COMPLETE = "conversion_complete"
+    CONVERSION_FAILED = "conversion_failed"
 
 
 class VideoRequestAspectRatio(BaseModel):
@@ -17,7 +18,12 @@ class VideoRequestAspectRatio(BaseModel):
     request_id: str
     aspect_ratio: str
     status: VideoRequestAspectRatioStatus = VideoRequestAspectRatioStatus.PENDING
+    # False while the request has undescribed uploads, see lib.upload_readiness
+    uploads_ready: bool = True
     conversion_attempts: int = 0
     conversion_start_time: Optional[datetime.datetime] = None
     conversion_end_time: Optional[datetime.datetime] = None
     conversion_duration: Optional[float] = None
+    worker_id: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime.datetime] = None
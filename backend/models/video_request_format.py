@@ -10,6 +10,7 @@ class VideoRequestFormatStatus(str, Enum):
     CONVERTED = "converted"
     SPAWNING_STARTED = "spawning_started"
     SPAWNING_COMPLETE = "spawning_started"
+    SPAWNING_FAILED = "spawning_failed"
     GENERATED = "generated"
 
 
@@ -23,3 +24,6 @@ class VideoRequestFormat(BaseModel):
     spawning_start_time: Optional[datetime.datetime] = None
     spawning_end_time: Optional[datetime.datetime] = None
     spawning_duration: Optional[float] = None
+    worker_id: Optional[str] = None
+    lease_token: Optional[str] = None
+    lease_expires_at: Optional[datetime.datetime] = None
@@ -0,0 +1,26 @@
+import argparse
+import os
+import sys
+
+# Add the project's root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.database import db
+from lib.indexes import ensure_indexes
+from lib.scene_counters import recount_scenes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute scenes_pending/scenes_narrated on videos awaiting render")
+    parser.add_argument("--video-id", default=None,
+                        help="Only recount this video")
+
+    args = parser.parse_args()
+
+    ensure_indexes()
+    query = {"_id": args.video_id} if args.video_id else {
+        "status": "scene_extraction_complete"}
+    for video in db.videos.find(query, {"_id": 1}):
+        pending = recount_scenes(video["_id"])
+        print(f"{video['_id']}  scenes_pending={pending}")
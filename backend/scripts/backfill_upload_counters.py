@@ -0,0 +1,25 @@
+import argparse
+import os
+import sys
+
+# Add the project's root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.database import db
+from lib.indexes import ensure_indexes
+from lib.upload_readiness import recount_uploads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute uploads_pending on video requests and uploads_ready on their aspect ratios")
+    parser.add_argument("--request-id", default=None,
+                        help="Only recount this request")
+
+    args = parser.parse_args()
+
+    ensure_indexes()
+    query = {"_id": args.request_id} if args.request_id else {}
+    for video_request in db.video_requests.find(query, {"_id": 1}):
+        pending = recount_uploads(video_request["_id"])
+        print(f"{video_request['_id']}  uploads_pending={pending}")
@@ -0,0 +1,27 @@
+import argparse
+import os
+import sys
+from pprint import pprint
+
+# Add the project's root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.indexes import INDEX_VERSION, check_indexes, ensure_indexes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Create the queue and lookup indexes, or check the hot queries use them")
+    parser.add_argument("--check", action="store_true",
+                        help="Explain the canonical queries and report collection scans and in-memory sorts")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-apply the indexes even if this version was already applied")
+
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check_indexes()
+        pprint(problems)
+        sys.exit(1 if problems else 0)
+
+    ensure_indexes(force=args.force)
+    print(f"Indexes at version {INDEX_VERSION}")
@@ -0,0 +1,30 @@
+import argparse
+import os
+import sys
+
+# Add the project's root directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.database import db
+from lib.fair_scheduler import queue_depth_by_request
+from lib.supervisor import LEASED_QUEUES
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Show ready and in-progress jobs per request for every stage queue")
+    parser.add_argument("--request-id", default=None,
+                        help="Only show this request")
+
+    args = parser.parse_args()
+
+    for queue in LEASED_QUEUES:
+        depths = queue_depth_by_request(
+            db.get_collection(queue.collection_name), queue)
+        if args.request_id:
+            depths = {request_id: depth for request_id, depth in depths.items()
+                      if request_id == args.request_id}
+        print(f"{queue.name}:")
+        for request_id, depth in sorted(depths.items(), key=lambda item: -item[1]["ready"]):
+            print(
+                f"  {request_id}  ready={depth['ready']}  in_progress={depth['in_progress']}")
@@ -7,11 +7,10 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.video.generate_scene_video import generate_scene_body_video
-from lib.database import get_db_connection
+from lib.database import db
 from models.scene import Scene
 from models.video import Video
 
-_client, db = get_db_connection()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -0,0 +1,22 @@
+import os
+import sys
+import pytest
+
+# Modules import each other relative to backend/, as the cronjobs and server run them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# ...and the test helpers, such as the in-memory MongoDB, from tests/
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Stage modules build their provider clients on import; the tests never call them
+for key in ("OPENAI_API_KEY", "ANTHROPIC_API_KEY", "MISTRAL_API_KEY", "OCTOAI_API_TOKEN", "DEEPGRAM_API_KEY"):
+    os.environ.setdefault(key, "test")
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    """Points `lib.async_database.adb` at a fresh in-memory database."""
+    from lib.async_database import AsyncConnectionManager
+    from in_memory_mongo import InMemoryDatabase
+    database = InMemoryDatabase()
+    monkeypatch.setattr(AsyncConnectionManager, "db", property(lambda self: database))
+    return database
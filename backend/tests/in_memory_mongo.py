@@ -0,0 +1,336 @@
+import copy
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+# In-memory stand-in for the Motor database behind `lib.async_database.adb`,
+# installed by the `memory_db` fixture. Supports the subset of the Motor API
+# the handlers and job bodies use: equality and comparison queries on dotted
+# paths, $set / $inc / $unset / $push updates, projections, sort and limit, and
+# ordered bulk writes. Code on the synchronous `lib.database.db` is not covered.
+
+def _get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None, False
+        value = value[part]
+    return value, True
+
+
+def _set_path(document, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.setdefault(part, {})
+    document[parts[-1]] = value
+
+
+def _unset_path(document, path):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        document = document.get(part, {})
+    document.pop(parts[-1], None)
+
+
+def _equals(value, operand):
+    # As in MongoDB, an array field equals a scalar it contains
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+
+def _matches_condition(value, exists, condition):
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$eq" and not _equals(value, operand):
+                return False
+            if operator == "$ne" and _equals(value, operand):
+                return False
+            if operator == "$in" and not any(_equals(value, item) for item in operand):
+                return False
+            if operator == "$nin" and any(_equals(value, item) for item in operand):
+                return False
+            if operator == "$exists" and exists != bool(operand):
+                return False
+            if operator == "$not" and _matches_condition(value, exists, operand):
+                return False
+            if operator in ("$lt", "$lte", "$gt", "$gte"):
+                if value is None:
+                    return False
+                if operator == "$lt" and not value < operand:
+                    return False
+                if operator == "$lte" and not value <= operand:
+                    return False
+                if operator == "$gt" and not value > operand:
+                    return False
+                if operator == "$gte" and not value >= operand:
+                    return False
+        return True
+    return _equals(value, condition)
+
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(matches(document, sub_query) for sub_query in condition):
+                return False
+        elif key == "$or":
+            if not any(matches(document, sub_query) for sub_query in condition):
+                return False
+        else:
+            value, exists = _get_path(document, key)
+            if not _matches_condition(value, exists, condition):
+                return False
+    return True
+
+
+def _apply_update(document, update, inserting=False):
+    for path, value in update.get("$set", {}).items():
+        _set_path(document, path, copy.deepcopy(value))
+    if inserting:
+        for path, value in update.get("$setOnInsert", {}).items():
+            _set_path(document, path, copy.deepcopy(value))
+    for path, amount in update.get("$inc", {}).items():
+        value, _exists = _get_path(document, path)
+        _set_path(document, path, (value or 0) + amount)
+    for path in update.get("$unset", {}):
+        _unset_path(document, path)
+    for path, value in update.get("$push", {}).items():
+        values, _exists = _get_path(document, path)
+        _set_path(document, path, (values or []) + [copy.deepcopy(value)])
+
+
+def _update_counts(documents, update):
+    """Applies the update to each document and counts the ones it actually changed."""
+    modified = 0
+    for document in documents:
+        before = copy.deepcopy(document)
+        _apply_update(document, update)
+        modified += document != before
+    return {"n": len(documents), "nModified": modified}
+
+
+def _project(document, projection):
+    if document is None or not projection:
+        return copy.deepcopy(document)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+    including = [field for field, flag in projection.items() if flag]
+    if including:
+        projected = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+        for path in including:
+            value, exists = _get_path(document, path)
+            if exists:
+                _set_path(projected, path, copy.deepcopy(value))
+        return projected
+    projected = copy.deepcopy(document)
+    for path, flag in projection.items():
+        if not flag:
+            _unset_path(projected, path)
+    return projected
+
+
+def _sorted(documents, sort):
+    if not sort:
+        return list(documents)
+    if isinstance(sort, str):
+        sort = [(sort, 1)]
+    result = list(documents)
+    # Stable sorts applied from the last key to the first honour each direction;
+    # missing values sort first, as in MongoDB
+    for field, direction in reversed(sort):
+        def sort_key(document, field=field):
+            value, exists = _get_path(document, field)
+            return (exists and value is not None, value if exists and value is not None else 0)
+        result.sort(key=sort_key, reverse=direction < 0)
+    return result
+
+
+class InMemoryCursor:
+    def __init__(self, documents, projection):
+        self._documents = documents
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = [(key_or_list, direction or 1)] if isinstance(
+            key_or_list, str) else key_or_list
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def _results(self):
+        documents = _sorted(self._documents, self._sort)
+        if self._limit:
+            documents = documents[:self._limit]
+        return [_project(document, self._projection) for document in documents]
+
+    async def to_list(self, length=None):
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        self._iterator = iter(self._results())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class InMemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self._documents = {}
+
+    def _matching(self, query):
+        return [document for document in self._documents.values() if matches(document, query or {})]
+
+    def find(self, filter=None, projection=None, sort=None, limit=0):
+        cursor = InMemoryCursor(self._matching(filter), projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.limit(limit)
+
+    async def find_one(self, filter=None, projection=None, sort=None):
+        results = await self.find(filter, projection, sort=sort, limit=1).to_list()
+        return results[0] if results else None
+
+    async def count_documents(self, filter):
+        return len(self._matching(filter))
+
+    async def distinct(self, key, filter=None):
+        values = []
+        for document in self._matching(filter):
+            value, exists = _get_path(document, key)
+            if exists and value not in values:
+                values.append(value)
+        return values
+
+    async def insert_one(self, document):
+        document.setdefault("_id", ObjectId())
+        self._documents[document["_id"]] = copy.deepcopy(document)
+        return InsertOneResult(document["_id"], True)
+
+    async def insert_many(self, documents, ordered=True):
+        inserted_ids = []
+        for document in documents:
+            inserted_ids.append((await self.insert_one(document)).inserted_id)
+        return InsertManyResult(inserted_ids, True)
+
+    def _upsert(self, query, update):
+        document = {key: value for key, value in query.items()
+                    if not key.startswith("$") and not isinstance(value, dict)}
+        document.setdefault("_id", ObjectId())
+        _apply_update(document, update, inserting=True)
+        self._documents[document["_id"]] = document
+        return document
+
+    async def update_one(self, filter, update, upsert=False):
+        matched = _sorted(self._matching(filter), [("_id", 1)])[:1]
+        if not matched and upsert:
+            document = self._upsert(filter, update)
+            return UpdateResult({"n": 0, "nModified": 0, "upserted": document["_id"]}, True)
+        return UpdateResult(_update_counts(matched, update), True)
+
+    async def update_many(self, filter, update, upsert=False):
+        matched = self._matching(filter)
+        if not matched and upsert:
+            document = self._upsert(filter, update)
+            return UpdateResult({"n": 0, "nModified": 0, "upserted": document["_id"]}, True)
+        return UpdateResult(_update_counts(matched, update), True)
+
+    async def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False, return_document=ReturnDocument.BEFORE):
+        matched = _sorted(self._matching(filter), sort)[:1]
+        if not matched:
+            if not upsert:
+                return None
+            document = self._upsert(filter, update)
+            return _project(document, projection) if return_document == ReturnDocument.AFTER else None
+        document = matched[0]
+        before = _project(document, projection)
+        _apply_update(document, update)
+        return _project(document, projection) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_many(self, filter):
+        matched = self._matching(filter)
+        for document in matched:
+            del self._documents[document["_id"]]
+        return DeleteResult({"n": len(matched)}, True)
+
+    async def delete_one(self, filter):
+        matched = _sorted(self._matching(filter), [("_id", 1)])[:1]
+        for document in matched:
+            del self._documents[document["_id"]]
+        return DeleteResult({"n": len(matched)}, True)
+
+    async def bulk_write(self, requests, ordered=True):
+        recorder = _BulkRecorder()
+        for request in requests:
+            # The write models hand their arguments to a bulk builder, as they do
+            # for pymongo's own bulk_write
+            request._add_to_bulk(recorder)
+        counts = {"nInserted": 0, "nUpserted": 0, "nMatched": 0,
+                  "nModified": 0, "nRemoved": 0, "upserted": []}
+        for index, (kind, arguments) in enumerate(recorder.operations):
+            if kind == "insert":
+                await self.insert_one(arguments["document"])
+                counts["nInserted"] += 1
+            elif kind == "update":
+                update = self.update_many if arguments["multi"] else self.update_one
+                result = await update(arguments["selector"], arguments["update"],
+                                      upsert=arguments["upsert"])
+                counts["nMatched"] += result.matched_count
+                counts["nModified"] += result.modified_count
+                if result.upserted_id is not None:
+                    counts["nUpserted"] += 1
+                    counts["upserted"].append(
+                        {"index": index, "_id": result.upserted_id})
+            else:
+                delete = self.delete_one if arguments["limit"] == 1 else self.delete_many
+                counts["nRemoved"] += (await delete(arguments["selector"])).deleted_count
+        return BulkWriteResult(counts, True)
+
+
+class _BulkRecorder:
+    """Collects the operations pymongo's write models add to a bulk write."""
+
+    def __init__(self):
+        self.operations = []
+
+    def add_insert(self, document):
+        self.operations.append(("insert", {"document": document}))
+
+    def add_update(self, selector, update, multi=False, upsert=False, **options):
+        self.operations.append(("update", {
+            "selector": selector, "update": update, "multi": multi, "upsert": bool(upsert)}))
+
+    def add_replace(self, selector, replacement, upsert=False, **options):
+        raise TypeError("ReplaceOne is not supported in memory")
+
+    def add_delete(self, selector, limit, **options):
+        self.operations.append(("delete", {"selector": selector, "limit": limit}))
+
+
+class InMemoryDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def get_collection(self, name):
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name)
+        return self._collections[name]
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def drop(self):
+        self._collections.clear()
+
+
+in_memory_db = InMemoryDatabase()
@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from lib.async_database import adb
+from lib.asset_resolver import AssetResolver
+
+
+def asset(asset_id, filename, request_id="r1", aspect_ratio="9x16", status="converted"):
+    return {"_id": asset_id, "request_id": request_id, "filename": filename, "content_type": "image/png",
+            "file_path": f"/assets/{asset_id}.png", "file_extension": ".png",
+            "filename_without_extension": filename.rsplit(".", 1)[0], "status": status,
+            "description": "a long description", "metadata": {"content_type": "image", "aspect_ratio": aspect_ratio}}
+
+
+@pytest.fixture
+def finds(monkeypatch, memory_db):
+    asyncio.run(adb.assets.insert_many([
+        asset("a1", "logo.png"),
+        asset("a2", "photo.png"),
+        asset("a3", "photo.png", request_id="r2"),
+        asset("a4", "logo.png", aspect_ratio="16x9"),
+        asset("a5", "draft.png", status="conversion_failed"),
+    ]))
+    collection = memory_db.get_collection("assets")
+    find = collection.find
+    queries = []
+
+    def recording_find(filter=None, projection=None, **kwargs):
+        queries.append((filter, projection))
+        return find(filter, projection, **kwargs)
+
+    monkeypatch.setattr(collection, "find", recording_find)
+    return queries
+
+
+def test_a_scenes_assets_are_fetched_with_one_in_query(finds):
+    resolver = AssetResolver("r1", "9x16")
+
+    asyncio.run(resolver.load_scenes([
+        {"asset_filenames": ["logo.png", "photo.png"]},
+        {"asset_filenames": ["logo.png"]},
+        {"asset_filenames": None},
+    ]))
+
+    (query, projection), = finds
+    assert query["filename"] == {"$in": ["logo.png", "photo.png"]}
+    assert projection == {"description": 0}
+    assert asyncio.run(resolver.get("logo.png")).id == "a1"
+    assert asyncio.run(resolver.get("photo.png")).id == "a2"
+    assert len(finds) == 1
+
+
+def test_lookups_are_scoped_to_the_request_aspect_ratio_and_converted_assets(finds):
+    resolver = AssetResolver("r2", "9x16")
+
+    assert asyncio.run(resolver.get("photo.png")).id == "a3"
+    # logo.png exists for r1 only, draft.png never converted
+    assert asyncio.run(resolver.get("logo.png")) is None
+    assert asyncio.run(AssetResolver("r1", "16x9").get("logo.png")).id == "a4"
+    assert asyncio.run(AssetResolver("r1", "9x16").get("draft.png")) is None
+
+
+def test_misses_are_remembered(finds):
+    resolver = AssetResolver("r1", "9x16")
+
+    assert asyncio.run(resolver.get("missing.png")) is None
+    assert asyncio.run(resolver.get("missing.png")) is None
+    asyncio.run(resolver.load(["missing.png", "logo.png"]))
+
+    # The second load only asked for the filename it hadn't looked up yet
+    assert [query["filename"] for query, _projection in finds] == [
+        {"$in": ["missing.png"]}, {"$in": ["logo.png"]}]
+
+
+def test_resolved_assets_leave_the_description_on_the_server(finds):
+    resolved = asyncio.run(AssetResolver("r1", "9x16").get("logo.png"))
+
+    assert resolved.description == ""
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import pytest
+import lib.branding as branding
+from lib.async_database import adb
+from lib.branding import Branding, BrandingCache
+
+
+pytestmark = pytest.mark.usefixtures("memory_db")
+
+
+class CountingCache(BrandingCache):
+    def __init__(self, max_entries):
+        super().__init__(max_entries)
+        self.loads = []
+
+    async def _load(self, request_id, version, brand_link):
+        self.loads.append(request_id)
+        return Branding(version=version, brand_link=brand_link, checked_at=time.monotonic())
+
+
+def test_least_recently_used_requests_and_their_locks_are_dropped():
+    cache = CountingCache(max_entries=2)
+
+    async def use(*request_ids):
+        for request_id in request_ids:
+            await cache.get(request_id)
+
+    asyncio.run(use("r1", "r2", "r1", "r3"))
+
+    assert list(cache._entries) == ["r1", "r3"]
+    assert set(cache._locks) == {"r1", "r3"}
+
+    asyncio.run(use("r1", "r2"))
+    assert cache.loads == ["r1", "r2", "r3", "r2"]
+
+
+def test_forget_drops_the_entry_and_its_lock():
+    cache = CountingCache(max_entries=2)
+    asyncio.run(cache.get("r1"))
+
+    cache.forget("r1")
+
+    assert "r1" not in cache._entries and "r1" not in cache._locks
+
+
+def test_entries_are_revalidated_against_the_branding_version(monkeypatch):
+    cache = CountingCache(max_entries=2)
+    monkeypatch.setattr(branding, "BRANDING_CACHE_SECONDS", 0)
+    asyncio.run(adb.video_requests.insert_one(
+        {"_id": "r1", "branding_version": 1}))
+
+    asyncio.run(cache.get("r1"))
+    asyncio.run(cache.get("r1"))
+    asyncio.run(adb.video_requests.update_one(
+        {"_id": "r1"}, {"$inc": {"branding_version": 1}}))
+    entry = asyncio.run(cache.get("r1"))
+
+    assert cache.loads == ["r1", "r1"]
+    assert entry.version == 2
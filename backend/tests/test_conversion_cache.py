@@ -0,0 +1,66 @@
+import os
+from lib.conversion_cache import ConversionCache
+
+BLACK = (0, 0, 0)
+
+
+def write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return str(path)
+
+
+def test_key_covers_every_conversion_input():
+    cache = ConversionCache("unused", 1)
+    key = cache.key("abc", 9, 16, "contain", BLACK, "h264")
+
+    assert key == cache.key("abc", 9, 16, "contain", BLACK, "h264")
+    assert len({
+        key,
+        cache.key("abd", 9, 16, "contain", BLACK, "h264"),
+        cache.key("abc", 16, 9, "contain", BLACK, "h264"),
+        cache.key("abc", 9, 16, "cover", BLACK, "h264"),
+        cache.key("abc", 9, 16, "contain", (255, 255, 255), "h264"),
+        cache.key("abc", 9, 16, "contain", BLACK, "png"),
+    }) == 6
+
+
+def test_hash_memo_is_bounded(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"), 1, hash_memo_size=2)
+    paths = [write(tmp_path / f"upload{index}", index + 1) for index in range(3)]
+
+    hashes = [cache.hash_file(path) for path in paths]
+
+    assert len(set(hashes)) == 3
+    assert len(cache._hashes) == 2
+    assert cache.hash_file(paths[0]) == hashes[0]
+
+
+def test_store_then_materialize_links_the_entry(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"), 1024)
+    converted = write(tmp_path / "converted.mp4", 10)
+    output = str(tmp_path / "other_request.mp4")
+
+    assert not cache.materialize("k1", output)
+    cache.store("k1", converted)
+    assert cache.materialize("k1", output)
+
+    assert open(output, "rb").read() == b"x" * 10
+    assert cache.snapshot()["hits"] == 1 and cache.snapshot()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = ConversionCache(str(tmp_path / "cache"), 250)
+    for index, key in enumerate(["k1", "k2"]):
+        cache.store(key, write(tmp_path / f"{key}.mp4", 100))
+        os.utime(cache.entry_path(key, "entry.mp4"), (index, index))
+    # A hit makes k1 the most recently used
+    cache.materialize("k1", str(tmp_path / "hit.mp4"))
+
+    cache.store("k3", write(tmp_path / "k3.mp4", 100))
+
+    assert os.path.exists(cache.entry_path("k1", "entry.mp4"))
+    assert not os.path.exists(cache.entry_path("k2", "entry.mp4"))
+    assert os.path.exists(cache.entry_path("k3", "entry.mp4"))
+    snapshot = cache.snapshot()
+    assert (snapshot["evictions"], snapshot["size_bytes"]) == (1, 200)
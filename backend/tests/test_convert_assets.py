@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+import lib.convert_assets as convert_assets
+from lib.async_database import adb
+from lib.repository import get_asset_conversions
+from models.upload import Upload
+
+ASPECT_RATIOS = ["9x16", "16x9"]
+
+
+def upload(upload_id, filename):
+    return Upload(_id=upload_id, request_id="r1", filename=f"{filename}.png", content_type="image/png",
+                  file_path=f"/uploads/{filename}.png", file_extension=".png",
+                  filename_without_extension=filename)
+
+
+UPLOADS = [upload("u1", "logo"), upload("u2", "photo")]
+
+
+class FlakyConverter:
+    """Converts every upload except the ones in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    async def __call__(self, upload, media_targets):
+        self.calls.append((upload.id, sorted(target[0] for target in media_targets)))
+        if upload.id in self.failing:
+            raise RuntimeError("ffmpeg exited with 1")
+
+
+@pytest.fixture(autouse=True)
+def stub_conversion(monkeypatch, memory_db):
+    monkeypatch.setattr(convert_assets, "converted_asset_metadata",
+                        lambda upload, path, aspect_ratio: {"content_type": "image", "aspect_ratio": aspect_ratio})
+
+
+def run_job(monkeypatch, converter):
+    monkeypatch.setattr(convert_assets, "convert_media", converter)
+
+    async def job():
+        existing_assets = await get_asset_conversions("r1", ASPECT_RATIOS)
+        return await convert_assets.convert_uploads(UPLOADS, ASPECT_RATIOS, existing_assets)
+
+    return asyncio.run(job())
+
+
+def assets():
+    return {(asset["upload_id"], asset["metadata"]["aspect_ratio"]): asset
+            for asset in asyncio.run(adb.assets.find({"request_id": "r1"}).to_list(None))}
+
+
+def test_a_retry_converts_only_the_upload_that_failed(monkeypatch):
+    assert run_job(monkeypatch, FlakyConverter(failing={"u2"})) == 1
+    first_pass = assets()
+    assert {key: asset["status"] for key, asset in first_pass.items()} == {
+        ("u1", "9x16"): "converted", ("u1", "16x9"): "converted",
+        ("u2", "9x16"): "conversion_failed", ("u2", "16x9"): "conversion_failed",
+    }
+    assert first_pass[("u2", "9x16")]["conversion_attempts"] == convert_assets.MAX_UPLOAD_CONVERSION_ATTEMPTS
+    assert "ffmpeg exited with 1" in first_pass[("u2", "9x16")]["conversion_error"]
+
+    retry = FlakyConverter()
+    assert run_job(monkeypatch, retry) == 0
+
+    # One decode for both of the failed upload's aspect ratios, nothing for the converted one
+    assert [upload_id for upload_id, _paths in retry.calls] == ["u2"]
+    assert len(retry.calls[0][1]) == 2
+    second_pass = assets()
+    assert all(asset["status"] == "converted" for asset in second_pass.values())
+    # The retry overwrote the failed attempt's documents and kept counting its attempts
+    assert second_pass[("u2", "9x16")]["_id"] == first_pass[("u2", "9x16")]["_id"]
+    assert second_pass[("u2", "9x16")]["conversion_attempts"] == convert_assets.MAX_UPLOAD_CONVERSION_ATTEMPTS + 1
+    assert second_pass[("u1", "9x16")]["conversion_attempts"] == 1
+
+
+def test_an_upload_that_fails_once_is_retried_within_the_job(monkeypatch):
+    class FailsOnce(FlakyConverter):
+        async def __call__(self, upload, media_targets):
+            try:
+                await super().__call__(upload, media_targets)
+            finally:
+                self.failing.discard(upload.id)
+
+    converter = FailsOnce(failing={"u1"})
+    assert run_job(monkeypatch, converter) == 0
+    assert [upload_id for upload_id, _paths in converter.calls].count("u1") == 2
+    assert assets()[("u1", "16x9")]["conversion_attempts"] == 2
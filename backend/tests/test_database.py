@@ -0,0 +1,12 @@
+from lib.database import split_pool_size
+
+
+def test_the_two_clients_split_the_pool_budget():
+    assert split_pool_size(50, 0.5) == (25, 25)
+    assert split_pool_size(50, 0.2) == (40, 10)
+    assert sum(split_pool_size(51, 0.5)) == 51
+
+
+def test_each_client_keeps_at_least_one_connection():
+    assert split_pool_size(2, 0.0) == (1, 1)
+    assert split_pool_size(2, 1.0) == (1, 1)
@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+import lib.describe_uploads as describe_uploads
+from lib.async_database import adb
+from utils.media_probe import parse_probe
+
+AUDIO_ONLY = {"format": {"duration": "3.5"},
+              "streams": [{"codec_type": "audio", "codec_name": "aac"}]}
+
+
+@pytest.fixture(autouse=True)
+def upload(memory_db):
+    asyncio.run(adb.uploads.insert_one({
+        "_id": "u1", "request_id": "r1", "filename": "song.mp4", "content_type": "video/mp4",
+        "file_path": "/uploads/song.mp4", "file_extension": "mp4",
+        "filename_without_extension": "song", "status": "description_started"}))
+
+
+def test_a_video_upload_without_a_video_stream_fails_without_retries(monkeypatch):
+    monkeypatch.setattr(describe_uploads, "probe_media",
+                        lambda path: parse_probe(path, AUDIO_ONLY))
+
+    def no_provider_calls(*args, **kwargs):
+        raise AssertionError("described an upload with nothing to describe")
+    monkeypatch.setattr(describe_uploads, "extract_and_describe_frames", no_provider_calls)
+
+    result = asyncio.run(describe_uploads.describe_upload("u1"))
+
+    assert result.status == "error"
+    assert "has no video stream" in result.error["message"]
+    upload = asyncio.run(adb.uploads.find_one({"_id": "u1"}))
+    assert upload["status"] == "description_failed"
@@ -0,0 +1,62 @@
+from lib.fair_scheduler import allocate_fair_share, fair_share_candidates, request_weight
+
+
+class StubCollection:
+    def __init__(self, ready_groups, running_groups=(), priorities=()):
+        self.pipelines = []
+        self._results = [list(ready_groups), list(running_groups)]
+        self.database = self
+        self.video_requests = self
+        self._priorities = list(priorities)
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self._results[len(self.pipelines) - 1])
+
+    def find(self, query, projection):
+        return iter(self._priorities)
+
+
+def test_request_weight():
+    assert request_weight(None) == 1
+    assert request_weight(-2) == 1
+    assert request_weight(2) == 3
+
+
+def test_allocate_round_robins_equal_requests_in_arrival_order():
+    picked = allocate_fair_share(
+        {"big": ["b1", "b2", "b3", "b4"], "small": ["s1", "s2"]}, {}, {}, 5)
+
+    assert picked == ["b1", "s1", "b2", "s2", "b3"]
+
+
+def test_allocate_favours_requests_with_fewer_running_jobs_per_weight():
+    picked = allocate_fair_share(
+        {"a": ["a1", "a2", "a3"], "b": ["b1", "b2", "b3"]},
+        {"a": 2}, {"b": 2}, 4)
+
+    assert picked == ["b1", "b2", "b3", "a1"]
+
+
+def test_candidates_aggregate_is_bounded_by_the_scan_limit():
+    collection = StubCollection(
+        [{"_id": "r1", "job_ids": ["j1", "j2"]}, {"_id": "r2", "job_ids": ["j3"]}],
+        [{"_id": "r1", "count": 1}])
+    query = {"status": "uploaded", "description_attempts": {"$lt": 3}}
+
+    picked = fair_share_candidates(
+        collection, query, ["description_started"], 2, scan_limit=500)
+
+    match, sort, limit, group = collection.pipelines[0]
+    assert match == {"$match": query}
+    assert sort == {"$sort": {"_id": 1}}
+    assert limit == {"$limit": 500}
+    assert group["$group"]["job_ids"] == {"$firstN": {"input": "$_id", "n": 2}}
+    assert picked == ["j3", "j1"]
+
+
+def test_candidates_skip_the_running_count_when_nothing_is_ready():
+    collection = StubCollection([])
+
+    assert fair_share_candidates(collection, {}, [], 3) == []
+    assert len(collection.pipelines) == 1
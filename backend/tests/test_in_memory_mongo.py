@@ -0,0 +1,137 @@
+import asyncio
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from in_memory_mongo import InMemoryCollection, _apply_update, _project, _sorted, matches
+
+UPLOAD = {
+    "_id": "u1",
+    "status": "uploaded",
+    "description_attempts": 1,
+    "tags": ["logo", "image"],
+    "metadata": {"width": 1920, "height": 1080},
+}
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_matches_equality_dotted_paths_and_arrays():
+    assert matches(UPLOAD, {"status": "uploaded", "metadata.width": 1920})
+    assert matches(UPLOAD, {"tags": "logo"})
+    assert not matches(UPLOAD, {"metadata.depth": 1})
+    assert not matches(UPLOAD, {"status": "converted"})
+
+
+def test_matches_operators():
+    assert matches(UPLOAD, {"description_attempts": {"$gte": 1, "$lt": 3}})
+    assert matches(UPLOAD, {"status": {"$in": ["uploaded", "converted"]}})
+    assert matches(UPLOAD, {"status": {"$nin": ["converted"]}})
+    assert matches(UPLOAD, {"lease_token": {"$exists": False}})
+    assert not matches(UPLOAD, {"description_attempts": {"$gt": 1}})
+    # Comparisons never match a missing field, so $not does
+    assert not matches(UPLOAD, {"conversion_attempts": {"$gte": 3}})
+    assert matches(UPLOAD, {"conversion_attempts": {"$not": {"$gte": 3}}})
+
+
+def test_matches_compares_arrays_element_wise():
+    assert matches(UPLOAD, {"tags": {"$ne": "video"}})
+    assert not matches(UPLOAD, {"tags": {"$ne": "logo"}})
+    assert matches(UPLOAD, {"tags": {"$in": ["video", "image"]}})
+    assert not matches(UPLOAD, {"tags": {"$nin": ["image"]}})
+
+
+def test_matches_and_or():
+    assert matches(UPLOAD, {"$or": [{"status": "converted"}, {"tags": "image"}]})
+    assert not matches(UPLOAD, {"$and": [{"status": "uploaded"}, {"tags": "video"}]})
+
+
+def test_apply_update_set_inc_unset_and_set_on_insert():
+    document = {"_id": "u1", "status": "uploaded", "worker_id": "w1"}
+
+    _apply_update(document, {
+        "$set": {"status": "description_started", "metadata.width": 640},
+        "$inc": {"description_attempts": 1},
+        "$unset": {"worker_id": ""},
+        "$push": {"tags": "logo"},
+        "$setOnInsert": {"created": True},
+    })
+
+    assert document == {
+        "_id": "u1",
+        "status": "description_started",
+        "metadata": {"width": 640},
+        "description_attempts": 1,
+        "tags": ["logo"],
+    }
+
+
+def test_project_inclusion_and_exclusion():
+    assert _project(UPLOAD, {"status": 1, "metadata.width": 1}) == {
+        "_id": "u1", "status": "uploaded", "metadata": {"width": 1920}}
+    assert _project(UPLOAD, {"_id": 0, "status": 1}) == {"status": "uploaded"}
+    assert "metadata" not in _project(UPLOAD, {"metadata": 0})
+
+
+def test_sorted_puts_missing_values_first_and_honours_each_direction():
+    documents = [{"_id": 3, "rank": 1}, {"_id": 1}, {"_id": 2, "rank": 1}, {"_id": 4, "rank": 2}]
+
+    assert [d["_id"] for d in _sorted(documents, [("rank", 1), ("_id", -1)])] == [1, 3, 2, 4]
+
+
+def test_update_counts_only_documents_that_changed():
+    collection = InMemoryCollection("uploads")
+    run(collection.insert_many([
+        {"_id": "u1", "status": "uploaded"},
+        {"_id": "u2", "status": "description_complete"},
+    ]))
+
+    result = run(collection.update_many(
+        {}, {"$set": {"status": "description_complete"}}))
+    assert (result.matched_count, result.modified_count) == (2, 1)
+
+    result = run(collection.update_one(
+        {"_id": "u1"}, {"$set": {"status": "description_complete"}}))
+    assert (result.matched_count, result.modified_count) == (1, 0)
+
+
+def test_update_one_upserts_from_the_filter():
+    collection = InMemoryCollection("migrations")
+
+    result = run(collection.update_one(
+        {"_id": "indexes"}, {"$set": {"version": 2}}, upsert=True))
+
+    assert result.upserted_id == "indexes"
+    assert run(collection.find_one({"_id": "indexes"})) == {"_id": "indexes", "version": 2}
+
+
+def test_find_one_and_update_takes_the_first_in_sort_order():
+    collection = InMemoryCollection("videos")
+    run(collection.insert_many([{"_id": "b", "status": "ready"}, {"_id": "a", "status": "ready"}]))
+
+    before = run(collection.find_one_and_update(
+        {"status": "ready"}, {"$set": {"status": "started"}}, sort=[("_id", 1)]))
+    after = run(collection.find_one_and_update(
+        {"status": "ready"}, {"$set": {"status": "started"}}, projection={"status": 1},
+        return_document=ReturnDocument.AFTER))
+
+    assert before == {"_id": "a", "status": "ready"}
+    assert after == {"_id": "b", "status": "started"}
+    assert run(collection.find_one_and_update({"status": "ready"}, {"$set": {"status": "x"}})) is None
+
+
+def test_bulk_write_reports_each_kind_of_write():
+    collection = InMemoryCollection("scenes")
+    run(collection.insert_one({"_id": "s1", "status": "extracted"}))
+
+    result = run(collection.bulk_write([
+        InsertOne({"_id": "s2", "status": "extracted"}),
+        UpdateOne({"_id": "s2"}, {"$set": {"status": "extracted"}}),
+        UpdateOne({"_id": "s3"}, {"$set": {"status": "extracted"}}, upsert=True),
+        DeleteOne({"_id": "s1"}),
+    ]))
+
+    assert result.inserted_count == 1
+    assert (result.matched_count, result.modified_count) == (1, 0)
+    assert result.upserted_ids == {2: "s3"}
+    assert result.deleted_count == 1
+    assert run(collection.distinct("_id")) == ["s2", "s3"]
@@ -0,0 +1,32 @@
+from lib.indexes import INDEXES, canonical_queries
+from lib.process_scenes import RENDER_READY_QUERY
+
+
+def point_fields(query):
+    # Fields an index can seek to exactly; $in seeks each value and merges
+    return {
+        field for field, condition in query.items()
+        if not field.startswith("$") and field != "_id" and (
+            not isinstance(condition, dict) or set(condition) == {"$in"})
+    }
+
+
+def test_render_claim_is_checked_with_its_own_filter_and_sort():
+    render_claims = [query for query in canonical_queries()
+                     if query.filter == RENDER_READY_QUERY]
+
+    assert [query.sort for query in render_claims] == [[("_id", 1)]]
+
+
+def test_every_claim_walks_an_index_in_id_order():
+    claims = [query for query in canonical_queries()
+              if query.sort == [("_id", 1)] and "request_id" not in query.filter]
+    assert len(claims) == 7
+
+    for query in claims:
+        fields = point_fields(query.filter)
+        assert any(
+            {key for key, _direction in spec.keys[:len(fields)]} == fields
+            and spec.keys[len(fields)][0] == "_id"
+            for spec in INDEXES[query.collection_name]
+        ), query
@@ -0,0 +1,159 @@
+import time
+from types import SimpleNamespace
+from lib.job_queue import LeaseHeartbeat, claim_jobs, lease_lost, lease_scope, leased, renew_leases, with_lease
+
+
+class StubCollection:
+    """Records the claim calls; `taken` ids are lost to a concurrent worker."""
+
+    def __init__(self, ids, taken=()):
+        self.ids = list(ids)
+        self.taken = set(taken)
+        self.leased = {}
+        self.calls = []
+
+    def find(self, query, projection=None, sort=None, limit=0):
+        self.calls.append(("find", query))
+        if "lease_token" in query:
+            return [{"_id": job_id} for job_id in query["_id"]["$in"]
+                    if self.leased.get(job_id) == query["lease_token"]]
+        return [{"_id": job_id} for job_id in self.ids[:limit or None]]
+
+    def update_many(self, query, update):
+        self.calls.append(("update_many", query))
+        modified = 0
+        for job_id in query["_id"]["$in"]:
+            if job_id not in self.taken:
+                self.leased[job_id] = update["$set"]["lease_token"]
+                modified += 1
+        return SimpleNamespace(matched_count=modified, modified_count=modified)
+
+    def find_one_and_update(self, query, update, projection=None, sort=None, return_document=None):
+        self.calls.append(("find_one_and_update", query))
+        for job_id in self.ids:
+            if job_id not in self.taken:
+                self.leased[job_id] = update["$set"]["lease_token"]
+                return {"_id": job_id}
+        return None
+
+
+def call_names(collection):
+    return [name for name, _query in collection.calls]
+
+
+def test_with_lease_adds_the_lease_without_touching_the_update():
+    update = {"$set": {"status": "started"}, "$inc": {"attempts": 1}}
+
+    lease_update = with_lease(update, "box:1", "token", lease_seconds=60)
+
+    assert update == {"$set": {"status": "started"}, "$inc": {"attempts": 1}}
+    assert lease_update["$set"]["status"] == "started"
+    assert lease_update["$set"]["worker_id"] == "box:1"
+    assert lease_update["$set"]["lease_token"] == "token"
+    assert lease_update["$inc"] == {"attempts": 1}
+
+
+def test_claim_nothing_for_no_slots():
+    collection = StubCollection(["a"])
+
+    assert claim_jobs(collection, {}, {"$set": {}}, 0) == []
+    assert collection.calls == []
+
+
+def test_single_claim_is_one_find_one_and_update():
+    collection = StubCollection(["a", "b"])
+
+    claimed = claim_jobs(collection, {}, {"$set": {}}, 1, lease_token="token")
+
+    assert claimed == ["a"]
+    assert collection.leased == {"a": "token"}
+    assert call_names(collection) == ["find_one_and_update"]
+
+
+def test_batch_claim_skips_the_read_back_when_every_candidate_was_leased():
+    collection = StubCollection(["a", "b", "c"])
+
+    claimed = claim_jobs(collection, {}, {"$set": {}}, 3)
+
+    assert claimed == ["a", "b", "c"]
+    assert call_names(collection) == ["find", "update_many"]
+
+
+def test_batch_claim_reads_back_only_the_candidates_it_won():
+    collection = StubCollection(["a", "b", "c", "d"], taken={"b", "d"})
+
+    claimed = claim_jobs(collection, {"status": "ready"}, {
+                         "$set": {}}, 4, lease_token="token")
+
+    assert claimed == ["a", "c"]
+    assert call_names(collection) == ["find", "update_many", "find"]
+    # The lease update re-applies the claim query, so taken jobs are skipped
+    assert collection.calls[1][1]["status"] == "ready"
+
+
+def test_leased_filters_on_the_token_of_the_current_lease():
+    assert leased("job") == {"_id": "job"}
+    with lease_scope("token"):
+        assert leased("job") == {"_id": "job", "lease_token": "token"}
+        assert leased("job", "other") == {
+            "_id": "job", "lease_token": "other"}
+    assert leased("job") == {"_id": "job"}
+
+
+def test_lease_lost_when_the_leased_write_matched_nothing():
+    assert lease_lost(SimpleNamespace(matched_count=0), "job")
+    assert not lease_lost(SimpleNamespace(matched_count=1), "job")
+    assert lease_lost(None, "job")
+    assert not lease_lost({"_id": "job"}, "job")
+
+
+def test_renewals_only_extend_leases_still_held_under_their_token():
+    collection = RenewalCollection()
+
+    renew_leases(collection, [("a", "t1"), ("b", "t1"), ("c", "t2")], worker_id="box:1")
+
+    (query, update), = collection.updates
+    assert query["worker_id"] == "box:1"
+    assert query["$or"] == [
+        {"lease_token": "t1", "_id": {"$in": ["a", "b"]}},
+        {"lease_token": "t2", "_id": {"$in": ["c"]}},
+    ]
+    assert set(update["$set"]) == {"lease_expires_at"}
+
+
+def test_renewing_nothing_skips_the_write():
+    collection = RenewalCollection()
+
+    assert renew_leases(collection, []) == 0
+    assert collection.updates == []
+
+
+def test_heartbeat_renews_each_job_under_the_token_it_was_claimed_with():
+    collection = RenewalCollection()
+    heartbeat = LeaseHeartbeat(collection, worker_id="box:1", lease_seconds=0.03)
+    heartbeat.add("a", "t1")
+    heartbeat.add("b", "t2")
+    heartbeat.add("c", "t3")
+    heartbeat.remove("b", "t2")
+    # A run whose job was reclaimed under a new token must not drop the new lease
+    heartbeat.add("c", "t4")
+    heartbeat.remove("c", "t3")
+
+    heartbeat.start()
+    time.sleep(0.05)
+    heartbeat.stop()
+
+    query, _update = collection.updates[0]
+    assert query["$or"] == [
+        {"lease_token": "t1", "_id": {"$in": ["a"]}},
+        {"lease_token": "t4", "_id": {"$in": ["c"]}},
+    ]
+
+
+class RenewalCollection:
+    def __init__(self):
+        self.updates = []
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=0)
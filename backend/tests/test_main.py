@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import pytest
+import main
+from lib.async_database import adb
+from models.input_video_request import InputVideoRequest
+
+VIDEO_REQUEST = InputVideoRequest(
+    lang="en", topic="Launch", style="energetic",
+    formats=[{"aspect_ratio": "9x16", "length": 30}, {"aspect_ratio": "9x16", "length": 60},
+             {"aspect_ratio": "16x9", "length": 30}])
+
+
+pytestmark = pytest.mark.usefixtures("memory_db")
+
+
+def count(collection_name):
+    return asyncio.run(adb.get_collection(collection_name).count_documents({}))
+
+
+def test_create_video_request_writes_one_document_per_aspect_ratio_and_format():
+    request_id = asyncio.run(main.create_video_request(VIDEO_REQUEST))["request_id"]
+
+    assert asyncio.run(adb.video_requests.find_one({"_id": request_id}))["topic"] == "Launch"
+    assert count("video_request_aspect_ratios") == 2
+    assert count("video_request_formats") == 3
+
+
+def test_failed_intake_leaves_no_children_behind(monkeypatch, memory_db):
+    async def fail(document):
+        raise RuntimeError("insert failed")
+    monkeypatch.setattr(memory_db.get_collection("video_requests"), "insert_one", fail)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(main.create_video_request(VIDEO_REQUEST))
+
+    assert count("video_request_aspect_ratios") == 0
+    assert count("video_request_formats") == 0
+
+
+def test_startup_builds_indexes_off_the_event_loop(monkeypatch):
+    index_threads = []
+    monkeypatch.setattr(main, "ensure_indexes",
+                        lambda: index_threads.append(threading.current_thread()))
+
+    async def startup():
+        await main.create_indexes()
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(startup())
+
+    assert len(index_threads) == 1 and index_threads[0] is not loop_thread
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import time
+import pytest
+from lib.media_pool import MediaTaskError, run_media_task
+
+
+def add(a, b):
+    return a + b
+
+
+def fail():
+    raise ValueError("bad frame")
+
+
+def sleep_forever(pid_path):
+    with open(pid_path, "w") as pid_file:
+        pid_file.write(str(os.getpid()))
+    time.sleep(60)
+
+
+def allocate(megabytes):
+    return len(bytearray(megabytes * 1024 * 1024))
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def wait_for_pid(pid_path):
+    deadline = time.monotonic() + 20
+    while not os.path.exists(pid_path) or not open(pid_path).read():
+        assert time.monotonic() < deadline, "media task never started"
+        time.sleep(0.05)
+    return int(open(pid_path).read())
+
+
+def test_tasks_return_their_result_from_a_child_process():
+    assert asyncio.run(run_media_task(add, 2, b=3)) == 5
+
+
+def test_tasks_run_from_separate_event_loops():
+    # One slot semaphore per loop, so a second asyncio.run does not trip over the first
+    assert asyncio.run(run_media_task(add, 1, 1)) == 2
+    assert asyncio.run(run_media_task(add, 2, 2)) == 4
+
+
+def test_a_failing_task_raises_media_task_error():
+    with pytest.raises(MediaTaskError, match="ValueError: bad frame"):
+        asyncio.run(run_media_task(fail))
+
+
+def test_cancelling_the_caller_kills_the_child_process(tmp_path):
+    pid_path = str(tmp_path / "pid")
+
+    async def cancel_mid_task():
+        task = asyncio.create_task(run_media_task(sleep_forever, pid_path))
+        pid = await asyncio.to_thread(wait_for_pid, pid_path)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return pid
+
+    pid = asyncio.run(cancel_mid_task())
+
+    time.sleep(0.2)
+    assert not process_alive(pid)
+
+
+def test_a_task_past_its_timeout_is_killed(tmp_path):
+    pid_path = str(tmp_path / "pid")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_media_task(sleep_forever, pid_path, timeout=2))
+
+    time.sleep(0.2)
+    assert not process_alive(wait_for_pid(pid_path))
+
+
+def test_the_memory_limit_stops_a_runaway_task():
+    with pytest.raises(MediaTaskError, match="MemoryError"):
+        asyncio.run(run_media_task(allocate, 4096, memory_limit_mb=2048))
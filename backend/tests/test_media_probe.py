@@ -0,0 +1,90 @@
+import json
+from types import SimpleNamespace
+import pytest
+import utils.media_probe as media_probe
+from utils.media_probe import ProbeError, parse_frame_rate, parse_probe, probe_media
+
+PHONE_CLIP = {
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "12.5", "size": "2048", "bit_rate": "1310"},
+    "streams": [
+        {"codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+         "avg_frame_rate": "30000/1001", "pix_fmt": "yuv420p", "nb_frames": "375",
+         "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}]},
+        {"codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2, "bit_rate": "128000"},
+    ],
+}
+
+
+def test_frame_rates_are_parsed_from_fractions():
+    assert parse_frame_rate("30000/1001") == pytest.approx(29.97, abs=0.01)
+    assert parse_frame_rate("25") == 25
+    assert parse_frame_rate("0/0") is None
+    assert parse_frame_rate(None) is None
+
+
+def test_phone_clip_reports_its_display_size_after_rotation():
+    probe = parse_probe("clip.mov", PHONE_CLIP)
+
+    assert probe.video.rotation == 90
+    assert (probe.video.width, probe.video.height) == (1920, 1080)
+    assert probe.video.display_size == (1080, 1920)
+    assert probe.video.fps == pytest.approx(29.97, abs=0.01)
+    assert probe.video.frame_count == 375
+    assert (probe.duration, probe.size_bytes) == (12.5, 2048)
+    assert probe.audio.sample_rate == 48000 and probe.has_audio
+
+
+def test_rotate_tag_wins_and_is_normalized():
+    info = {"streams": [{"codec_type": "video", "width": 640, "height": 480,
+                         "tags": {"rotate": "-270"}, "r_frame_rate": "24/1"}]}
+
+    probe = parse_probe("old.mp4", info)
+
+    assert probe.video.rotation == 90
+    # Falls back to r_frame_rate when avg_frame_rate is missing
+    assert probe.video.fps == 24
+
+
+def test_cover_art_is_not_the_video_and_stream_duration_is_the_fallback():
+    info = {"streams": [
+        {"codec_type": "video", "width": 600, "height": 600, "disposition": {"attached_pic": 1}},
+        {"codec_type": "audio", "codec_name": "mp3", "duration": "3.5"},
+    ]}
+
+    probe = parse_probe("song.mp3", info)
+
+    assert not probe.has_video
+    assert probe.duration == 3.5
+    with pytest.raises(ProbeError, match="no video stream"):
+        probe.require_video()
+
+
+def test_probe_media_runs_ffprobe_once_per_file_version(monkeypatch, tmp_path):
+    path = tmp_path / "clip.mov"
+    path.write_bytes(b"1")
+    calls = []
+
+    def fake_run(command, **kwargs):
+        calls.append(command)
+        return SimpleNamespace(returncode=0, stdout=json.dumps(PHONE_CLIP), stderr="")
+
+    media_probe._probe_media.cache_clear()
+    monkeypatch.setattr(media_probe.subprocess, "run", fake_run)
+
+    assert probe_media(str(path)) is probe_media(str(path))
+    path.write_bytes(b"22")
+    probe_media(str(path))
+
+    assert len(calls) == 2
+    media_probe._probe_media.cache_clear()
+
+
+def test_probe_media_raises_on_ffprobe_errors(monkeypatch, tmp_path):
+    path = tmp_path / "broken.mov"
+    path.write_bytes(b"x")
+    media_probe._probe_media.cache_clear()
+    monkeypatch.setattr(media_probe.subprocess, "run", lambda command, **kwargs: SimpleNamespace(
+        returncode=1, stdout="", stderr="moov atom not found"))
+
+    with pytest.raises(ProbeError, match="moov atom"):
+        probe_media(str(path))
@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from lib.async_database import adb
+from lib.process_scenes import has_speech_scene_id, preprocess_and_expand_scenes
+
+SCENE = {"video_id": "v1", "request_id": "r1", "aspect_ratio": "9x16", "status": "narration_complete"}
+
+
+class StubResolver:
+    async def load_scenes(self, scene_results):
+        pass
+
+    async def get(self, asset_filename):
+        return SimpleNamespace(
+            transcript="hello there",
+            metadata=SimpleNamespace(content_type="video/mp4", duration=4.0))
+
+
+@pytest.fixture(autouse=True)
+def scenes(memory_db):
+    asyncio.run(adb.scenes.insert_many([
+        {**SCENE, "_id": "s1", "scene_type": "body", "position": 1.0, "asset_filenames": ["clip.mp4"]},
+        {**SCENE, "_id": "s2", "scene_type": "body", "position": 2.0, "asset_filenames": []},
+    ]))
+
+
+def ordered_scenes():
+    return asyncio.run(adb.scenes.find({"video_id": "v1"}).sort("position", 1).to_list(None))
+
+
+def test_a_speaking_clip_is_split_into_its_own_scene_after_a_title():
+    asyncio.run(preprocess_and_expand_scenes("v1", StubResolver()))
+
+    scenes = ordered_scenes()
+    assert [scene["_id"] for scene in scenes] == ["s1", has_speech_scene_id("s1", "clip.mp4"), "s2"]
+    assert (scenes[0]["scene_type"], scenes[0]["asset_filenames"]) == ("title", [])
+    assert (scenes[1]["scene_type"], scenes[1]["narration"]) == ("has_speech", "hello there")
+
+
+def test_a_retry_after_an_interrupted_split_does_not_duplicate_the_scene():
+    # The previous run wrote the split scene but not the parent
+    asyncio.run(adb.scenes.insert_one({
+        **SCENE, "_id": has_speech_scene_id("s1", "clip.mp4"), "scene_type": "has_speech",
+        "position": 1.5, "asset_filenames": ["clip.mp4"]}))
+
+    asyncio.run(preprocess_and_expand_scenes("v1", StubResolver()))
+    asyncio.run(preprocess_and_expand_scenes("v1", StubResolver()))
+
+    scenes = ordered_scenes()
+    assert [scene["_id"] for scene in scenes] == ["s1", has_speech_scene_id("s1", "clip.mp4"), "s2"]
+    assert scenes[0]["scene_type"] == "title"
+    assert scenes[1]["position"] == 1.5
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import lib.rate_limiter as rate_limiter
+from lib.rate_limiter import (
+    CHARS_PER_TOKEN, TOKENS_PER_IMAGE, LocalTokenBucket, ProviderRateLimiter, RateLimitedEndpoint,
+    estimate_request_tokens, response_tokens, seconds_until_available)
+
+
+def test_estimate_request_tokens_counts_text_images_and_output():
+    request = {
+        "system": "s" * 40,
+        "max_tokens": 100,
+        "messages": [
+            {"role": "user", "content": "u" * 80},
+            {"role": "user", "content": [
+                {"type": "image", "source": {}},
+                {"type": "text", "text": "t" * 40},
+                {"type": "image_url", "image_url": {}},
+            ]},
+        ],
+    }
+
+    assert estimate_request_tokens(request) == 160 // CHARS_PER_TOKEN + 2 * TOKENS_PER_IMAGE + 100
+
+
+def test_response_tokens_reads_openai_anthropic_and_instructor_usage():
+    assert response_tokens(SimpleNamespace(usage=SimpleNamespace(total_tokens=12))) == 12
+    assert response_tokens(SimpleNamespace(usage=SimpleNamespace(
+        input_tokens=5, output_tokens=7))) == 12
+    assert response_tokens(SimpleNamespace(_raw_response=SimpleNamespace(
+        usage=SimpleNamespace(total_tokens=3)))) == 3
+    assert response_tokens(SimpleNamespace()) is None
+
+
+def test_local_bucket_grants_until_empty_then_waits():
+    bucket = LocalTokenBucket()
+
+    assert bucket.take("openai", 2, 1000, 400) == 0
+    assert bucket.take("openai", 2, 1000, 400) == 0
+    assert bucket.take("openai", 2, 1000, 400) > 0
+
+
+def test_seconds_until_available_is_capped():
+    assert seconds_until_available(0, 0, 1, 0, 0) == rate_limiter.MAX_WAIT_SECONDS
+    assert seconds_until_available(0.5, 0, 60, 0, 0) == 0.5
+
+
+def test_settle_refunds_unused_reserved_tokens():
+    bucket = LocalTokenBucket()
+    limiter = ProviderRateLimiter("openai", 10, 1000, bucket)
+
+    limiter.acquire(800)
+    limiter.settle(800, 300)
+
+    assert bucket._buckets["openai"][1] >= 700
+
+
+def test_endpoint_waits_and_calls_off_the_event_loop(monkeypatch):
+    call_threads = []
+    sleeps = []
+
+    class Endpoint:
+        def create(self, **kwargs):
+            call_threads.append(threading.current_thread())
+            return SimpleNamespace(usage=SimpleNamespace(total_tokens=1))
+
+    class Bucket(LocalTokenBucket):
+        waits = [0.5, 0]
+
+        def take(self, provider, rpm, tpm, tokens):
+            return self.waits.pop(0)
+
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    endpoint = RateLimitedEndpoint(Endpoint(), ProviderRateLimiter("anthropic", 1, 0, Bucket()))
+
+    async def call():
+        await asyncio.to_thread(endpoint.create, messages=[])
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(call())
+
+    assert sleeps == [0.5]
+    assert call_threads and call_threads[0] is not loop_thread
@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+import threading
+from types import SimpleNamespace
+import lib.reaper as reaper
+from lib.job_queue import LEASE_SECONDS, LeasedQueue
+from lib.reaper import expired_lease_query, reap_expired_leases, run_reaper
+
+QUEUE = LeasedQueue(
+    name="describe",
+    collection_name="uploads",
+    in_progress_statuses=["description_started"],
+    ready_status="uploaded",
+    failed_status="description_failed",
+    attempts_field="description_attempts",
+    max_attempts=3,
+    start_time_field="description_start_time"
+)
+
+
+class StubCollection:
+    def __init__(self):
+        self.updates = []
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+        return SimpleNamespace(modified_count=0)
+
+
+class StubDatabase:
+    def __init__(self):
+        self.collections = {}
+
+    def get_collection(self, name):
+        return self.collections.setdefault(name, StubCollection())
+
+
+def test_expired_lease_query_covers_jobs_claimed_before_leases():
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+    query = expired_lease_query(QUEUE, now)
+
+    assert query["status"] == {"$in": ["description_started"]}
+    assert query["$or"][0] == {"lease_expires_at": {"$lt": now}}
+    assert query["$or"][1] == {
+        "lease_expires_at": {"$exists": False},
+        "description_start_time": {"$lt": now - datetime.timedelta(seconds=LEASE_SECONDS)}
+    }
+
+
+def test_reap_fails_exhausted_jobs_before_requeueing_the_rest(monkeypatch):
+    db = StubDatabase()
+    monkeypatch.setattr(reaper, "db", db)
+
+    reap_expired_leases(QUEUE)
+
+    (failed_query, failed_update), (requeue_query, requeue_update) = db.collections["uploads"].updates
+    # The reaped run is counted, so a job on its last attempt fails
+    assert failed_query["description_attempts"] == {"$gte": 2}
+    assert failed_update["$set"] == {"status": "description_failed"}
+    assert requeue_update["$set"] == {"status": "uploaded"}
+    assert requeue_update["$inc"] == {"description_attempts": 1}
+    assert set(requeue_update["$unset"]) == {
+        "worker_id", "lease_token", "lease_expires_at"}
+
+
+def test_reap_does_not_count_attempts_twice_for_queues_counting_on_claim(monkeypatch):
+    db = StubDatabase()
+    monkeypatch.setattr(reaper, "db", db)
+
+    reap_expired_leases(QUEUE.model_copy(
+        update={"attempts_counted_on_claim": True}))
+
+    (failed_query, _failed_update), (_requeue_query, requeue_update) = db.collections["uploads"].updates
+    assert failed_query["description_attempts"] == {"$gte": 3}
+    assert "$inc" not in requeue_update
+
+
+def test_run_reaper_sweeps_off_the_event_loop_thread(monkeypatch):
+    sweep_threads = []
+    monkeypatch.setattr(reaper, "reap_expired_leases",
+                        lambda queue: sweep_threads.append(threading.current_thread()))
+    monkeypatch.setattr(reaper, "recount_stalled_videos",
+                        lambda: sweep_threads.append(threading.current_thread()))
+
+    async def sweep():
+        await run_reaper([QUEUE, QUEUE], once=True)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(sweep())
+
+    assert len(sweep_threads) == 3
+    assert all(thread is not loop_thread for thread in sweep_threads)
+
+
+def test_run_reaper_recounts_stalled_videos_on_a_slower_cadence(monkeypatch):
+    recounts = []
+    sleeps = []
+    monkeypatch.setattr(reaper, "reap_expired_leases", lambda queue: None)
+    monkeypatch.setattr(reaper, "recount_stalled_videos", lambda: recounts.append(1))
+    monkeypatch.setattr(reaper, "RECOUNT_INTERVAL_SECONDS", 3600)
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            raise asyncio.CancelledError
+
+    monkeypatch.setattr(reaper.asyncio, "sleep", sleep)
+    try:
+        asyncio.run(run_reaper([QUEUE]))
+    except asyncio.CancelledError:
+        pass
+
+    # Three reaper passes, one recount
+    assert len(sleeps) == 3
+    assert recounts == [1]
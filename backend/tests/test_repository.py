@@ -0,0 +1,73 @@
+import asyncio
+import pytest
+from lib.async_database import adb
+from lib.repository import (
+    find_upload_id, get_asset_conversions, get_job_attempts, get_logo_path, get_video_request_status)
+
+
+@pytest.fixture(autouse=True)
+def documents(memory_db):
+    async def seed():
+        await adb.video_requests.insert_one(
+            {"_id": "r1", "status": "processing", "topic": "Launch", "script": "a long script"})
+        await adb.uploads.insert_many([
+            {"_id": "u1", "request_id": "r1", "filename": "logo.png", "file_path": "/uploads/logo.png",
+             "description": "a long description", "metadata": {"is_logo": True}, "description_attempts": 2},
+            {"_id": "u2", "request_id": "r1", "filename": "clip.mp4", "file_path": "/uploads/clip.mp4",
+             "transcript": "a long transcript", "metadata": {"is_logo": False}},
+        ])
+        await adb.assets.insert_many([
+            {"_id": "a1", "request_id": "r1", "upload_id": "u1", "status": "converted",
+             "conversion_attempts": 1, "description": "a long description",
+             "metadata": {"aspect_ratio": "9x16"}},
+            {"_id": "a2", "request_id": "r1", "upload_id": "u1", "status": "converted",
+             "metadata": {"aspect_ratio": "1x1"}},
+            # Converted before assets recorded their upload
+            {"_id": "a3", "request_id": "r1", "status": "converted",
+             "metadata": {"aspect_ratio": "9x16"}},
+        ])
+    asyncio.run(seed())
+
+
+@pytest.fixture
+def projections(monkeypatch, memory_db):
+    """Records the projection of every find_one, by collection."""
+    recorded = {}
+    for name in ("uploads", "video_requests"):
+        collection = memory_db.get_collection(name)
+
+        async def recording_find_one(filter=None, projection=None, find_one=collection.find_one, name=name, **kwargs):
+            recorded.setdefault(name, []).append(projection)
+            return await find_one(filter, projection, **kwargs)
+
+        monkeypatch.setattr(collection, "find_one", recording_find_one)
+    return recorded
+
+
+def test_scalar_lookups_return_plain_values_from_projected_reads(projections):
+    assert asyncio.run(find_upload_id("r1", "clip.mp4")) == "u2"
+    assert asyncio.run(get_logo_path("r1")) == "/uploads/logo.png"
+    assert asyncio.run(get_video_request_status("r1")) == "processing"
+    assert asyncio.run(get_job_attempts("uploads", "u1", "description_attempts")) == 2
+
+    assert projections == {
+        "uploads": [{"_id": 1}, {"file_path": 1}, {"description_attempts": 1}],
+        "video_requests": [{"status": 1}],
+    }
+
+
+def test_missing_documents_read_as_none_and_missing_attempts_as_zero():
+    assert asyncio.run(find_upload_id("r1", "nope.png")) is None
+    assert asyncio.run(get_logo_path("r2")) is None
+    assert asyncio.run(get_video_request_status("r2")) is None
+    assert asyncio.run(get_job_attempts("uploads", "missing", "description_attempts")) is None
+    assert asyncio.run(get_job_attempts("uploads", "u2", "description_attempts")) == 0
+
+
+def test_asset_conversions_are_keyed_by_upload_and_aspect_ratio_and_projected():
+    conversions = asyncio.run(get_asset_conversions("r1", ["9x16", "16x9"]))
+
+    assert list(conversions) == [("u1", "9x16")]
+    assert conversions[("u1", "9x16")] == {
+        "_id": "a1", "upload_id": "u1", "status": "converted",
+        "conversion_attempts": 1, "metadata": {"aspect_ratio": "9x16"}}
@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+import pytest
+import utils.video.resize_videos as resize_videos
+from utils.video.resize_videos import (
+    build_filtergraph, build_split_filtergraph, convert_video_to_aspect_ratios, encoder_profile, even,
+    get_screen_size, run_ffmpeg)
+
+
+def test_screen_size_comes_from_the_aspect_ratio_settings():
+    assert get_screen_size(9, 16) == (1080, 1920)
+    assert get_screen_size(16, 9) == (1920, 1080)
+    # Ratios without settings use their own dimensions, kept even for yuv420p
+    assert get_screen_size(3, 5) == (2, 4)
+    assert even(607) == 606 and even(0.4) == 2
+
+
+def test_contain_scales_then_letterboxes_on_the_background():
+    assert build_filtergraph(1920, 1080, 9, 16) == \
+        "scale=1080:608,pad=1080:1920:0:656:color=0x000000,setsar=1"
+    assert build_filtergraph(1080, 1920, 16, 9, background_color=(255, 0, 16)) == \
+        "scale=608:1080,pad=1920:1080:656:0:color=0xff0010,setsar=1"
+
+
+def test_contain_with_matching_ratio_only_scales():
+    assert build_filtergraph(540, 960, 9, 16) == \
+        "scale=1080:1920,pad=1080:1920:0:0:color=0x000000,setsar=1"
+
+
+def test_cover_center_crops_before_scaling():
+    assert build_filtergraph(1920, 1080, 9, 16, crop_type="cover") == \
+        "crop=607:1080:656:0,scale=1080:1920,setsar=1"
+    assert build_filtergraph(1080, 1080, 16, 9, crop_type="cover") == \
+        "crop=1080:607:0:236,scale=1920:1080,setsar=1"
+
+
+def test_encoder_profile_follows_the_output_container():
+    assert encoder_profile("out.webm").startswith("ffmpeg -c:v libvpx-vp9")
+    assert encoder_profile("out.MP4").startswith("ffmpeg -c:v libx264")
+
+
+def test_split_filtergraph_decodes_once_and_labels_each_output():
+    assert build_split_filtergraph(["scale=2:2"]) == "[0:v:0]scale=2:2[v0]"
+    assert build_split_filtergraph(["scale=2:2", "crop=4:4:0:0"]) == (
+        "[0:v:0]split=2[s0][s1];[s0]scale=2:2[v0];[s1]crop=4:4:0:0[v1]")
+
+
+def test_run_ffmpeg_maps_each_output_to_its_chain(monkeypatch):
+    commands = []
+    monkeypatch.setattr(resize_videos, "get_ffmpeg_binary", lambda: "ffmpeg")
+    monkeypatch.setattr(resize_videos.subprocess, "run",
+                        lambda command, **kwargs: commands.append(command))
+
+    run_ffmpeg("in.mov", [("a.mp4", "scale=2:2"), ("b.webm", "scale=4:4")])
+
+    command = commands[0]
+    assert command.count("-i") == 1
+    first, second = command.index("a.mp4"), command.index("b.webm")
+    assert command[command.index("[v0]") - 1] == "-map" and command.index("[v0]") < first
+    assert first < command.index("[v1]") < second
+    assert "libvpx-vp9" in command[first:second] and "+faststart" in command[:first]
+
+
+def test_conversion_copies_matching_ratios_and_falls_back_to_reencoding_audio(monkeypatch, tmp_path):
+    source = tmp_path / "in.mp4"
+    source.write_bytes(b"video")
+    runs = []
+
+    def fake_run_ffmpeg(input_path, targets, reencode_audio=False):
+        runs.append(([output_path for output_path, _graph in targets], reencode_audio))
+        return SimpleNamespace(returncode=1 if not reencode_audio else 0, stderr="codec")
+
+    monkeypatch.setattr(resize_videos, "get_display_size", lambda path: (1080, 1920))
+    monkeypatch.setattr(resize_videos, "run_ffmpeg", fake_run_ffmpeg)
+
+    convert_video_to_aspect_ratios(str(source), [
+        (str(tmp_path / "9x16.mp4"), 9, 16),
+        (str(tmp_path / "16x9.mp4"), 16, 9),
+        (str(tmp_path / "1x1.mp4"), 1, 1),
+    ])
+
+    assert (tmp_path / "9x16.mp4").read_bytes() == b"video"
+    outputs = [str(tmp_path / "16x9.mp4"), str(tmp_path / "1x1.mp4")]
+    assert runs == [(outputs, False), (outputs, True)]
+
+
+def test_conversion_raises_when_ffmpeg_keeps_failing(monkeypatch, tmp_path):
+    monkeypatch.setattr(resize_videos, "get_display_size", lambda path: (1920, 1080))
+    monkeypatch.setattr(resize_videos, "run_ffmpeg", lambda *args, **kwargs: SimpleNamespace(
+        returncode=1, stderr="broken"))
+
+    with pytest.raises(RuntimeError, match="broken"):
+        convert_video_to_aspect_ratios("in.mp4", [(str(tmp_path / "out.mp4"), 9, 16)])
@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+import pytest
+import lib.scene_counters as scene_counters
+from lib.async_database import adb
+from lib.scene_counters import count_narrated_scene
+
+
+@pytest.fixture(autouse=True)
+def memory_backend(memory_db):
+    asyncio.run(adb.videos.insert_one({
+        "_id": "v1", "scenes_total": 2, "scenes_pending": 2,
+        "scenes_narrated": 0, "narrated_scene_ids": []}))
+
+
+def counters():
+    video = asyncio.run(adb.videos.find_one({"_id": "v1"}))
+    return video["scenes_pending"], video["scenes_narrated"], video["narrated_scene_ids"]
+
+
+def test_each_scene_is_counted_off_once():
+    asyncio.run(count_narrated_scene("v1", "s1"))
+    asyncio.run(count_narrated_scene("v1", "s1"))
+    assert counters() == (1, 1, ["s1"])
+
+    asyncio.run(count_narrated_scene("v1", "s2"))
+    assert counters() == (0, 2, ["s1", "s2"])
+
+
+class StubCursor:
+    def __init__(self, documents):
+        self.documents = documents
+        self.sort_spec = None
+        self.limit_count = None
+
+    def sort(self, sort_spec):
+        self.sort_spec = sort_spec
+        return self
+
+    def limit(self, limit_count):
+        self.limit_count = limit_count
+        return self
+
+    def __iter__(self):
+        return iter(self.documents[:self.limit_count])
+
+
+class StubVideos:
+    def __init__(self, video_ids):
+        self.cursor = StubCursor([{"_id": video_id} for video_id in video_ids])
+        self.queries = []
+        self.updates = []
+
+    def find(self, query, projection):
+        self.queries.append(query)
+        return self.cursor
+
+    def update_many(self, query, update):
+        self.updates.append((query, update))
+
+
+class StubScenes:
+    def __init__(self, unfinished_video_ids):
+        self.unfinished_video_ids = unfinished_video_ids
+
+    def find_one(self, query, projection):
+        return {"_id": "s"} if query["video_id"] in self.unfinished_video_ids else None
+
+
+def test_recount_checks_a_bounded_batch_of_quiet_videos_and_restamps_them(monkeypatch):
+    now = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    videos = StubVideos(["v1", "v2", "v3"])
+    monkeypatch.setattr(scene_counters, "db", SimpleNamespace(
+        videos=videos, scenes=StubScenes({"v2"})))
+    monkeypatch.setattr(scene_counters, "recount_scenes", lambda video_id: 0)
+    monkeypatch.setattr(scene_counters, "SCENE_RECOUNT_BATCH_SIZE", 2)
+
+    assert scene_counters.recount_stalled_videos(now) == ["v1"]
+
+    assert videos.queries[0]["scenes_checked_at"] == {
+        "$lt": now - datetime.timedelta(seconds=scene_counters.SCENE_STALL_SECONDS)}
+    assert videos.cursor.sort_spec == [("scenes_checked_at", 1)]
+    # The unfinished video is restamped too, so it waits out another stall window
+    assert videos.updates == [({"_id": {"$in": ["v1", "v2"]}},
+                               {"$set": {"scenes_checked_at": now}})]
+
+
+def test_counting_a_scene_marks_the_video_active():
+    asyncio.run(count_narrated_scene("v1", "s1"))
+
+    video = asyncio.run(adb.videos.find_one({"_id": "v1"}))
+    assert isinstance(video["scenes_checked_at"], datetime.datetime)
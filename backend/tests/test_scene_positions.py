@@ -0,0 +1,31 @@
+from lib.scene_positions import initial_position, order_by_links, position_between
+
+
+def test_initial_positions_are_evenly_spaced_from_one():
+    assert [initial_position(index) for index in range(3)] == [1.0, 2.0, 3.0]
+
+
+def test_position_between_takes_the_midpoint_or_steps_past_the_end():
+    assert position_between(1.0, 2.0) == 1.5
+    assert position_between(3.0) == 4.0
+
+
+def test_repeated_inserts_keep_scenes_in_order():
+    positions = [initial_position(0), initial_position(1)]
+    for _ in range(30):
+        # Always insert right after the first scene
+        positions.insert(1, position_between(positions[0], positions[1]))
+
+    assert positions == sorted(positions)
+    assert len(set(positions)) == len(positions)
+
+
+def test_order_by_links_follows_the_legacy_linked_list():
+    scenes = [
+        {"_id": "c", "prev_scene_id": "b"},
+        {"_id": "a", "next_scene_id": "b"},
+        {"_id": "b", "prev_scene_id": "a", "next_scene_id": "c"},
+    ]
+
+    assert [scene["_id"] for scene in order_by_links(scenes)] == ["a", "b", "c"]
+    assert order_by_links([]) == []
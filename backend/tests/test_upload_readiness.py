@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from lib.async_database import adb
+from lib.upload_readiness import (
+    count_described_upload, count_discarded_upload, count_new_upload, sync_aspect_ratios_ready)
+
+
+@pytest.fixture(autouse=True)
+def memory_backend(memory_db):
+    asyncio.run(seed())
+
+
+async def seed():
+    await adb.video_requests.insert_one(
+        {"_id": "r1", "uploads_total": 0, "uploads_pending": 0})
+    await adb.video_request_aspect_ratios.insert_many([
+        {"_id": "r1-16x9", "request_id": "r1", "uploads_ready": True},
+        {"_id": "r1-9x16", "request_id": "r1", "uploads_ready": True},
+    ])
+
+
+def readiness():
+    async def read():
+        return [aspect_ratio["uploads_ready"] async for aspect_ratio in adb.video_request_aspect_ratios.find({"request_id": "r1"})]
+    return asyncio.run(read())
+
+
+def test_uploads_ready_once_every_upload_is_described():
+    asyncio.run(count_new_upload("r1"))
+    asyncio.run(count_new_upload("r1"))
+    assert readiness() == [False, False]
+
+    asyncio.run(count_described_upload("r1"))
+    assert readiness() == [False, False]
+
+    asyncio.run(count_described_upload("r1"))
+    assert readiness() == [True, True]
+
+
+def test_discarded_upload_gives_back_its_count():
+    asyncio.run(count_new_upload("r1"))
+    asyncio.run(count_discarded_upload("r1"))
+
+    request = asyncio.run(adb.video_requests.find_one({"_id": "r1"}))
+    assert (request["uploads_total"], request["uploads_pending"]) == (0, 0)
+    assert readiness() == [True, True]
+
+
+def test_stale_counter_read_does_not_leave_the_request_ready():
+    # A describer read 0 pending, then a new upload was counted before it
+    # wrote the flag
+    asyncio.run(count_new_upload("r1"))
+
+    assert asyncio.run(sync_aspect_ratios_ready("r1", 0)) is False
+    assert readiness() == [False, False]
@@ -0,0 +1,134 @@
+import asyncio
+from pymongo.errors import AutoReconnect, OperationFailure
+import lib.wakeup as wakeup
+from lib.wakeup import StageWaker
+
+
+class StubStream:
+    def __init__(self, changes=()):
+        self.changes = list(changes)
+        self.closed = False
+
+    def try_next(self):
+        return self.changes.pop(0) if self.changes else None
+
+    def close(self):
+        self.closed = True
+
+
+class StubDatabase:
+    def __init__(self, watch_results):
+        # Each item is a stream to return or an exception to raise
+        self.watch_results = list(watch_results)
+        self.watch_calls = []
+
+    def watch(self, pipeline, **kwargs):
+        self.watch_calls.append(pipeline)
+        result = self.watch_results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def record_sleeps(monkeypatch):
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(wakeup.asyncio, "sleep", sleep)
+    return sleeps
+
+
+def make_waker(db, **kwargs):
+    triggers = [
+        ("uploads", {"status": "uploaded"}),
+        ("video_request_aspect_ratios", {"status": "requested", "uploads_ready": True}),
+    ]
+    return StageWaker("test", db, triggers, **kwargs)
+
+
+def test_pipeline_matches_any_trigger_on_full_document():
+    waker = make_waker(StubDatabase([]))
+
+    [stage] = waker.pipeline()
+
+    assert stage["$match"]["operationType"] == {
+        "$in": ["insert", "update", "replace"]}
+    assert stage["$match"]["$or"] == [
+        {"ns.coll": "uploads", "fullDocument.status": "uploaded"},
+        {"ns.coll": "video_request_aspect_ratios",
+         "fullDocument.status": "requested", "fullDocument.uploads_ready": True},
+    ]
+
+
+def test_unsupported_deployment_falls_back_to_polling_for_good(monkeypatch):
+    for code in wakeup.CHANGE_STREAMS_UNSUPPORTED_CODES:
+        sleeps = record_sleeps(monkeypatch)
+        db = StubDatabase([OperationFailure("no change streams", code=code)])
+        waker = make_waker(db, min_poll_wait=1, max_poll_wait=4)
+
+        for _ in range(4):
+            asyncio.run(waker.wait())
+
+        assert waker.change_streams_available is False
+        # watch is not retried once the deployment is known not to support it
+        assert len(db.watch_calls) == 1
+        assert sleeps == [1, 2, 4, 4]
+
+
+def test_transient_failure_polls_once_and_reopens(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    stream = StubStream()
+    db = StubDatabase([
+        OperationFailure("interrupted", code=11601),
+        AutoReconnect("primary stepped down"),
+        stream,
+    ])
+    waker = make_waker(db, min_poll_wait=1)
+
+    asyncio.run(waker.wait())
+    asyncio.run(waker.wait())
+    assert waker.change_streams_available is True
+    assert sleeps == [1, 2]
+
+    # The third wait opens the stream and returns at once to re-poll
+    asyncio.run(waker.wait())
+    assert waker._stream is stream
+    assert sleeps == [1, 2]
+
+
+def test_change_wakes_without_sleeping(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    stream = StubStream([{"operationType": "insert"}])
+    waker = make_waker(StubDatabase([stream]))
+
+    asyncio.run(waker.wait())
+    asyncio.run(waker.wait())
+
+    assert sleeps == []
+    assert stream.changes == []
+
+
+def test_reset_restarts_backoff(monkeypatch):
+    sleeps = record_sleeps(monkeypatch)
+    waker = make_waker(StubDatabase(
+        [OperationFailure("standalone", code=40573)]), min_poll_wait=1)
+
+    asyncio.run(waker.wait())
+    asyncio.run(waker.wait())
+    waker.reset()
+    asyncio.run(waker.wait())
+
+    assert sleeps == [1, 2, 1]
+
+
+def test_close_closes_the_stream():
+    stream = StubStream()
+    waker = make_waker(StubDatabase([stream]))
+
+    asyncio.run(waker.wait())
+    waker.close()
+
+    assert stream.closed
+    assert waker._stream is None
@@ -0,0 +1,143 @@
+import asyncio
+import pytest
+import lib.worker_pool as worker_pool
+from lib.job_queue import current_lease_token
+from lib.worker_pool import run_stage_loop
+
+
+@pytest.fixture(autouse=True)
+def no_indexes(monkeypatch):
+    monkeypatch.setattr(worker_pool, "ensure_indexes", lambda: None)
+
+
+class StubWaker:
+    def __init__(self):
+        self.waits = 0
+        self.closed = False
+
+    async def wait(self):
+        self.waits += 1
+        await asyncio.sleep(0)
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class StubHeartbeat:
+    def __init__(self):
+        self.leases = {}
+        self.started = self.stopped = False
+
+    def start(self):
+        self.started = True
+
+    def stop(self):
+        self.stopped = True
+
+    def add(self, job_id, lease_token):
+        self.leases[job_id] = lease_token
+
+    def remove(self, job_id, lease_token):
+        assert self.leases.pop(job_id) == lease_token
+
+
+class Queue:
+    """Hands out job ids 1, 2, ... and records each claim's limit and token."""
+
+    def __init__(self, size=100):
+        self.remaining = list(range(1, size + 1))
+        self.claims = []
+
+    def claim_batch(self, limit, lease_token):
+        job_ids, self.remaining = self.remaining[:limit], self.remaining[limit:]
+        self.claims.append((limit, lease_token, job_ids))
+        return job_ids
+
+
+def test_a_freed_slot_is_refilled_without_waiting_for_the_batch():
+    queue = Queue()
+    finish = {job_id: asyncio.Event() for job_id in range(1, 4)}
+    started = []
+
+    async def process(job_id):
+        started.append(job_id)
+        await finish[job_id].wait()
+
+    async def scenario():
+        loop_task = asyncio.create_task(run_stage_loop(
+            "test", queue.claim_batch, process, StubWaker(), concurrency=2, max_count=3))
+        while len(started) < 2:
+            await asyncio.sleep(0)
+        # Job 2 is still running when job 1 finishes; job 3 takes job 1's slot
+        finish[1].set()
+        while len(started) < 3:
+            await asyncio.sleep(0)
+        finish[2].set()
+        finish[3].set()
+        await loop_task
+
+    asyncio.run(scenario())
+
+    assert started == [1, 2, 3]
+    assert [(limit, job_ids) for limit, _token, job_ids in queue.claims] == [(2, [1, 2]), (1, [3])]
+
+
+def test_the_loop_stops_after_max_count_claims_and_drains_in_flight_jobs():
+    queue = Queue()
+    finished = []
+
+    async def process(job_id):
+        await asyncio.sleep(0)
+        finished.append(job_id)
+
+    waker = StubWaker()
+    asyncio.run(run_stage_loop("test", queue.claim_batch, process, waker, concurrency=4, max_count=6))
+
+    assert sorted(finished) == [1, 2, 3, 4, 5, 6]
+    # Never claims more than max_count leaves room for
+    assert sum(limit for limit, _token, _job_ids in queue.claims) == 6
+    assert waker.closed
+
+
+def test_jobs_run_in_their_batch_lease_and_release_it_when_they_raise():
+    queue = Queue()
+    heartbeat = StubHeartbeat()
+    tokens = {}
+
+    async def process(job_id):
+        tokens[job_id] = current_lease_token.get()
+        if job_id == 2:
+            raise RuntimeError("render failed")
+        return job_id
+
+    results = []
+    asyncio.run(run_stage_loop("test", queue.claim_batch, process, StubWaker(), heartbeat=heartbeat,
+                               handle_result=results.append, concurrency=3, max_count=3))
+
+    (_limit, lease_token, _job_ids), = queue.claims
+    assert tokens == {1: lease_token, 2: lease_token, 3: lease_token}
+    assert sorted(results) == [1, 3]
+    # Every lease, including the failed job's, was dropped from the heartbeat
+    assert heartbeat.leases == {}
+    assert heartbeat.started and heartbeat.stopped
+
+
+def test_an_empty_queue_waits_on_the_waker_before_claiming_again():
+    queue = Queue(size=0)
+    waker = StubWaker()
+
+    async def add_work_later():
+        loop_task = asyncio.create_task(run_stage_loop(
+            "test", queue.claim_batch, lambda job_id: asyncio.sleep(0), waker, max_count=1))
+        while waker.waits < 2:
+            await asyncio.sleep(0)
+        queue.remaining = [7]
+        await loop_task
+
+    asyncio.run(add_work_later())
+
+    assert waker.waits >= 2
+    assert queue.claims[-1][2] == [7]
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 from models.scene import Scene
 from constants import ASPECT_RATIO_SETTINGS, UPLOAD_DIRECTORY
 from lib.logger import setup_logger
+from lib.rate_limiter import get_rate_limiter
 
 logger = setup_logger(__name__)
 
@@ -37,6 +38,7 @@ def generate_image(scene: Scene, prompt, index: int) -> str:
         height = 1344
 
     # Generate the image using the OctoAI SDK
+    get_rate_limiter("octoai").acquire()
     image_gen_response = image_gen.generate(
         engine=Engine.SDXL,
         prompt=prompt,
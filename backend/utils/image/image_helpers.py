@@ -1,7 +1,8 @@
 from models.video import Video
 from models.scene import Scene
 from PIL import Image
-import anthropic
+import asyncio
+from lib.providers import get_anthropic_client
 import base64
 import magic
 import math
@@ -21,7 +22,7 @@ def detect_aspect_ratio(image_width, image_height):
 
 
 async def describe_image(image_path, additional_context=""):
-    client = anthropic.Anthropic()
+    client = get_anthropic_client()
 
     # Read the image file from the local path
     with open(image_path, "rb") as image_file:
@@ -36,8 +37,10 @@ async def describe_image(image_path, additional_context=""):
     prompt = "Describe this image very succinctly but descriptively for a TV news / social media script. Feel free to use keywords and clipped language. Almost like a prompt for image generation. " + \
         additional_context
 
-    # Create the message for the Anthropic API
-    message = client.messages.create(
+    # Create the message for the Anthropic API; the call and its rate limit
+    # wait block, so they run off the event loop
+    message = await asyncio.to_thread(
+        client.messages.create,
         model="claude-3-haiku-20240307",
         system="You are a video editor and you are helping a user edit a video.",
         max_tokens=1024,
@@ -69,7 +72,7 @@ async def describe_image(image_path, additional_context=""):
 
 
 async def is_image_logo(image_path):
-    client = anthropic.Anthropic()
+    client = get_anthropic_client()
 
     # Read the image file from the local path
     with open(image_path, "rb") as image_file:
@@ -83,8 +86,10 @@ async def is_image_logo(image_path):
 
     prompt = "Is this image a logo? Please respond with just 'Yes' or 'No'."
 
-    # Create the message for the Anthropic API
-    message = client.messages.create(
+    # Create the message for the Anthropic API; the call and its rate limit
+    # wait block, so they run off the event loop
+    message = await asyncio.to_thread(
+        client.messages.create,
         model="claude-3-haiku-20240307",
         system="You are an image analysis assistant.",
         max_tokens=10,
@@ -116,7 +121,7 @@ async def is_image_logo(image_path):
 
 
 async def is_image_profile_pic(image_path):
-    client = anthropic.Anthropic()
+    client = get_anthropic_client()
 
     # Read the image file from the local path
     with open(image_path, "rb") as image_file:
@@ -130,8 +135,10 @@ async def is_image_profile_pic(image_path):
 
     prompt = "Is this image a profile picture or headshot of a person? Please respond with just 'Yes' or 'No'."
 
-    # Create the message for the Anthropic API
-    message = client.messages.create(
+    # Create the message for the Anthropic API; the call and its rate limit
+    # wait block, so they run off the event loop
+    message = await asyncio.to_thread(
+        client.messages.create,
         model="claude-3-haiku-20240307",
         system="You are an image analysis assistant.",
         max_tokens=10,
@@ -193,7 +200,7 @@ def extract_and_fill_prompts(response_text, num_images, scene_narration):
 
 
 def get_image_prompts(num_images, scene: Scene, video: Video):
-    client = anthropic.Anthropic()
+    client = get_anthropic_client()
 
     prompt = f"""
         Given the following scene, you need to generate a list of image prompts.
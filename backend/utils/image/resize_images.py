@@ -1,14 +1,25 @@
 from PIL import Image, ImageOps
+import PIL
+import os
 import shutil
 from constants import ASPECT_RATIO_SETTINGS
 
-def convert_image_to_aspect_ratio(input_path, output_path, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+def encoder_profile(output_path):
+    # Pillow's save defaults, e.g. JPEG quality, follow its version
+    extension = os.path.splitext(output_path)[1].lower()
+    return f"pillow-{PIL.__version__}{extension}"
+
+
+def load_image(input_path):
     # Load the image
     image = Image.open(input_path)
-    
+
     # Rotate the image based on the EXIF orientation tag
-    image = ImageOps.exif_transpose(image)
+    return ImageOps.exif_transpose(image)
+
 
+def fit_image_to_aspect_ratio(image, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+    """Returns the image fitted to the aspect ratio's screen size, or None if it already has the ratio."""
     # Get the current image dimensions
     image_width, image_height = image.size
 
@@ -17,11 +28,7 @@ def convert_image_to_aspect_ratio(input_path, output_path, aspect_ratio_width, a
 
     # Check if the image is already in the desired aspect ratio
     if current_aspect_ratio == aspect_ratio_width / aspect_ratio_height:
-        print("The image is already in the desired aspect ratio.")
-        shutil.copy(input_path, output_path)
-        print(
-            f"Image copied from {input_path} to {output_path} without modification.")
-        return
+        return None
 
     # Calculate the new dimensions based on the desired aspect ratio
     desired_aspect_ratio = aspect_ratio_width / aspect_ratio_height
@@ -63,7 +70,30 @@ def convert_image_to_aspect_ratio(input_path, output_path, aspect_ratio_width, a
     screen_size = ASPECT_RATIO_SETTINGS.get(aspect_ratio_key, {}).get("SCREEN_SIZE", (aspect_ratio_width, aspect_ratio_height))
 
     # resize to target size
-    final_image = final_image.resize(screen_size)
-    
-    # Save the final image
-    final_image.save(output_path)
+    return final_image.resize(screen_size)
+
+
+def convert_image_to_aspect_ratios(input_path, targets, crop_type="contain", background_color=(0, 0, 0)):
+    """
+    Writes input_path fitted to every (output_path, aspect_ratio_width,
+    aspect_ratio_height) in `targets`, opening and decoding it only once.
+    """
+    image = load_image(input_path)
+    for output_path, aspect_ratio_width, aspect_ratio_height in targets:
+        final_image = fit_image_to_aspect_ratio(
+            image, aspect_ratio_width, aspect_ratio_height, crop_type, background_color)
+        if final_image is None:
+            print("The image is already in the desired aspect ratio.")
+            shutil.copy(input_path, output_path)
+            print(
+                f"Image copied from {input_path} to {output_path} without modification.")
+            continue
+
+        # Save the final image
+        final_image.save(output_path)
+
+
+def convert_image_to_aspect_ratio(input_path, output_path, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+    convert_image_to_aspect_ratios(
+        input_path, [(output_path, aspect_ratio_width, aspect_ratio_height)], crop_type, background_color)
+
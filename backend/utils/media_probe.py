@@ -0,0 +1,169 @@
+"""
+Media metadata from a single ffprobe call per file.
+
+`probe_media` returns every stream's metadata as one MediaProbe and memoizes it
+by (path, mtime, size), so describing, converting and rendering a file never
+re-open it, and nothing starts a decoder just to read its size or duration.
+"""
+import functools
+import json
+import os
+import subprocess
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
+
+# imageio-ffmpeg, which MoviePy uses, ships no ffprobe, so this is the system one
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+PROBE_CACHE_SIZE = 1024
+
+
+class ProbeError(Exception):
+    pass
+
+
+class VideoStream(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    codec: Optional[str] = None
+    # Coded frame size; phones often record rotated and flag it as metadata
+    width: int
+    height: int
+    rotation: int = 0
+    fps: Optional[float] = None
+    pix_fmt: Optional[str] = None
+    frame_count: Optional[int] = None
+
+    @property
+    def display_width(self):
+        return self.height if self.rotation in (90, 270) else self.width
+
+    @property
+    def display_height(self):
+        return self.width if self.rotation in (90, 270) else self.height
+
+    @property
+    def display_size(self):
+        return self.display_width, self.display_height
+
+
+class AudioStream(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    codec: Optional[str] = None
+    sample_rate: Optional[int] = None
+    channels: Optional[int] = None
+    bit_rate: Optional[int] = None
+
+
+class MediaProbe(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    path: str
+    format_name: Optional[str] = None
+    duration: Optional[float] = None
+    size_bytes: Optional[int] = None
+    bit_rate: Optional[int] = None
+    video: Optional[VideoStream] = None
+    audio: Optional[AudioStream] = None
+
+    @property
+    def has_video(self):
+        return self.video is not None
+
+    @property
+    def has_audio(self):
+        return self.audio is not None
+
+    def require_video(self) -> VideoStream:
+        """The video stream; raises ProbeError for audio-only or cover-art-only files."""
+        if self.video is None:
+            raise ProbeError(f"{self.path} has no video stream")
+        return self.video
+
+
+def parse_number(value, type_=float):
+    try:
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_frame_rate(value):
+    # ffprobe reports rates as fractions such as "30000/1001"; "0/0" means unknown
+    if not value or "/" not in value:
+        return parse_number(value)
+    numerator, denominator = (parse_number(part) for part in value.split("/", 1))
+    if not numerator or not denominator:
+        return None
+    return numerator / denominator
+
+
+def parse_rotation(stream):
+    rotation = parse_number(stream.get("tags", {}).get("rotate"), int)
+    if rotation is None:
+        # Newer ffmpeg reports a display matrix instead, counter-clockwise
+        for side_data in stream.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = -parse_number(side_data["rotation"], int)
+                break
+    return (rotation or 0) % 360
+
+
+def parse_probe(path, info):
+    streams = info.get("streams", [])
+    format_info = info.get("format", {})
+    # Cover art is reported as a video stream; it isn't the video
+    video_info = next((stream for stream in streams if stream.get("codec_type") == "video"
+                       and not stream.get("disposition", {}).get("attached_pic")), None)
+    audio_info = next(
+        (stream for stream in streams if stream.get("codec_type") == "audio"), None)
+
+    video = None
+    if video_info:
+        video = VideoStream(
+            codec=video_info.get("codec_name"),
+            width=video_info.get("width", 0),
+            height=video_info.get("height", 0),
+            rotation=parse_rotation(video_info),
+            fps=parse_frame_rate(video_info.get("avg_frame_rate")) or parse_frame_rate(
+                video_info.get("r_frame_rate")),
+            pix_fmt=video_info.get("pix_fmt"),
+            frame_count=parse_number(video_info.get("nb_frames"), int),
+        )
+    audio = None
+    if audio_info:
+        audio = AudioStream(
+            codec=audio_info.get("codec_name"),
+            sample_rate=parse_number(audio_info.get("sample_rate"), int),
+            channels=audio_info.get("channels"),
+            bit_rate=parse_number(audio_info.get("bit_rate"), int),
+        )
+
+    return MediaProbe(
+        path=path,
+        format_name=format_info.get("format_name"),
+        duration=parse_number(format_info.get("duration")) or parse_number(
+            (video_info or audio_info or {}).get("duration")),
+        size_bytes=parse_number(format_info.get("size"), int),
+        bit_rate=parse_number(format_info.get("bit_rate"), int),
+        video=video,
+        audio=audio,
+    )
+
+
+@functools.lru_cache(maxsize=PROBE_CACHE_SIZE)
+def _probe_media(path, _mtime_ns, _size):
+    command = [FFPROBE_BINARY, "-v", "error", "-print_format", "json",
+               "-show_format", "-show_streams", path]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ProbeError(
+            f"ffprobe failed on {path}: {result.stderr.strip()[-2000:]}")
+    return parse_probe(path, json.loads(result.stdout))
+
+
+def probe_media(path) -> MediaProbe:
+    """Stream and container metadata of the media file at `path`."""
+    stat = os.stat(path)
+    # A rewritten file gets a new mtime or size and so a fresh probe
+    return _probe_media(os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
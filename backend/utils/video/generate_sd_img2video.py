@@ -1,8 +1,10 @@
+import asyncio
 import datetime
 from constants import UPLOAD_DIRECTORY
 from models.scene import Scene
 import io
 from lib.logger import setup_logger
+from lib.rate_limiter import get_rate_limiter
 from octoai.clients.video_gen import Engine as VideoEngine, VideoGenerator
 from PIL import Image
 import base64
@@ -41,7 +43,9 @@ async def generate_video_from_image(scene: Scene, asset_path: str):
 
         # Generate video from image using OctoAI SDK
         image = Image.open(asset_path)
-        video_gen_response = video_gen.generate(
+        await get_rate_limiter("octoai").acquire_async()
+        video_gen_response = await asyncio.to_thread(
+            video_gen.generate,
             engine=VideoEngine.SVD,
             image=image_to_base64(image),
             steps=25,
@@ -0,0 +1,219 @@
+"""
+Synchronous MoviePy/Pillow renders that run inside lib.media_pool worker processes.
+
+Nothing here touches the database or calls a provider: callers resolve assets,
+logos and narration paths first and pass plain paths and values in, so every
+function can be pickled across to a worker process and killed there safely.
+"""
+import os
+from moviepy.editor import AudioFileClip, CompositeVideoClip, ImageClip, TextClip, VideoFileClip, concatenate_videoclips
+from PIL import Image, ImageOps
+from utils.image.create_images_with_pil import create_gradient_background_image
+from utils.video.generate_subtitles import generate_subtitle_clips
+from utils.video.video_helpers import get_video_size
+
+
+def get_video_clip(filename: str, duration: float = None):
+    """
+    Retrieves a video clip object from a filename. Optionally trims the clip to a specified duration.
+
+    :param filename: The path to the video file.
+    :param duration: The duration to which the video should be trimmed (in seconds).
+    :return: A VideoFileClip object.
+    """
+    target_size = get_video_size(filename)
+    clip = VideoFileClip(filename)
+    clip = clip.resize(target_size)
+    if duration is not None and duration < clip.duration:
+        # Trim the clip to the specified duration
+        clip = clip.subclip(0, duration)
+    return clip
+
+
+def load_body_clip(clip_spec, screen_size):
+    """
+    clip_spec is a dict with "kind" (asset_video, generated_video or image),
+    "path" and "duration".
+    """
+    if clip_spec["kind"] == "asset_video":
+        return get_video_clip(clip_spec["path"], clip_spec["duration"])
+    if clip_spec["kind"] == "generated_video":
+        return VideoFileClip(clip_spec["path"]).resize(
+            screen_size).set_duration(clip_spec["duration"])
+    return ImageClip(clip_spec["path"]).resize(
+        screen_size).set_duration(clip_spec["duration"])
+
+
+def render_scene_body_video(clip_specs, scene_duration, screen_size, output_path, subtitles_narration=None, narration_audio_path=None):
+    clips = [load_body_clip(clip_spec, screen_size) for clip_spec in clip_specs]
+
+    # Convert images to video clips and concatenate
+    final_clip = concatenate_videoclips(clips)
+    final_clip.set_duration(scene_duration)
+
+    clips_to_composite = [final_clip]
+
+    if subtitles_narration is not None:
+        subtitles_top_spacing = screen_size[1] * 0.79
+        max_text_width = screen_size[0] * 0.95
+        font_size = int(screen_size[1] / 20)
+        subtitle_clips = generate_subtitle_clips(
+            subtitles_narration,
+            scene_duration,
+            max_text_width,
+            top_spacing=subtitles_top_spacing,
+            font_size=font_size,
+            screen_size=screen_size
+        )
+        clips_to_composite.extend(subtitle_clips)
+
+    final_clip = CompositeVideoClip(clips_to_composite)
+    final_clip = final_clip.resize(screen_size)
+
+    if narration_audio_path:
+        # Set the audio of the composite clip to be the narration audio
+        final_clip = final_clip.set_audio(AudioFileClip(narration_audio_path))
+
+    final_clip.write_videofile(output_path, fps=24, threads=4)
+
+    for clip in clips:
+        clip.close()
+
+    return output_path
+
+
+def render_title_scene_video(narration, scene_duration, ratio_settings, output_path, narration_audio_path, gradient_bg_path, gradient_color, gradient_color2, brand_link, masked_logo_path=None, draw_bounding_box=False):
+    SCREEN_SIZE = ratio_settings["SCREEN_SIZE"]
+
+    create_gradient_background_image(
+        SCREEN_SIZE, gradient_color, gradient_color2, gradient_bg_path
+    )
+    max_text_width = SCREEN_SIZE[0] * 0.8  # Allow 80% of screen width for text
+    font_size = int(SCREEN_SIZE[1] / 25)
+    line_spacing = font_size / 3
+
+    # Define the desired spacing from the top and bottom edges
+    top_spacing = int(SCREEN_SIZE[1] * ratio_settings["top_spacing"])
+    bottom_spacing = int(SCREEN_SIZE[1] * ratio_settings["bottom_spacing"])
+
+    logo_relative_size = ratio_settings["logo_relative_size"]
+    # Place the center of the logo at 70% of the screen height
+    logo_bottom_spacing = int(
+        SCREEN_SIZE[1] * ratio_settings["logo_bottom_spacing"])
+
+    # Create a background clip of solid color
+    background_clip = ImageClip(gradient_bg_path, duration=scene_duration)
+    background_clip = background_clip.set_position(
+        'center').set_duration(scene_duration)
+
+    # Load the logo and resize it to fit the screen appropriately
+    if masked_logo_path is None:
+        # Generate a capital letter in a cool font
+        letter = "M"  # @TODO Replace with the desired letter
+        # Replace with the path to the cool font file
+        font = "Helvetica-Bold"
+        font_size = 200  # Adjust the font size as needed
+        text_color = (255, 255, 255)  # White color, adjust as needed
+
+        # Create a text clip for the letter
+        letter_clip = TextClip(letter, fontsize=font_size,
+                               color=text_color, font=font)
+        letter_clip = letter_clip.set_duration(scene_duration)
+
+        # Resize the letter clip to fit the screen appropriately
+        letter_clip = letter_clip.resize(
+            height=SCREEN_SIZE[1] * logo_relative_size)
+
+        # Set the position of the letter clip
+        letter_clip = letter_clip.set_position('center', logo_bottom_spacing)
+
+        # Use the letter clip in place of the logo
+        logo_clip = letter_clip
+    else:
+        # The logo arrives already masked (see lib.branding) and is shared by
+        # every title scene of the request, so it is never written to here
+        if draw_bounding_box:
+            # Open the image using PIL
+            logo_image = Image.open(masked_logo_path)
+            # Define border color and thickness
+            border_color = 'black'  # Change this to your desired border color
+            border_thickness = 10  # Change this to your desired border thickness
+            # Add a border to the image
+            logo_image_with_border = ImageOps.expand(
+                logo_image, border=border_thickness, fill=border_color)
+            # Save next to the scene video rather than over the shared logo
+            masked_logo_path = f"{os.path.splitext(output_path)[0]}_logo.png"
+            logo_image_with_border.save(masked_logo_path)
+
+        logo_clip = ImageClip(masked_logo_path).set_duration(scene_duration)
+        # Resize logo to 60% of the screen width
+        logo_clip = logo_clip.resize(
+            width=(SCREEN_SIZE[0] * logo_relative_size))
+        logo_height = logo_clip.h
+        logo_clip = logo_clip.set_position((
+            'center', SCREEN_SIZE[1] * 0.7 - logo_height/2))
+
+    # Create a text clip for the narration text
+    narration_text = TextClip(
+        narration,
+        fontsize=font_size,
+        color='white',
+        size=(max_text_width, None),
+        font="Helvetica-Bold",
+        method="caption",
+        align="center",
+        interline=line_spacing
+    )
+    narration_text = narration_text.set_position(
+        ('center', top_spacing)).set_duration(scene_duration)
+
+    # Create a text clip for the social media handle
+    social_media_text = TextClip(
+        brand_link,
+        fontsize=int(font_size * 0.6),
+        color='white',
+        size=(max_text_width, None),
+        font="Helvetica"
+    )
+    social_media_text = social_media_text.set_position(
+        ('center', bottom_spacing)).set_duration(scene_duration)
+
+    # Composite all the clips together
+    composite_clip = CompositeVideoClip(
+        [background_clip, logo_clip, narration_text, social_media_text])
+    composite_clip = composite_clip.set_duration(scene_duration)
+
+    # Set the audio of the composite clip to be the narration audio
+    composite_clip = composite_clip.set_audio(
+        AudioFileClip(narration_audio_path))
+
+    # Set the final size to match the aspect ratio
+    composite_clip = composite_clip.resize(SCREEN_SIZE)
+    composite_clip.write_videofile(output_path, fps=24)
+
+    return output_path
+
+
+def render_final_cut(scene_video_paths, final_cut_path):
+    # Load video clips
+    video_clips = [VideoFileClip(path) for path in scene_video_paths]
+
+    # Apply fade-in and fade-out effects
+    for i, clip in enumerate(video_clips):
+        if i != 0:  # Skip fade-in for the first clip
+            clip = clip.fadein(0.5)
+        if i != len(video_clips) - 1:  # Skip fade-out for the last clip
+            clip = clip.fadeout(0.5)
+        video_clips[i] = clip
+
+    # Concatenate video clips
+    final_clip = concatenate_videoclips(video_clips)
+
+    # Write the final cut to the output path
+    final_clip.write_videofile(final_cut_path)
+
+    # Close the video clips
+    for clip in video_clips:
+        clip.close()
+
+    return final_cut_path
@@ -1,83 +1,188 @@
-from moviepy.editor import ColorClip, CompositeVideoClip, VideoFileClip
-from utils.video.video_helpers import get_video_size
-from constants import ASPECT_RATIO_SETTINGS
+"""
+Converts uploads to target aspect ratios with a single ffmpeg pass.
+
+Padding ("contain") or center cropping and the scale to the ratio's SCREEN_SIZE
+are one filtergraph, so frames are decoded, filtered and encoded inside ffmpeg
+without ever becoming numpy arrays, and the audio stream is copied untouched.
+Several aspect ratios are written from one decode by splitting the stream.
+"""
+import os
 import shutil
-# default codec is 'libx264'
-# default bitrate is 2000
+import subprocess
+from moviepy.config import get_setting
+from constants import ASPECT_RATIO_SETTINGS
+from lib.logger import setup_logger
+from utils.media_probe import probe_media
 
+logger = setup_logger(__name__)
 
-def convert_video_to_aspect_ratio(input_path, output_path, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+# x264 speed/quality trade-off for converted assets. crf 23 matches the MoviePy
+# default these assets used to be written with; the preset only affects speed.
+FFMPEG_PRESET = os.getenv("FFMPEG_PRESET", "veryfast")
+FFMPEG_CRF = int(os.getenv("FFMPEG_CRF", 23))
 
-    # Get the video size using the get_video_size function
-    video_width, video_height = get_video_size(input_path)
+# Video encoder arguments per output container, picked by extension as MoviePy did
+VIDEO_ENCODER_ARGS = {
+    ".webm": ["-c:v", "libvpx-vp9", "-crf", str(FFMPEG_CRF + 8), "-b:v", "0", "-deadline", "realtime"],
+}
+DEFAULT_VIDEO_ENCODER_ARGS = ["-c:v", "libx264", "-preset", FFMPEG_PRESET,
+                              "-crf", str(FFMPEG_CRF), "-pix_fmt", "yuv420p"]
+# Audio is copied; these are only used when the container can't hold the source codec
+AUDIO_FALLBACK_ARGS = {
+    ".webm": ["-c:a", "libopus"],
+}
+DEFAULT_AUDIO_FALLBACK_ARGS = ["-c:a", "aac", "-b:a", "192k"]
+# Containers whose index can be moved to the front for progressive playback
+FASTSTART_EXTENSIONS = {".mp4", ".mov", ".m4v"}
 
-    # Load the video clip
-    video = VideoFileClip(input_path)
 
-    # Manually set the video width and height by resizing
-    # Replace (new_width, new_height) with your desired dimensions
-    video = video.resize(newsize=(video_width, video_height))
+def encoder_profile(output_path):
+    """Names the encoder settings an output is written with, so cached conversions match them."""
+    extension = os.path.splitext(output_path)[1].lower()
+    return " ".join(["ffmpeg", *VIDEO_ENCODER_ARGS.get(extension, DEFAULT_VIDEO_ENCODER_ARGS)])
 
-    # Calculate the current aspect ratio
-    current_aspect_ratio = video_width / video_height
-    print(f"video width is {video_width}")
-    print(f"video height is {video_height}")
-    print(f"current aspect ratio is {current_aspect_ratio}")
-    print(
-        f"desired aspect ratio is {aspect_ratio_width} / {aspect_ratio_height}")
-    # Check if the video is already in the desired aspect ratio
-    if current_aspect_ratio == aspect_ratio_width / aspect_ratio_height:
-        print("The video is already in the desired aspect ratio.")
-        shutil.copy(input_path, output_path)
-        print(
-            f"Video copied from {input_path} to {output_path} without modification.")
-        return
 
-    # Calculate the new dimensions based on the desired aspect ratio
+def get_ffmpeg_binary():
+    # The same binary MoviePy uses, so conversion works wherever rendering does
+    return get_setting("FFMPEG_BINARY")
+
+
+def get_display_size(input_path):
+    """Frame size as played back, i.e. after the rotation phones record as metadata."""
+    return probe_media(input_path).require_video().display_size
+
+
+def even(value):
+    # yuv420p needs even dimensions
+    return max(2, int(round(value)) // 2 * 2)
+
+
+def get_screen_size(aspect_ratio_width, aspect_ratio_height):
+    aspect_ratio_key = f"{aspect_ratio_width}x{aspect_ratio_height}"
+    screen_width, screen_height = ASPECT_RATIO_SETTINGS.get(aspect_ratio_key, {}).get(
+        "SCREEN_SIZE", (aspect_ratio_width, aspect_ratio_height))
+    return even(screen_width), even(screen_height)
+
+
+def build_filtergraph(video_width, video_height, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+    """
+    Returns the -vf filtergraph that fits a video_width x video_height video to
+    the aspect ratio's screen size: letterboxed on background_color for
+    "contain", center cropped otherwise.
+    """
+    screen_width, screen_height = get_screen_size(
+        aspect_ratio_width, aspect_ratio_height)
+    current_aspect_ratio = video_width / video_height
     desired_aspect_ratio = aspect_ratio_width / aspect_ratio_height
+
     if crop_type == "contain":
+        # The padded frame the video is centered in, as before
         if current_aspect_ratio > desired_aspect_ratio:
-            new_height = int(video_width / desired_aspect_ratio)
             new_width = video_width
+            new_height = int(video_width / desired_aspect_ratio)
         else:
             new_width = int(video_height * desired_aspect_ratio)
             new_height = video_height
 
-        # Create a new background clip with the desired dimensions and color
-        background_clip = ColorClip(
-            size=(new_width, new_height), color=background_color)
-
-        # Calculate the position to center the video on the background
-        x_position = (new_width - video_width) // 2
-        y_position = (new_height - video_height) // 2
+        # Scale first and pad the small frame, rather than padding at full size
+        scaled_width = even(video_width * screen_width / new_width)
+        scaled_height = even(video_height * screen_height / new_height)
+        x_position = (screen_width - scaled_width) // 2
+        y_position = (screen_height - scaled_height) // 2
+        color = "0x{:02x}{:02x}{:02x}".format(*background_color)
+        return (f"scale={scaled_width}:{scaled_height},"
+                f"pad={screen_width}:{screen_height}:{x_position}:{y_position}:color={color},"
+                f"setsar=1")
 
-        # Overlay the video on the background
-        final_clip = CompositeVideoClip(
-            [background_clip, video.set_position((x_position, y_position))])
-        final_clip = final_clip.set_duration(video.duration)
+    if current_aspect_ratio > desired_aspect_ratio:
+        new_width = int(video_height * desired_aspect_ratio)
+        new_height = video_height
     else:
-        if current_aspect_ratio > desired_aspect_ratio:
-            new_width = int(video_height * desired_aspect_ratio)
-            new_height = video_height
-        else:
-            new_width = video_width
-            new_height = int(video_width / desired_aspect_ratio)
+        new_width = video_width
+        new_height = int(video_width / desired_aspect_ratio)
 
-        # Crop the video to the new dimensions
-        x1 = (video_width - new_width) // 2
-        y1 = (video_height - new_height) // 2
-        x2 = x1 + new_width
-        y2 = y1 + new_height
-        final_clip = video.crop(x1=x1, y1=y1, x2=x2, y2=y2)
+    x1 = (video_width - new_width) // 2
+    y1 = (video_height - new_height) // 2
+    return f"crop={new_width}:{new_height}:{x1}:{y1},scale={screen_width}:{screen_height},setsar=1"
 
-    # Find the corresponding SCREEN_SIZE from ASPECT_RATIO_SETTINGS
-    aspect_ratio_key = f"{aspect_ratio_width}x{aspect_ratio_height}"
-    screen_size = ASPECT_RATIO_SETTINGS.get(aspect_ratio_key, {}).get(
-        "SCREEN_SIZE", (aspect_ratio_width, aspect_ratio_height))
 
-    # resize to target size
-    final_clip = final_clip.resize(screen_size)
+def build_split_filtergraph(filtergraphs):
+    """
+    Returns the -filter_complex graph that decodes the first video stream once
+    and feeds a copy of it through each filtergraph, labelled [v0], [v1], ...
+    """
+    if len(filtergraphs) == 1:
+        return f"[0:v:0]{filtergraphs[0]}[v0]"
+    split = f"[0:v:0]split={len(filtergraphs)}" + \
+        "".join(f"[s{index}]" for index in range(len(filtergraphs)))
+    chains = [f"[s{index}]{filtergraph}[v{index}]"
+              for index, filtergraph in enumerate(filtergraphs)]
+    return ";".join([split, *chains])
+
+
+def audio_args_for(output_path, reencode_audio):
+    if not reencode_audio:
+        return ["-c:a", "copy"]
+    extension = os.path.splitext(output_path)[1].lower()
+    return AUDIO_FALLBACK_ARGS.get(extension, DEFAULT_AUDIO_FALLBACK_ARGS)
+
 
-    # Write the final clip to a file
-    final_clip.write_videofile(
-        output_path)
+def run_ffmpeg(input_path, targets, reencode_audio=False):
+    """Writes every (output_path, filtergraph) in `targets` from a single decode of input_path."""
+    command = [
+        get_ffmpeg_binary(), "-y", "-loglevel", "error",
+        "-i", input_path,
+        "-filter_complex", build_split_filtergraph(
+            [filtergraph for _output_path, filtergraph in targets]),
+    ]
+    for index, (output_path, _filtergraph) in enumerate(targets):
+        extension = os.path.splitext(output_path)[1].lower()
+        command += [
+            "-map", f"[v{index}]", "-map", "0:a?",
+            *VIDEO_ENCODER_ARGS.get(extension, DEFAULT_VIDEO_ENCODER_ARGS),
+            *audio_args_for(output_path, reencode_audio),
+            *(["-movflags", "+faststart"] if extension in FASTSTART_EXTENSIONS else []),
+            output_path
+        ]
+    return subprocess.run(command, capture_output=True, text=True)
+
+
+def convert_video_to_aspect_ratios(input_path, targets, crop_type="contain", background_color=(0, 0, 0)):
+    """
+    Converts input_path to every (output_path, aspect_ratio_width,
+    aspect_ratio_height) in `targets` with one probe and one decode; outputs
+    whose ratio the video already has are plain copies.
+    """
+    video_width, video_height = get_display_size(input_path)
+    current_aspect_ratio = video_width / video_height
+
+    filtered_targets = []
+    for output_path, aspect_ratio_width, aspect_ratio_height in targets:
+        # Check if the video is already in the desired aspect ratio
+        if current_aspect_ratio == aspect_ratio_width / aspect_ratio_height:
+            shutil.copy(input_path, output_path)
+            logger.info(
+                f"Video copied from {input_path} to {output_path} without modification.")
+            continue
+        filtered_targets.append((output_path, build_filtergraph(
+            video_width, video_height, aspect_ratio_width, aspect_ratio_height, crop_type, background_color)))
+
+    if not filtered_targets:
+        return
+
+    logger.info(
+        f"Converting {input_path} ({video_width}x{video_height}) to {len(filtered_targets)} aspect ratio(s) ({crop_type})")
+    result = run_ffmpeg(input_path, filtered_targets)
+    if result.returncode != 0:
+        # Typically a source audio codec an output container can't hold
+        logger.warning(
+            f"Copying the audio of {input_path} failed, re-encoding it: {result.stderr.strip()[-500:]}")
+        result = run_ffmpeg(input_path, filtered_targets, reencode_audio=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ffmpeg failed converting {input_path}: {result.stderr.strip()[-2000:]}")
+
+
+def convert_video_to_aspect_ratio(input_path, output_path, aspect_ratio_width, aspect_ratio_height, crop_type="contain", background_color=(0, 0, 0)):
+    convert_video_to_aspect_ratios(
+        input_path, [(output_path, aspect_ratio_width, aspect_ratio_height)], crop_type, background_color)
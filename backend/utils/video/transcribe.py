@@ -1,7 +1,9 @@
+import asyncio
 import requests
 from dotenv import load_dotenv
+from lib.providers import get_mistral_client
+from lib.rate_limiter import get_rate_limiter
 import os
-import openai
 
 # Load environment variables
 load_dotenv()
@@ -15,8 +17,14 @@ async def extract_transcript_from_deepgram(video_file_path, content_type):
         'Authorization': f'Token {api_key}',
         'Content-Type': content_type
     }
-    with open(video_file_path, 'rb') as file:
-        response = requests.post(url, headers=headers, data=file)
+    await get_rate_limiter("deepgram").acquire_async()
+
+    def post():
+        with open(video_file_path, 'rb') as file:
+            return requests.post(url, headers=headers, data=file)
+
+    # The upload and transcription take a while; keep them off the event loop
+    response = await asyncio.to_thread(post)
     response.raise_for_status()
     data = response.json()
     transcript = data['results']['channels'][0]['alternatives'][0]['transcript']
@@ -24,11 +32,7 @@ async def extract_transcript_from_deepgram(video_file_path, content_type):
 
 
 def is_transcript_usable(transcript: str) -> bool:
-    api_token = os.getenv("MISTRAL_API_KEY")
-    client = openai.OpenAI(
-        base_url="https://api.mistral.ai/v1",
-        api_key=api_token
-    )
+    client = get_mistral_client()
 
     prompt = f"""
     Does the following video segment have speech? Are people talking in it, in a way that needs to be explicitly transcribed?
@@ -62,11 +66,7 @@ def is_transcript_usable(transcript: str) -> bool:
 
 
 def tidy_transcript(description: str, raw_transcript: str, duration: float) -> str:
-    api_token = os.getenv("MISTRAL_API_KEY")
-    client = openai.OpenAI(
-        base_url="https://api.mistral.ai/v1",
-        api_key=api_token
-    )
+    client = get_mistral_client()
 
     prompt = f"""
     Please name speakers in the raw_transcript if their names are anywhere in the context. DO NOT ADD ANY CONTENT.
@@ -1,12 +1,12 @@
 from lib.logger import setup_logger
 import asyncio
-import cv2
-import openai
 from dotenv import load_dotenv
+from lib.providers import get_mistral_client
 from moviepy.editor import VideoFileClip, ColorClip, CompositeVideoClip
 import tempfile
 import os
 from utils.image.image_helpers import describe_image
+from utils.media_probe import probe_media
 
 load_dotenv()
 
@@ -14,18 +14,8 @@ logger = setup_logger(__name__)
 
 
 def get_video_size(video_path):
-    # Open the video file
-    video = cv2.VideoCapture(video_path)
-
-    # Get the video's width and height
-    width = video.get(cv2.CAP_PROP_FRAME_WIDTH)
-    height = video.get(cv2.CAP_PROP_FRAME_HEIGHT)
-
-    # Close the video file
-    video.release()
-
-    # Return the width and height
-    return int(width), int(height)
+    # Frame size as played back, from the memoized ffprobe metadata
+    return probe_media(video_path).video.display_size
 
 
 async def extract_and_describe_frames(video_path, interval=4):
@@ -41,31 +31,35 @@ async def extract_and_describe_frames(video_path, interval=4):
     # Initialize a list to store the descriptions
     descriptions = []
 
-    # Create a temporary directory to store the extracted frames
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Iterate over the frames at the desired interval
-        for t in range(0, int(duration), interval):
-            # Extract the frame at the current time
-            frame = video.get_frame(t)
-
-            # Save the frame as a temporary image file
-            frame_path = os.path.join(temp_dir, f"frame_{t}.jpg")
-            video.save_frame(frame_path, t=t)
-
-# Create a task for describing the frame
-            description_task = describe_image(frame_path)
-            description_tasks.append(description_task)
-
-            # If the number of tasks reaches 2 or it's the last frame, await the tasks
-            if len(description_tasks) == 2 or t + interval >= duration:
-                batch_descriptions = await asyncio.gather(*description_tasks)
-                # Extend the descriptions list
-                descriptions.extend(batch_descriptions)
-                description_tasks = []  # Reset the task list
-
-            # Describe the frame using the describe_image function
-            description = await describe_image(frame_path)
-            descriptions.append(description)
+    try:
+        # Create a temporary directory to store the extracted frames
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Iterate over the frames at the desired interval
+            for t in range(0, int(duration), interval):
+                # Extract the frame at the current time
+                frame = video.get_frame(t)
+
+                # Save the frame as a temporary image file
+                frame_path = os.path.join(temp_dir, f"frame_{t}.jpg")
+                video.save_frame(frame_path, t=t)
+
+    # Create a task for describing the frame
+                description_task = describe_image(frame_path)
+                description_tasks.append(description_task)
+
+                # If the number of tasks reaches 2 or it's the last frame, await the tasks
+                if len(description_tasks) == 2 or t + interval >= duration:
+                    batch_descriptions = await asyncio.gather(*description_tasks)
+                    # Extend the descriptions list
+                    descriptions.extend(batch_descriptions)
+                    description_tasks = []  # Reset the task list
+
+                # Describe the frame using the describe_image function
+                description = await describe_image(frame_path)
+                descriptions.append(description)
+    finally:
+        # Stops the ffmpeg reader the clip started
+        video.close()
 
     # Combine the descriptions into a single string
     combined_description = ".\n".join(descriptions) + "."
@@ -74,11 +68,7 @@ async def extract_and_describe_frames(video_path, interval=4):
 
 
 def summarize_description(long_description: str, transcript: str, duration: float) -> str:
-    api_token = os.getenv("MISTRAL_API_KEY")
-    client = openai.OpenAI(
-        base_url="https://api.mistral.ai/v1",
-        api_key=api_token
-    )
+    client = get_mistral_client()
 
     prompt = f"""
     Please summarize this long description of a {duration} secs video into something succint. 